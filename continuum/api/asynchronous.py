@@ -0,0 +1,120 @@
+from collections.abc import Callable
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import exceptions
+from rest_framework.response import Response
+
+
+class AsyncReadMixin:
+    """Serve a viewset's `list` and `retrieve` from async views when ASYNC_VIEWS_ENABLED is set, for ASGI servers.
+
+    Authentication, the cache and the database are awaited rather than blocking, so one worker can have many reads in
+    flight at once. Other methods on the same routes are passed to the viewset's usual view, run in a thread. Mixins
+    that change `list` or `retrieve` must have `alist` or `aretrieve` versions too, and come before this mixin. Building
+    the queryset may check guardian for shared objects, so `get_queryset` runs in a thread.
+
+    """
+
+    async_actions = ("list", "retrieve")
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs) -> Callable:
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_VIEWS_ENABLED or actions.get("get") not in cls.async_actions:
+            return view
+
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await sync_view(request, *args, **kwargs)
+
+            # As DRF's view does, up to dispatching.
+            self = cls(**initkwargs)
+            self.action_map = {**actions, "head": actions["get"]}
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        # Keep the attributes DRF sets on its view, such as `cls` and `csrf_exempt`.
+        return update_wrapper(async_view, view)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """`dispatch` for async views, calling the action's async handler, e.g. `alist`."""
+
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.aperform_authentication(request)
+            # Authentication is done, so the rest of the checks don't block.
+            self.initial(request, *args, **kwargs)
+            response = await getattr(self, f"a{self.action}")(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aperform_authentication(self, request):
+        """Authenticate the request as DRF does, awaiting the authenticators that have an `aauthenticate`."""
+
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
+
+    async def aget_queryset(self):
+        return await sync_to_async(self.get_queryset)()
+
+    async def aget_object(self):
+        """`get_object` for async views."""
+
+        queryset = self.filter_queryset(await self.aget_queryset())
+        lookup = {self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            obj = await queryset.aget(**lookup)
+        except queryset.model.DoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def alist(self, request, *args, **kwargs):
+        """`list` for async views."""
+
+        queryset = self.filter_queryset(await self.aget_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([obj async for obj in queryset], many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """`retrieve` for async views."""
+
+        return Response(self.get_serializer(await self.aget_object()).data)
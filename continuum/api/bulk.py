@@ -0,0 +1,105 @@
+from continuum.cache import bump_user_generation
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from thought.signals import deferred_bookkeeping
+
+
+class BulkMixin:
+    """Create, update or delete many objects in one request, at `bulk/`.
+
+    POST a list of objects to create them, PATCH a list of objects with their ids to update them, or DELETE a list of
+    ids. The whole batch is written in one transaction, with a query or two per operation rather than per object, and
+    either every object is written or none are. New objects are owned by the user. Views can extend
+    `perform_bulk_create` and `perform_bulk_update`, which are given the validated objects and return those written.
+
+    """
+
+    bulk_serializer_class = None
+    bulk_max_size = 500
+
+    @action(detail=False, methods=["post", "patch", "delete"])
+    def bulk(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            raise ValidationError({"non_field_errors": ["Expected a non-empty list."]})
+        if len(request.data) > self.bulk_max_size:
+            raise ValidationError({"non_field_errors": [f"At most {self.bulk_max_size} objects can be sent at once."]})
+
+        if request.method == "DELETE":
+            ids = serializers.ListField(child=serializers.UUIDField()).run_validation(request.data)
+            self.validate_bulk_ids(ids)
+            with transaction.atomic(), deferred_bookkeeping():
+                instances = self.perform_bulk_destroy(ids)
+            self.bump_bulk_generations(instances)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        partial = request.method == "PATCH"
+        context = self.get_serializer_context()
+        serializer = self.bulk_serializer_class(data=request.data, many=True, partial=partial, context=context)
+        serializer.is_valid(raise_exception=True)
+        if partial:
+            self.validate_bulk_ids([item.get("id") for item in serializer.validated_data])
+
+        with transaction.atomic(), deferred_bookkeeping():
+            if partial:
+                instances = self.perform_bulk_update(serializer.validated_data)
+            else:
+                instances = self.perform_bulk_create(serializer.validated_data)
+        self.bump_bulk_generations(instances)
+
+        queryset = self.get_queryset().filter(pk__in=[instance.pk for instance in instances])
+        data = self.get_serializer(queryset, many=True).data
+        return Response(data, status=status.HTTP_200_OK if partial else status.HTTP_201_CREATED)
+
+    def validate_bulk_ids(self, ids):
+        if None in ids or len(set(ids)) != len(ids):
+            raise ValidationError({"id": ["Every object needs a unique id."]})
+        return ids
+
+    def get_bulk_instances(self, ids, perm):
+        """Return the objects with `ids` that the user has `perm` on, all of them or NotFound."""
+
+        model = self.queryset.model
+        perm = f"{perm}_{model._meta.model_name}"
+        instances = list(model.objects.visible_to(self.request.user, perm).filter(pk__in=ids))
+        if len(instances) != len(set(ids)):
+            raise NotFound()
+        return instances
+
+    def perform_bulk_create(self, items):
+        model = self.queryset.model
+        instances = []
+        for item in items:
+            item.pop("id", None)  # Ids are assigned here, as when creating a single object.
+            instances.append(model(owner=self.request.user, **item))
+        return model.objects.bulk_create(instances)
+
+    def perform_bulk_update(self, items):
+        instances = self.get_bulk_instances([item["id"] for item in items], "change")
+        instances = {instance.pk: instance for instance in instances}
+        fields = {"updated_at"}
+        now = timezone.now()
+        for item in items:
+            instance = instances[item["id"]]
+            for field, value in item.items():
+                if field != "id":
+                    setattr(instance, field, value)
+                    fields.add(field)
+            instance.updated_at = now
+
+        self.queryset.model.objects.bulk_update(instances.values(), fields)
+        return list(instances.values())
+
+    def perform_bulk_destroy(self, ids):
+        instances = self.get_bulk_instances(ids, "delete")
+        self.queryset.model.objects.filter(pk__in=[instance.pk for instance in instances]).delete()
+        return instances
+
+    def bump_bulk_generations(self, instances):
+        """Invalidate the cached lists of the user making the changes and of the owners of `instances`."""
+
+        for user_id in {self.request.user.pk} | {instance.owner_id for instance in instances}:
+            bump_user_generation(user_id)
@@ -0,0 +1,206 @@
+import time
+from datetime import datetime
+from hashlib import sha256
+from urllib.parse import urlencode
+
+from continuum.cache import (
+    aget_user_generation,
+    arecord_cache_lookup,
+    bump_user_generation,
+    get_user_generation,
+    record_cache_lookup,
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+class CachedListMixin:
+    """Serve `list` responses from the cache, per user and per query string, when API_CACHE_ENABLED is set.
+
+    Keys include the user's generation counter, which is bumped whenever one of their thoughts or tags is written, so
+    stale entries are never read again and simply expire. Views that override `perform_create` must call
+    `bump_generations` themselves. Objects shared with a user through guardian only bump
+    their owner's generation, so a sharee may see them stale for up to CACHE_TTL.
+
+    """
+
+    cache_name = None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.API_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+        record_cache_lookup(self.cache_name, data is not None)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=settings.CACHE_TTL)
+        response["X-Cache"] = "MISS"
+        return response
+
+    async def alist(self, request, *args, **kwargs):
+        """`list` for async views."""
+
+        if not settings.API_CACHE_ENABLED:
+            return await super().alist(request, *args, **kwargs)
+
+        key = await self.aget_list_cache_key(request)
+        data = await cache.aget(key)
+        await arecord_cache_lookup(self.cache_name, data is not None)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        response = await super().alist(request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(key, response.data, timeout=settings.CACHE_TTL)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def get_list_cache_key(self, request):
+        return self.list_cache_key(request, get_user_generation(request.user.pk))
+
+    async def aget_list_cache_key(self, request):
+        return self.list_cache_key(request, await aget_user_generation(request.user.pk))
+
+    def list_cache_key(self, request, generation):
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        url = f"{request.build_absolute_uri(request.path)}?{params}"
+        return f"api:{self.cache_name}:{request.user.pk}:{generation}:{sha256(url.encode()).hexdigest()}"
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.bump_generations(serializer.instance)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.bump_generations(instance)
+
+    def bump_generations(self, instance):
+        """Invalidate the cached lists of the user making the change and of the owner of `instance`."""
+
+        bump_user_generation(self.request.user.pk)
+        if instance.owner_id is not None and instance.owner_id != self.request.user.pk:
+            bump_user_generation(instance.owner_id)
+
+
+class ConditionalMixin:
+    """Answer conditional requests without running the view, using validators that cost at most one indexed lookup.
+
+    Lists are validated by the user's generation counter, the same as the list cache, so `If-None-Match` gets a 304
+    until the user's data changes. When sharing is enabled the ETag also changes every CACHE_TTL, as edits by other
+    users don't bump the sharee's generation. Objects are validated by their `updated_at`, the aggregates over their
+    relations in `related_validators` and the query string, so each representation, like `?expand=tags`, has its own
+    ETag. `If-Match` is checked against it on updates and deletes, with a 412 if the object changed since the client
+    read it.
+
+    """
+
+    # Aggregates over an object's relations that its representation also depends on, such as its tags.
+    related_validators = {}
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(self.get_list_cache_key(request))
+        response = get_conditional_response(request, etag=etag) or super().list(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+        return response
+
+    async def alist(self, request, *args, **kwargs):
+        """`list` for async views."""
+
+        etag = self.get_list_etag(await self.aget_list_cache_key(request))
+        response = get_conditional_response(request, etag=etag) or await super().alist(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+        return response
+
+    def get_list_etag(self, key):
+        if settings.THOUGHT_SHARING_ENABLED:
+            key += f":{int(time.time() // settings.CACHE_TTL)}"
+        return quote_etag(sha256(key.encode()).hexdigest()[:32])
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, kwargs, super().retrieve, *args)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """`retrieve` for async views."""
+
+        queryset = (await self.aget_queryset()).filter(pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+        validators = await self.get_validators_queryset(queryset).afirst()
+        if validators is None:
+            return await super().aretrieve(request, *args, **kwargs)
+
+        response = self.get_conditional_response(request, kwargs, validators)
+        if response is None:
+            response = await super().aretrieve(request, *args, **kwargs)
+        self.set_object_validators(request, response, kwargs, validators)
+        return response
+
+    def update(self, request, *args, **kwargs):
+        # Lock the object, so that it can't change between checking If-Match and the update.
+        with transaction.atomic():
+            return self.conditional(request, kwargs, super().update, *args, lock=True)
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return self.conditional(request, kwargs, super().destroy, *args, lock=True)
+
+    def conditional(self, request, kwargs, view, *args, lock=False):
+        """Return a 304 or 412 if the request's preconditions on the object say so, otherwise call `view`."""
+
+        queryset = self.get_queryset().filter(pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if lock:
+            # Locked by a query of its own, as Postgres can't lock the rows of one that aggregates.
+            locked = self.queryset.model.objects.select_for_update().filter(pk__in=queryset.values("pk"))
+            list(locked.values_list("pk", flat=True))
+        validators = self.get_validators_queryset(queryset).first()
+        if validators is None:
+            return view(request, *args, **kwargs)
+
+        response = self.get_conditional_response(request, kwargs, validators)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if request.method != "GET":
+                # Send the validators of the updated object, so the client can update it again.
+                validators = self.get_validators_queryset(queryset).first()
+                if validators is None:
+                    return response
+
+        self.set_object_validators(request, response, kwargs, validators)
+        return response
+
+    def get_validators_queryset(self, queryset):
+        """The object's `updated_at` and related validators, as a dict, in one query."""
+
+        return queryset.annotate(**self.related_validators).values("updated_at", *self.related_validators)
+
+    def get_conditional_response(self, request, kwargs, validators):
+        return get_conditional_response(
+            request,
+            etag=self.get_object_etag(request, kwargs, validators),
+            last_modified=int(self.get_last_modified(validators).timestamp()),
+        )
+
+    def set_object_validators(self, request, response, kwargs, validators):
+        if response.status_code in (200, 304):
+            response["ETag"] = self.get_object_etag(request, kwargs, validators)
+            response["Last-Modified"] = http_date(self.get_last_modified(validators).timestamp())
+
+    def get_object_etag(self, request, kwargs, validators):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        values = ":".join(str(validators[name]) for name in sorted(validators))
+        return quote_etag(sha256(f"{pk}?{params}:{values}".encode()).hexdigest()[:32])
+
+    def get_last_modified(self, validators):
+        """The latest of the object's and its relations' modification dates."""
+
+        return max(value for value in validators.values() if isinstance(value, datetime))
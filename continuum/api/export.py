@@ -0,0 +1,112 @@
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+EXPORT_FIELDS = ["id", "created_at", "updated_at", "content", "mood", "actions", "tags"]
+
+# Bytes gathered before a chunk is sent, so the response isn't written a line at a time.
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def export_rows(thoughts, chunk_size):
+    """Yield a dict for each thought, reading them from a server-side cursor `chunk_size` at a time.
+
+    `thoughts` should prefetch its tags, which `iterator` then does once per chunk.
+
+    Yields:
+        dict: The exported fields of a thought.
+
+    """
+
+    for thought in thoughts.iterator(chunk_size=chunk_size):
+        yield {
+            "id": thought.id,
+            "created_at": thought.created_at,
+            "updated_at": thought.updated_at,
+            "content": thought.content,
+            "mood": thought.mood,
+            "actions": [action for action in thought.actions.split(";") if action],
+            "tags": [tag.name for tag in thought.tags.all()],
+        }
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+class Echo:
+    """A file-like object that returns what is written to it, so that csv.writer can format one row at a time."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row["actions"] = ";".join(row["actions"])
+        row["tags"] = ";".join(row["tags"])
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def buffered(lines):
+    """Encode the lines and gather them into chunks of at least EXPORT_BUFFER_SIZE bytes.
+
+    Yields:
+        bytes: A chunk of encoded lines.
+
+    """
+
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzipped(chunks):
+    """Compress the chunks on the fly into a single gzip stream.
+
+    Yields:
+        bytes: The next part of the gzip stream.
+
+    """
+
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+async def aiterate(chunks):
+    """Serve the chunks asynchronously, pulling each from the iterator in a thread as it's needed.
+
+    Under ASGI, Django reads a synchronous iterator into a list before sending any of it. The chunks are pulled in the
+    request's thread, which the export's server-side cursor belongs to.
+
+    Yields:
+        bytes: The next chunk.
+
+    """
+
+    chunks = iter(chunks)
+    try:
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Closes the cursor when the client goes away before the end.
+        await sync_to_async(chunks.close)()
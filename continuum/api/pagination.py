@@ -0,0 +1,132 @@
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from uuid import UUID
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """Page number pagination that async views can await, counting and fetching the page with the async ORM."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """`paginate_queryset` for async views."""
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Counted here, as the paginator would count synchronously when it first needs the number of pages.
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [obj async for obj in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            # The browsable API should display pagination controls.
+            self.display_page_controls = True
+
+        return list(self.page)
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over the `(created_at, id)` keyset, newest first.
+
+    Each page is a single index range scan starting just after the last row of the previous page, so deep pages
+    cost the same as the first one. The total count is only computed when asked for with `?count=true`.
+
+    """
+
+    page_size = 10
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    ordering = ("-created_at", "-id")
+    invalid_cursor_message = "Invalid cursor."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count = queryset.count() if self.wants_count(request) else None
+        return self.set_page(request, count, list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """`paginate_queryset` for async views."""
+
+        count = await queryset.acount() if self.wants_count(request) else None
+        return self.set_page(request, count, [obj async for obj in self.get_page_queryset(queryset, request)])
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, "").lower() in ("1", "true")
+
+    def get_page_queryset(self, queryset, request):
+        """The rows after the request's cursor, one more than a page to tell whether there's a next page."""
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            # The leading `created_at <= x` gives the planner a range bound on the index, the OR then breaks ties.
+            queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+        return queryset.order_by(*self.ordering)[: self.page_size + 1]
+
+    def set_page(self, request, count, results):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.count = count
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([("next", self.get_next_link())])
+        if self.count is not None:
+            response["count"] = self.count
+        response["results"] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "count": {"type": "integer"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        last = self.page[-1]
+        url = remove_query_param(self.base_url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last.created_at, last.id))
+
+    def encode_cursor(self, created_at, pk):
+        return b64encode(f"{created_at.isoformat()}|{pk}".encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            created_at, pk = b64decode(encoded.encode("ascii"), validate=True).decode("ascii").split("|")
+            created_at = parse_date(created_at)
+            pk = UUID(pk)
+        except (BinasciiError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return created_at, pk
@@ -1,18 +1,94 @@
 import logging
 
+from continuum.metrics import TimedSerializerMixin
+from django.utils.html import escape
 from rest_framework import serializers
-from thought.models import Tag, Thought
+from thought.models import HEADLINE_START, HEADLINE_STOP, Tag, Thought
 
 logger = logging.getLogger(__name__)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = "__all__"
+        read_only_fields = ["owner"]
 
 
-class ThoughtSerializer(serializers.ModelSerializer):
+class BulkTagSerializer(TagSerializer):
+    """A tag in a bulk request, with its id when it's being updated."""
+
+    id = serializers.UUIDField(required=False)
+
+
+class CompactTagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Just enough of a tag to render it alongside a thought."""
+
+    class Meta:
+        model = Tag
+        fields = ["id", "name", "colour"]
+
+
+class HeadlineField(serializers.CharField):
+    """A search headline as HTML, the thought's content escaped with its matches in `<mark>` tags."""
+
+    def to_representation(self, value):
+        return escape(value).replace(HEADLINE_START, "<mark>").replace(HEADLINE_STOP, "</mark>")
+
+
+class VisibleTagField(serializers.PrimaryKeyRelatedField):
+    """A tag id, which must be one of the tags the user can see, as bulk requests check."""
+
+    def get_queryset(self):
+        return Tag.objects.visible_to(self.context["request"].user, "view_tag")
+
+
+class ThoughtSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Declared explicitly, as DRF makes relations with a through model read only.
+    tags = VisibleTagField(many=True, required=False)
+
+    # Only present on search results.
+    rank = serializers.FloatField(read_only=True)
+    headline = HeadlineField(read_only=True)
+
     class Meta:
         model = Thought
-        fields = "__all__"
+        exclude = ["search_vector", "analysis_hash"]
+        read_only_fields = ["owner", "actions"]
+
+    def to_representation(self, instance):
+        """Embed compact tags instead of their ids when the request asked for `?expand=tags`."""
+
+        data = super().to_representation(instance)
+        if "tags" in self.context.get("expand", ()):
+            data["tags"] = CompactTagSerializer(instance.tags.all(), many=True).data
+        return data
+
+
+class BulkThoughtListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        """Check the tags of every thought in the batch with one query."""
+
+        tag_ids = {tag_id for item in attrs for tag_id in item.get("tags", ())}
+        if tag_ids:
+            user = self.context["request"].user
+            known = set(Tag.objects.visible_to(user, "view_tag").filter(id__in=tag_ids).values_list("id", flat=True))
+            if unknown := tag_ids - known:
+                raise serializers.ValidationError({"tags": [f"Unknown tags {', '.join(map(str, sorted(unknown)))}."]})
+        return attrs
+
+
+class BulkThoughtSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """A thought in a bulk request, with its id when it's being updated.
+
+    Tags are plain ids, checked for the whole batch at once by the list serializer rather than one query per tag.
+
+    """
+
+    id = serializers.UUIDField(required=False)
+    tags = serializers.ListField(child=serializers.UUIDField(), required=False)
+
+    class Meta:
+        model = Thought
+        fields = ["id", "content", "mood", "tags"]
+        list_serializer_class = BulkThoughtListSerializer
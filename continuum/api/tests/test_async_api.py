@@ -0,0 +1,173 @@
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient
+from django.urls import resolve, reverse
+from guardian.shortcuts import assign_perm
+from rest_framework import status
+from rest_framework.test import APIClient
+from conftest import reload_urls
+from thought.tests.factories import TagFactory, ThoughtFactory
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    return user_model.objects.create_user(username="user", password="password")
+
+
+@pytest.fixture
+def authenticated_client(user):
+    api_client = APIClient()
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture
+def urls(user):
+    """Reads covering the list filters, both paginations, expansion, sharing and missing objects."""
+
+    other = get_user_model().objects.create_user(username="other", password="password")
+    tags = TagFactory.create_batch(3, owner=user)
+    thoughts = ThoughtFactory.create_batch(15, owner=user, content="A walk in the park")
+    for thought in thoughts:
+        thought.tags.set(tags[:2])
+    shared = ThoughtFactory(owner=other)
+    assign_perm("view_thought", user, shared)
+
+    thought = reverse("thought-detail", args=[thoughts[0].id])
+    missing = reverse("thought-detail", args=["00000000-0000-0000-0000-000000000000"])
+    return [
+        reverse("thought-list"),
+        reverse("thought-list") + "?page=2",
+        reverse("thought-list") + "?page=9",
+        reverse("thought-list") + "?pagination=cursor&count=true",
+        reverse("thought-list") + f"?tags={tags[0].id}&start_date=2000-01-01&q=park&expand=tags",
+        thought,
+        thought + "?expand=tags",
+        reverse("thought-detail", args=[shared.id]),
+        missing,
+        reverse("tag-list"),
+        reverse("tag-detail", args=[tags[0].id]),
+    ]
+
+
+def read(client, urls):
+    return [(response.status_code, response.json(), response.get("ETag")) for response in map(client.get, urls)]
+
+
+@pytest.mark.django_db
+def test_async_reads_match_sync(settings, authenticated_client, urls):
+    """The async views answer reads exactly as the synchronous ones do."""
+
+    # Given - The responses of the synchronous views
+    expected = read(authenticated_client, urls)
+
+    # When - The same reads are made with the async views
+    settings.ASYNC_VIEWS_ENABLED = True
+    reload_urls()
+    try:
+        actual = read(authenticated_client, urls)
+        unauthenticated = APIClient().get(reverse("thought-list"))
+    finally:
+        settings.ASYNC_VIEWS_ENABLED = False
+        reload_urls()
+
+    # Then - The responses are the same
+    for url, expected_response, actual_response in zip(urls, expected, actual):
+        assert actual_response == expected_response, url
+
+    # And - Requests without credentials are refused as before
+    assert unauthenticated.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_async_views")
+def test_only_reads_are_async(authenticated_client, user):
+    """List and detail routes are async views, which pass writes on to the viewset."""
+
+    # Given - The thought routes
+    thought = ThoughtFactory(owner=user)
+
+    # Then - The list, detail and tag routes are async, and the other actions aren't
+    assert iscoroutinefunction(resolve(reverse("thought-list")).func)
+    assert iscoroutinefunction(resolve(reverse("thought-detail", args=[thought.id])).func)
+    assert iscoroutinefunction(resolve(reverse("tag-list")).func)
+    assert not iscoroutinefunction(resolve(reverse("thought-export")).func)
+
+    # When - A thought is created, updated and deleted through the async routes
+    response = authenticated_client.post(reverse("thought-list"), {"content": "New"}, format="json")
+    assert response.status_code == status.HTTP_201_CREATED
+    url = reverse("thought-detail", args=[response.json()["id"]])
+    response = authenticated_client.patch(url, {"content": "Edited"}, format="json")
+    assert response.status_code == status.HTTP_200_OK
+    response = authenticated_client.delete(url)
+
+    # Then - The writes succeed
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_async_views")
+@pytest.mark.parametrize("name", ["thought", "tag"])
+def test_async_not_modified(authenticated_client, user, name, django_assert_max_num_queries):
+    """Conditional reads get a 304 from the async views too."""
+
+    # Given - A listed thought and tag, and one of them read by itself
+    objects = {"thought": ThoughtFactory(owner=user), "tag": TagFactory(owner=user)}
+    list_url = reverse(f"{name}-list")
+    detail_url = reverse(f"{name}-detail", args=[objects[name].id])
+    list_etag = authenticated_client.get(list_url)["ETag"]
+    detail_etag = authenticated_client.get(detail_url)["ETag"]
+
+    # When - They're read again with their ETags
+    with django_assert_max_num_queries(0):
+        list_response = authenticated_client.get(list_url, HTTP_IF_NONE_MATCH=list_etag)
+    detail_response = authenticated_client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+
+    # Then - Neither is modified
+    assert list_response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert detail_response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_async_views")
+def test_async_list_cache(settings, authenticated_client, user):
+    """The async list is served from the cache when it's enabled."""
+
+    # Given - The list cache, and a listed thought
+    settings.API_CACHE_ENABLED = True
+    ThoughtFactory(owner=user)
+    first = authenticated_client.get(reverse("thought-list"))
+
+    # When - The list is fetched again
+    second = authenticated_client.get(reverse("thought-list"))
+
+    # Then - It's a hit, with the same data
+    assert (first["X-Cache"], second["X-Cache"]) == ("MISS", "HIT")
+    assert second.json() == first.json()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("_async_views")
+def test_async_under_asgi(settings, mocker, user):
+    """Reads work through the ASGI handler, with the middleware running asynchronously."""
+
+    # Given - Metrics enabled, and a token for the user
+    settings.METRICS_ENABLED = True
+    mocker.patch(
+        "user.auth.JWTAuthentication.get_validated_token", return_value=mocker.Mock(payload={"sub": str(user.sub)})
+    )
+    ThoughtFactory.create_batch(2, owner=user)
+
+    # When - The thoughts are listed through the ASGI handler
+    async def get():
+        return await AsyncClient().get(reverse("thought-list"), headers={"Authorization": "Bearer token"})
+
+    response = async_to_sync(get)()
+
+    # Then - They're listed, with the queries counted
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["count"] == 2
+    assert "queries" in response["Server-Timing"]
+    assert 'desc="0 queries"' not in response["Server-Timing"]
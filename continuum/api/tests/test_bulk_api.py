@@ -0,0 +1,167 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from thought.models import DailyMood, Tag, Thought
+from thought.tests.factories import TagFactory, ThoughtFactory
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    user = user_model.objects.create_user(username="user", password="password")
+    user.save()
+    return user
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.mark.django_db
+def test_bulk_create_thoughts(authenticated_client, user, mocker, django_assert_max_num_queries):
+    """A batch of thoughts is created with their tags in a constant number of queries, and analysed in one task."""
+
+    # Given - Two tags, and 200 thoughts carrying them
+    tags = TagFactory.create_batch(2, owner=user)
+    data = [{"content": f"Thought {i}", "mood": 3, "tags": [str(tag.id) for tag in tags]} for i in range(200)]
+    analyse_thoughts = mocker.patch("api.views.analyse_thoughts")
+
+    # When - They are created in bulk
+    with django_assert_max_num_queries(20):
+        response = authenticated_client.post(reverse("thought-bulk"), data, format="json")
+
+    # Then - Every thought is created, owned by the user and tagged
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.data) == 200
+    assert Thought.objects.filter(owner=user, tags=tags[0]).count() == 200
+    assert DailyMood.objects.get(owner=user).count == 200
+
+    # And - Analysis is left until the transaction commits
+    analyse_thoughts.delay.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_bulk_create_thoughts_is_atomic(authenticated_client, user):
+    """A batch with an invalid thought, or a tag the user can't see, creates nothing."""
+
+    # Given - Another user's tag
+    tag = TagFactory()
+
+    # When - Thoughts are created in bulk, one of them invalid, or one with the other user's tag
+    invalid = [{"content": "Fine"}, {"content": "Invalid", "mood": 9}]
+    response = authenticated_client.post(reverse("thought-bulk"), invalid, format="json")
+    tagged = [{"content": "Fine"}, {"content": "Tagged", "tags": [str(tag.id)]}]
+    tagged_response = authenticated_client.post(reverse("thought-bulk"), tagged, format="json")
+
+    # Then - Both batches are rejected
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert tagged_response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not Thought.objects.exists()
+
+
+@pytest.mark.django_db
+def test_bulk_update_thoughts(authenticated_client, user, django_capture_on_commit_callbacks, mocker):
+    """A batch of thoughts is updated together, and those with new content are analysed in one task."""
+
+    # Given - Two thoughts, one tagged
+    tags = TagFactory.create_batch(2, owner=user)
+    first, second = ThoughtFactory(owner=user, content="First"), ThoughtFactory(owner=user, content="Second")
+    first.tags.add(tags[0])
+    analyse_thoughts = mocker.patch("api.views.analyse_thoughts")
+
+    # When - One's content is changed and the other's mood and tags
+    data = [{"id": str(first.id), "mood": 5, "tags": [str(tags[1].id)]}, {"id": str(second.id), "content": "Edited"}]
+    with django_capture_on_commit_callbacks(execute=True):
+        response = authenticated_client.patch(reverse("thought-bulk"), data, format="json")
+
+    # Then - Both are updated
+    assert response.status_code == status.HTTP_200_OK
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert (first.content, first.mood, list(first.tags.all())) == ("First", 5, [tags[1]])
+    assert second.content == "Edited"
+
+    # And - Only the edited thought is analysed
+    analyse_thoughts.delay.assert_called_once_with([str(second.id)])
+
+
+@pytest.mark.django_db
+def test_bulk_update_others_thoughts(authenticated_client, user):
+    """A batch including a thought the user can't change updates nothing."""
+
+    # Given - The user's thought and another user's
+    mine, theirs = ThoughtFactory(owner=user, content="Mine"), ThoughtFactory(content="Theirs")
+
+    # When - Both are updated in bulk
+    data = [{"id": str(mine.id), "content": "Edited"}, {"id": str(theirs.id), "content": "Edited"}]
+    response = authenticated_client.patch(reverse("thought-bulk"), data, format="json")
+
+    # Then - Neither is updated
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert set(Thought.objects.values_list("content", flat=True)) == {"Mine", "Theirs"}
+
+
+@pytest.mark.django_db
+def test_bulk_delete_thoughts(authenticated_client, user):
+    """A batch of thoughts is deleted together, and the rollup of their day with them."""
+
+    # Given - Three thoughts
+    thoughts = ThoughtFactory.create_batch(3, owner=user, mood=3)
+
+    # When - Two are deleted in bulk
+    data = [str(thought.id) for thought in thoughts[:2]]
+    response = authenticated_client.delete(reverse("thought-bulk"), data, format="json")
+
+    # Then - Only the third is left, and counted
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert list(Thought.objects.all()) == [thoughts[2]]
+    assert DailyMood.objects.get(owner=user).count == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("data", [[], {"content": "Not a list"}, ["not-a-uuid"], [{"content": "No id"}]])
+def test_bulk_invalid_requests(authenticated_client, user, data):
+    """Bulk requests must be lists, with ids for updates and deletes."""
+
+    # When - A malformed batch is sent
+    url = reverse("thought-bulk")
+    responses = [
+        authenticated_client.patch(url, data, format="json"),
+        authenticated_client.delete(url, data, format="json"),
+    ]
+
+    # Then - It is rejected
+    assert [response.status_code for response in responses] == [status.HTTP_400_BAD_REQUEST] * 2
+
+
+@pytest.mark.django_db
+def test_bulk_tags(authenticated_client, user):
+    """Tags can be created, updated and deleted in bulk."""
+
+    # When - Two tags are created in bulk
+    data = [
+        {"name": "Work", "description": "Job", "colour": "red"},
+        {"name": "Home", "description": "Life", "colour": "blue"},
+    ]
+    response = authenticated_client.post(reverse("tag-bulk"), data, format="json")
+
+    # Then - They are created and owned by the user
+    assert response.status_code == status.HTTP_201_CREATED
+    work, home = (Tag.objects.get(name=name, owner=user) for name in ("Work", "Home"))
+
+    # When - One is renamed and then the other deleted
+    response = authenticated_client.patch(reverse("tag-bulk"), [{"id": str(work.id), "name": "Job"}], format="json")
+    authenticated_client.delete(reverse("tag-bulk"), [str(home.id)], format="json")
+
+    # Then - Just the renamed tag is left
+    assert response.data[0]["name"] == "Job"
+    assert list(Tag.objects.values_list("name", flat=True)) == ["Job"]
@@ -0,0 +1,171 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from thought.tests.factories import TagFactory, ThoughtFactory
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    user = user_model.objects.create_user(username="user", password="password")
+    user.save()
+    return user
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("name", ["thought", "tag"])
+def test_list_not_modified(authenticated_client, user, name, django_assert_max_num_queries):
+    """Listing again with the ETag gets a 304, without any queries, until something changes."""
+
+    # Given - A listed thought and tag
+    ThoughtFactory(owner=user)
+    TagFactory(owner=user)
+    url = reverse(f"{name}-list")
+    etag = authenticated_client.get(url)["ETag"]
+
+    # When - The list is fetched again with its ETag
+    with django_assert_max_num_queries(0):
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then - It's not modified
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response["ETag"] == etag
+
+    # When - A thought is created, and the list fetched again
+    authenticated_client.post(reverse("thought-list"), {"content": "New"}, format="json")
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then - The list is sent again
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_list_etag_depends_on_query(authenticated_client, user):
+    """Lists with different query strings have different ETags."""
+
+    # When - The list is fetched with and without a filter
+    url = reverse("thought-list")
+    etags = {authenticated_client.get(url)["ETag"], authenticated_client.get(url, {"q": "milk"})["ETag"]}
+
+    # Then - The ETags differ
+    assert len(etags) == 2
+
+
+@pytest.mark.django_db
+def test_detail_not_modified(authenticated_client, user, django_assert_max_num_queries):
+    """Fetching a thought again with its ETag or modification date gets a 304, until it changes."""
+
+    # Given - A fetched thought
+    thought = ThoughtFactory(owner=user)
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+    response = authenticated_client.get(url)
+    etag, last_modified = response["ETag"], response["Last-Modified"]
+
+    # When - The thought is fetched again with its ETag, or its modification date
+    with django_assert_max_num_queries(1):
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    since_response = authenticated_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+    # Then - It's not modified
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert since_response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # When - The thought changes, and is fetched again
+    authenticated_client.patch(url, {"content": "Edited"}, format="json")
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then - It's sent again
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["content"] == "Edited"
+
+
+@pytest.mark.django_db
+def test_detail_etag_depends_on_tags(authenticated_client, user):
+    """A thought's ETag changes when its tags are renamed or deleted, and differs with its tags expanded."""
+
+    # Given - A thought with two tags, fetched with and without its tags expanded
+    thought = ThoughtFactory(owner=user)
+    renamed, deleted = TagFactory.create_batch(2, owner=user)
+    thought.tags.add(renamed, deleted)
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+    etag = authenticated_client.get(url)["ETag"]
+    expanded_etag = authenticated_client.get(url, {"expand": "tags"})["ETag"]
+
+    # When - One tag is renamed, and the thought fetched again with its tags expanded
+    renamed.name = "Renamed"
+    renamed.save()
+    response = authenticated_client.get(url, {"expand": "tags"}, HTTP_IF_NONE_MATCH=expanded_etag)
+
+    # Then - It's sent again, with the new name
+    assert expanded_etag != etag
+    assert response.status_code == status.HTTP_200_OK
+    assert "Renamed" in [tag["name"] for tag in response.data["tags"]]
+
+    # When - The other tag is deleted, and the thought fetched again
+    deleted.delete()
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then - It's sent again, without the deleted tag
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["tags"] == [renamed.id]
+
+
+@pytest.mark.django_db
+def test_if_match_prevents_lost_updates(authenticated_client, user):
+    """Updates and deletes with an If-Match that's out of date are refused."""
+
+    # Given - Two clients that fetched the same thought
+    thought = ThoughtFactory(owner=user, content="Original")
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+    etag = authenticated_client.get(url)["ETag"]
+
+    # When - The first client updates it
+    response = authenticated_client.patch(url, {"content": "First"}, format="json", HTTP_IF_MATCH=etag)
+
+    # Then - The update succeeds, and returns the new ETag
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+
+    # When - The second client updates or deletes it with the old ETag
+    update = authenticated_client.patch(url, {"content": "Second"}, format="json", HTTP_IF_MATCH=etag)
+    delete = authenticated_client.delete(url, HTTP_IF_MATCH=etag)
+
+    # Then - Both are refused and the first update is kept
+    assert update.status_code == status.HTTP_412_PRECONDITION_FAILED
+    assert delete.status_code == status.HTTP_412_PRECONDITION_FAILED
+    thought.refresh_from_db()
+    assert thought.content == "First"
+
+    # When - The second client deletes it with the new ETag
+    response = authenticated_client.delete(url, HTTP_IF_MATCH=response["ETag"])
+
+    # Then - It's deleted
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+@pytest.mark.django_db
+def test_conditional_other_users_thought(authenticated_client):
+    """Conditional requests for another user's thought are still not found."""
+
+    # Given - Another user's thought
+    url = reverse("thought-detail", kwargs={"pk": ThoughtFactory().id})
+
+    # When - It's fetched conditionally
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH='"anything"')
+
+    # Then - It's not found
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,145 @@
+import csv
+import gzip
+import json
+import pytest
+from api.export import export_rows
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient
+from django.urls import reverse
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APIClient
+from thought.tests.factories import TagFactory, ThoughtFactory
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    user = user_model.objects.create_user(username="user", password="password")
+    user.save()
+    return user
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture
+def thoughts(user):
+    """Two of the user's thoughts, the second tagged with actions, and another user's thought."""
+
+    first = ThoughtFactory(owner=user, content="First, with a comma", mood=3)
+    second = ThoughtFactory(owner=user, content="Second\nline", mood=4, actions="Buy milk;Call mum")
+    second.tags.add(*TagFactory.create_batch(2, owner=user))
+    ThoughtFactory(content="Someone else's")
+    return [first, second]
+
+
+def content(response):
+    return b"".join(response.streaming_content)
+
+
+@pytest.mark.django_db
+def test_export_ndjson(authenticated_client, thoughts, django_assert_max_num_queries):
+    """The user's thoughts are streamed as a JSON object per line."""
+
+    # When - The user exports their thoughts
+    with django_assert_max_num_queries(3):
+        response = authenticated_client.get(reverse("thought-export"))
+        lines = content(response).decode().splitlines()
+
+    # Then - Each of their thoughts is a line, with its tags
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert 'filename="thoughts.ndjson"' in response["Content-Disposition"]
+    rows = {row["content"]: row for row in map(json.loads, lines)}
+    assert {row["id"] for row in rows.values()} == {str(thought.id) for thought in thoughts}
+    assert rows["Second\nline"]["actions"] == ["Buy milk", "Call mum"]
+    assert sorted(rows["Second\nline"]["tags"]) == sorted(tag.name for tag in thoughts[1].tags.all())
+
+
+@pytest.mark.django_db
+def test_export_csv_gzip(authenticated_client, thoughts):
+    """The export can be CSV, and gzipped."""
+
+    # When - The user exports their thoughts as gzipped CSV
+    response = authenticated_client.get(reverse("thought-export"), {"type": "csv", "gzip": "true"})
+
+    # Then - It decompresses to a header and a row for each thought
+    assert response["Content-Type"] == "application/gzip"
+    assert 'filename="thoughts.csv.gz"' in response["Content-Disposition"]
+    rows = {row["content"]: row for row in csv.DictReader(StringIO(gzip.decompress(content(response)).decode()))}
+    assert set(rows) == {"First, with a comma", "Second\nline"}
+    assert rows["Second\nline"]["actions"] == "Buy milk;Call mum"
+
+
+@pytest.mark.django_db
+def test_export_chunks(authenticated_client, user, django_assert_max_num_queries):
+    """Large exports are read in chunks, with the tags of each chunk loaded in one query."""
+
+    # Given - More thoughts than fit in a chunk, each tagged
+    tag = TagFactory(owner=user)
+    for _ in range(5):
+        ThoughtFactory(owner=user).tags.add(tag)
+
+    # When - They are exported in chunks of two
+    url = reverse("thought-export")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr("api.views.ThoughtViewSet.export_chunk_size", 2)
+        with django_assert_max_num_queries(8):
+            lines = content(authenticated_client.get(url)).decode().splitlines()
+
+    # Then - Every thought is exported
+    assert len(lines) == 5
+
+
+@pytest.mark.django_db(transaction=True)
+def test_export_streams_under_asgi(user, mocker):
+    """Under ASGI the export is served by an async iterator, a chunk at a time, rather than read into a list first."""
+
+    # Given - Three thoughts, each sent in a chunk of its own, and a token for the user
+    ThoughtFactory.create_batch(3, owner=user)
+    mocker.patch("api.export.EXPORT_BUFFER_SIZE", 1)
+    mocker.patch("user.auth.JWTAuthentication.get_validated_token", return_value=mocker.Mock(payload={"sub": user.sub}))
+    read = []
+
+    def counted_rows(thoughts, chunk_size):
+        for row in export_rows(thoughts, chunk_size):
+            read.append(row["id"])
+            yield row
+
+    mocker.patch("api.views.export_rows", counted_rows)
+
+    # When - The export is requested through the ASGI handler, and its first chunk read
+    async def export():
+        response = await AsyncClient().get(reverse("thought-export"), headers={"Authorization": "Bearer token"})
+        chunks = aiter(response.streaming_content)
+        first = await anext(chunks)
+        read_before_rest = len(read)
+        return response, [first, *[chunk async for chunk in chunks]], read_before_rest
+
+    response, chunks, read_before_rest = async_to_sync(export)()
+
+    # Then - The first chunk was sent before the rest of the thoughts were read
+    assert response.is_async
+    assert read_before_rest < 3
+    assert len(b"".join(chunks).decode().splitlines()) == 3
+
+
+@pytest.mark.django_db
+def test_export_invalid_type(authenticated_client):
+    """Only NDJSON and CSV are supported."""
+
+    # When - The user asks for XML
+    response = authenticated_client.get(reverse("thought-export"), {"type": "xml"})
+
+    # Then - The request is rejected
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
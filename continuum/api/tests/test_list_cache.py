@@ -0,0 +1,130 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from thought.tests.factories import TagFactory, ThoughtFactory
+
+from continuum.cache import bump_user_generation, get_cache_stats
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    user = user_model.objects.create_user(username="user", password="password")
+    user.save()
+    return user
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture(autouse=True)
+def _api_cache_enabled(settings) -> None:
+    settings.API_CACHE_ENABLED = True
+
+
+@pytest.mark.django_db
+def test_thought_list_is_cached(authenticated_client, user, django_assert_num_queries):
+    """A repeated thought list request is served from the cache without touching the database."""
+
+    # Given - A thought and a first request for the list
+    ThoughtFactory(owner=user)
+    url = reverse("thought-list")
+    response = authenticated_client.get(url)
+    assert response["X-Cache"] == "MISS"
+
+    # When - The same list is requested again
+    with django_assert_num_queries(0):
+        cached = authenticated_client.get(url)
+
+    # Then - The cached response is identical
+    assert cached.status_code == status.HTTP_200_OK
+    assert cached["X-Cache"] == "HIT"
+    assert cached.json() == response.json()
+    assert get_cache_stats("thoughts") == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+@pytest.mark.django_db
+def test_thought_list_is_cached_per_query(authenticated_client, user):
+    """Different query parameters are cached separately, whatever order they're given in."""
+
+    # Given - A cached list filtered by date
+    ThoughtFactory(owner=user)
+    url = reverse("thought-list")
+    authenticated_client.get(url, {"start_date": "2021-01-01", "end_date": "2021-01-02"})
+
+    # When - The user requests the same filters in a different order, and then a different page
+    same = authenticated_client.get(f"{url}?end_date=2021-01-02&start_date=2021-01-01")
+    other = authenticated_client.get(url)
+
+    # Then - Only the first is a cache hit
+    assert same["X-Cache"] == "HIT"
+    assert other["X-Cache"] == "MISS"
+
+
+@pytest.mark.django_db
+def test_thought_list_cache_is_invalidated_by_writes(authenticated_client, user):
+    """Creating, updating or deleting a thought invalidates the user's cached lists."""
+
+    url = reverse("thought-list")
+
+    # Given - A cached, empty list
+    authenticated_client.get(url)
+
+    # When - The user creates a thought
+    response = authenticated_client.post(url, {"content": "A new thought"})
+    detail_url = reverse("thought-detail", kwargs={"pk": response.json()["id"]})
+
+    # Then - The list is fetched again and includes it
+    response = authenticated_client.get(url)
+    assert response["X-Cache"] == "MISS"
+    assert [result["content"] for result in response.json()["results"]] == ["A new thought"]
+
+    # When - The user updates it
+    authenticated_client.put(detail_url, {"content": "An updated thought"})
+
+    # Then - The list reflects the update
+    response = authenticated_client.get(url)
+    assert [result["content"] for result in response.json()["results"]] == ["An updated thought"]
+
+    # When - The user deletes it
+    authenticated_client.delete(detail_url)
+
+    # Then - The list is empty again
+    response = authenticated_client.get(url)
+    assert response.json()["results"] == []
+
+
+@pytest.mark.django_db
+def test_tag_list_cache_is_per_user(authenticated_client, user):
+    """Cached tag lists are never served to another user, and writes elsewhere invalidate them."""
+
+    # Given - A cached tag list
+    TagFactory(owner=user)
+    url = reverse("tag-list")
+    authenticated_client.get(url)
+
+    # When - Another user lists their tags
+    other_user = get_user_model().objects.create_user(username="other", password="password")
+    other_client = APIClient()
+    other_client.force_authenticate(user=other_user)
+    response = other_client.get(url)
+
+    # Then - They don't see the first user's cached list
+    assert response["X-Cache"] == "MISS"
+    assert response.json()["results"] == []
+
+    # When - The user's data changes out of band, e.g. from a Celery task
+    bump_user_generation(user.pk)
+
+    # Then - Their list is rebuilt
+    assert authenticated_client.get(url)["X-Cache"] == "MISS"
@@ -0,0 +1,175 @@
+import pytest
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APIClient
+from thought.models import DailyMood
+from thought.tests.factories import TagFactory, ThoughtFactory
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    user = user_model.objects.create_user(username="user", password="password")
+    user.save()
+    return user
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+def thought_on(day, **kwargs):
+    """Create a thought, then move it to `day` as created_at can't be set on creation."""
+
+    thought = ThoughtFactory(**kwargs)
+    thought.created_at = day
+    thought.save()
+    return thought
+
+
+@pytest.mark.django_db
+def test_daily_mood_follows_thoughts(user):
+    """The rollup of a day is kept up to date as its thoughts are created, tagged, edited and deleted."""
+
+    # Given - Two thoughts on the same day, one of them tagged
+    tag = TagFactory(owner=user)
+    happy = ThoughtFactory(owner=user, mood=4)
+    sad = ThoughtFactory(owner=user, mood=1)
+    happy.tags.add(tag)
+
+    # Then - The day is rolled up
+    daily_mood = DailyMood.objects.get(owner=user, date=happy.created_at)
+    assert (daily_mood.count, daily_mood.mood_count, daily_mood.mood_sum) == (2, 2, 5)
+    assert daily_mood.histogram == {"1": 1, "2": 0, "3": 0, "4": 1, "5": 0}
+    assert daily_mood.tag_counts == {str(tag.id): 1}
+
+    # When - One thought is edited and the other deleted, and the tag is deleted
+    happy.mood = 5
+    happy.save()
+    sad.delete()
+    tag.delete()
+
+    # Then - The rollup follows
+    daily_mood.refresh_from_db()
+    assert (daily_mood.count, daily_mood.mood_count, daily_mood.mood_sum) == (1, 1, 5)
+    assert daily_mood.tag_counts == {}
+
+    # When - The last thought moves to another day
+    thought_on(date(2024, 1, 1), owner=user, mood=3)
+    happy.created_at = date(2024, 1, 2)
+    happy.save()
+
+    # Then - Its old day is gone
+    assert list(DailyMood.objects.values_list("date", "count")) == [(date(2024, 1, 1), 1), (date(2024, 1, 2), 1)]
+
+
+@pytest.mark.django_db
+def test_daily_mood_is_adjusted(user):
+    """Creating, tagging and editing thoughts adjusts the day's rollup rather than recomputing it."""
+
+    # Given - A day with a thought on it, and a tag
+    ThoughtFactory(owner=user, mood=2)
+    tag = TagFactory(owner=user)
+
+    # When - Another thought is created, tagged, given a mood and edited
+    with CaptureQueriesContext(connection) as context:
+        thought = ThoughtFactory(owner=user)
+        thought.tags.add(tag)
+        thought.mood = 5
+        thought.save()
+        thought.content = "Edited"
+        thought.save()
+
+    # Then - The day isn't recomputed, and its rollup is what recomputing it would give
+    assert not [query for query in context.captured_queries if "COUNT(" in query["sql"]]
+    adjusted = DailyMood.objects.values("count", "mood_count", "mood_sum", "histogram", "tag_counts").get()
+    DailyMood.objects.refresh(user.id, thought.created_at)
+    assert DailyMood.objects.values("count", "mood_count", "mood_sum", "histogram", "tag_counts").get() == adjusted
+    assert adjusted["tag_counts"] == {str(tag.id): 1}
+
+
+@pytest.mark.django_db
+def test_daily_mood_follows_analysis(user):
+    """The rollup is updated when a thought's mood is analysed."""
+
+    # Given - A thought without a mood
+    ThoughtFactory(owner=user, content="A fantastic day")
+    assert DailyMood.objects.get(owner=user).mood_count == 0
+
+    # When - It is analysed
+    call_command("analyse", "--concurrency", "1", stdout=StringIO())
+
+    # Then - Its mood is counted
+    assert DailyMood.objects.get(owner=user).mood_count == 1
+
+
+@pytest.mark.django_db
+def test_mood_trend(authenticated_client, user):
+    """The mood trend averages the user's moods over each bucket in the range."""
+
+    # Given - Thoughts over two weeks, and another user's thought
+    thought_on(date(2024, 1, 1), owner=user, mood=2)
+    thought_on(date(2024, 1, 3), owner=user, mood=4)
+    thought_on(date(2024, 1, 3), owner=user, mood=None)
+    thought_on(date(2024, 1, 9), owner=user, mood=5)
+    thought_on(date(2024, 1, 31), owner=user, mood=1)
+    thought_on(date(2024, 1, 3), mood=1)
+
+    # When - The trend for the first half of January is fetched by week
+    url = reverse("mood-trend")
+    response = authenticated_client.get(url, {"start_date": "2024-01-01", "end_date": "2024-01-15", "bucket": "week"})
+
+    # Then - There is a bucket for each week with thoughts, starting on Monday
+    assert response.status_code == status.HTTP_200_OK
+    assert [(r["date"], r["count"], r["average_mood"]) for r in response.data["results"]] == [
+        (date(2024, 1, 1), 3, 3),
+        (date(2024, 1, 8), 1, 5),
+    ]
+    assert response.data["results"][0]["histogram"] == {"1": 0, "2": 1, "3": 0, "4": 1, "5": 0}
+
+    # When - The whole trend is fetched by month
+    response = authenticated_client.get(url, {"bucket": "month"})
+
+    # Then - There is a single bucket
+    assert [(r["date"], r["count"], r["average_mood"]) for r in response.data["results"]] == [(date(2024, 1, 1), 5, 3)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{"bucket": "year"}, {"start_date": "yesterday"}, {"end_date": "2024-13-01"}])
+def test_mood_trend_invalid(authenticated_client, params):
+    """Unknown buckets and invalid dates are rejected."""
+
+    # When - The trend is fetched with invalid parameters
+    response = authenticated_client.get(reverse("mood-trend"), params)
+
+    # Then - The request is rejected
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_rollup_moods_command(user):
+    """The rollup_moods command rebuilds the rollups from the thoughts."""
+
+    # Given - Rollups that are out of date
+    thought_on(date(2024, 1, 1), owner=user, mood=2)
+    DailyMood.objects.all().delete()
+    DailyMood.objects.create(owner=user, date=date(2023, 1, 1), count=3)
+
+    # When - The command runs
+    call_command("rollup_moods", stdout=StringIO())
+
+    # Then - Only the day with thoughts is rolled up
+    assert list(DailyMood.objects.values_list("date", "count", "mood_sum")) == [(date(2024, 1, 1), 1, 2)]
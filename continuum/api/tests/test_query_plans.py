@@ -0,0 +1,220 @@
+import json
+import random
+from datetime import date, timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from guardian.shortcuts import assign_perm
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from api.views import TagViewSet, ThoughtViewSet
+from thought.models import DailyMood, Tag, Thought, ThoughtTag, Tombstone
+
+# The plans asserted on are Postgres's, the production database. SQLite plans its queries too differently to tell.
+pytestmark = pytest.mark.skipif(connection.vendor != "postgresql", reason="Query plans are checked on Postgres.")
+
+# The tables a request reads from. Reading one of these from end to end means a query slows down with every user.
+HOT_TABLES = {"thought_thought", "thought_tag", "thought_thought_tags", "thought_dailymood", "thought_tombstone"}
+
+
+@pytest.fixture(scope="module")
+def users(django_db_setup, django_db_blocker):
+    """Users with a year of thoughts and tags each, and the planner's statistics brought up to date.
+
+    The volumes are big enough that a sequential scan is never the cheapest plan for one user's rows. They're seeded
+    once for the module, in a transaction that is rolled back afterwards.
+
+    Yields:
+        list: The users.
+
+    """
+
+    with django_db_blocker.unblock(), transaction.atomic():
+        yield seed()
+        transaction.set_rollback(True)
+
+
+def seed():
+    randomiser = random.Random(0)
+    user_model = get_user_model()
+    users = user_model.objects.bulk_create(user_model(username=f"user{i}", sub=f"user{i}") for i in range(20))
+    tags = Tag.objects.bulk_create(
+        Tag(owner=user, name=f"tag{i}", description="A tag", colour="#000000") for user in users for i in range(10)
+    )
+    # Tags are few per user, so it takes many more users for one user's tags to be a small part of the table.
+    others = user_model.objects.bulk_create(user_model(username=f"other{i}", sub=f"other{i}") for i in range(500))
+    Tag.objects.bulk_create(
+        Tag(owner=user, name=f"tag{i}", description="A tag", colour="#000000") for user in others for i in range(10)
+    )
+
+    start = date(2024, 1, 1)
+    thoughts = []
+    for user in users:
+        for i in range(500):
+            thoughts.append(Thought(owner=user, content=f"Thought {i}", mood=randomiser.randint(1, 5)))
+    thoughts = Thought.objects.bulk_create(thoughts)
+    # Creation dates are set automatically, so spread them over the year afterwards.
+    days = {}
+    for thought in thoughts:
+        days.setdefault(start + timedelta(days=randomiser.randrange(365)), []).append(thought.id)
+    for day, ids in days.items():
+        Thought.objects.filter(id__in=ids).update(created_at=day)
+
+    tags_by_owner = {}
+    for tag in tags:
+        tags_by_owner.setdefault(tag.owner_id, []).append(tag)
+    ThoughtTag.objects.bulk_create(
+        ThoughtTag(thought=thought, tag=tag)
+        for thought in thoughts
+        for tag in randomiser.sample(tags_by_owner[thought.owner_id], 2)
+    )
+    DailyMood.objects.bulk_create(
+        DailyMood(owner=user, date=start + timedelta(days=i), count=1, mood_count=1, mood_sum=3)
+        for user in users
+        for i in range(365)
+    )
+    Tombstone.objects.bulk_create(
+        Tombstone(owner_id=thought.owner_id, model="thought", object_id=thought.id) for thought in thoughts
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return users
+
+
+def plan_nodes(plan):
+    """Yield every node of a Postgres JSON query plan.
+
+    Yields:
+        dict: A node of the plan.
+
+    """
+
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def assert_uses_index(queryset, *indexes):
+    """Assert the queryset is planned as a lookup in one of `indexes` and reads none of the hot tables end to end."""
+
+    plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+    nodes = list(plan_nodes(plan))
+    scanned = {node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"}
+    used = {node.get("Index Name") for node in nodes}
+
+    assert not scanned & HOT_TABLES, f"Sequential scan of {scanned & HOT_TABLES}:\n{plan}"
+    assert used & set(indexes), f"None of {indexes} are used:\n{plan}"
+
+
+def unique_index(model, columns):
+    """The name of the index backing a unique constraint, which Django names after a hash of the table and columns."""
+
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return next(name for name, details in constraints.items() if details["unique"] and details["columns"] == columns)
+
+
+def list_queryset(viewset, user, params=None):
+    """The queryset `viewset` lists for `user`, limited to a page as the paginator does."""
+
+    request = Request(APIRequestFactory().get("/", params or {}))
+    request.user = user
+    view = viewset(action="list", request=request, format_kwarg=None, kwargs={})
+    return view.get_queryset()[:10]
+
+
+@pytest.fixture(params=[False, True], ids=["private", "sharing"])
+def sharing(request, settings):
+    settings.THOUGHT_SHARING_ENABLED = request.param
+    return request.param
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params",
+    [{}, {"start_date": "2024-03-01", "end_date": "2024-03-31"}, {"start_date": "2024-12-01"}],
+    ids=["timeline", "date-range", "since-date"],
+)
+def test_thought_list_uses_timeline_index(users, sharing, params):
+    """A user's thoughts are read in order from the timeline index, with or without a date range."""
+
+    # When - A user's thoughts are listed
+    queryset = list_queryset(ThoughtViewSet, users[0], params)
+
+    # Then - They're read from the timeline index
+    assert_uses_index(queryset, "thought_owner_timeline_idx")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("match", ["any", "all"])
+def test_thought_list_by_tags_uses_tag_index(users, sharing, match):
+    """Tag filters look thoughts up in the through table's index rather than reading every tagged thought."""
+
+    # Given - Two of a user's tags
+    tags = Tag.objects.filter(owner=users[0])[:2]
+
+    # When - The user's thoughts are listed by tag
+    params = {"tags": ",".join(str(tag.id) for tag in tags), "tags_match": match}
+    queryset = list_queryset(ThoughtViewSet, users[0], params)
+
+    # Then - They're looked up in the through table's index, whether the planner starts from the tags or the timeline
+    assert_uses_index(queryset, unique_index(ThoughtTag, ["thought_id", "tag_id"]), "thought_tag_thought_idx")
+
+
+@pytest.mark.django_db
+def test_tag_list_uses_name_index(users, sharing):
+    """A user's tags are read in name order from their index."""
+
+    # When - A user's tags are listed
+    queryset = list_queryset(TagViewSet, users[0])
+
+    # Then - They're read from the name index
+    assert_uses_index(queryset, "tag_owner_name_idx")
+
+
+@pytest.mark.django_db
+def test_shared_thoughts_list_avoids_sequential_scans(users, settings):
+    """Once something is shared with a user, their list still only looks up their own and the shared thoughts."""
+
+    # Given - A thought shared with the user
+    settings.THOUGHT_SHARING_ENABLED = True
+    shared = Thought.objects.filter(owner=users[1]).first()
+    assign_perm("view_thought", users[0], shared)
+
+    # When - The user's thoughts are listed
+    queryset = list_queryset(ThoughtViewSet, users[0])
+
+    # Then - Their own thoughts are looked up by owner, not found by reading every thought
+    assert_uses_index(queryset, "thought_owner_timeline_idx", "thought_owner_updated_idx")
+
+
+@pytest.mark.django_db
+def test_sync_uses_updated_indexes(users):
+    """Sync reads the changes since a watermark by range scans over the (owner, updated_at) indexes."""
+
+    # Given - A watermark
+    start = timezone.now() - timedelta(hours=1)
+
+    # When - The changes since it are looked up, as sync does
+    thoughts = Thought.objects.owned_by(users[0]).filter(updated_at__gte=start).order_by("updated_at")
+    tags = Tag.objects.owned_by(users[0]).filter(updated_at__gte=start).order_by("updated_at")
+    tombstones = Tombstone.objects.filter(owner=users[0], deleted_at__gte=start).order_by("deleted_at")
+
+    # Then - Each is a range scan over its index
+    assert_uses_index(thoughts, "thought_owner_updated_idx")
+    assert_uses_index(tags, "tag_owner_updated_idx")
+    assert_uses_index(tombstones, "tombstone_owner_deleted_idx")
+
+
+@pytest.mark.django_db
+def test_mood_trend_avoids_sequential_scans(users):
+    """The mood trend reads a range of a user's daily rollups, not the thoughts or every user's rollups."""
+
+    # When - A month of a user's rollups are looked up, as the mood trend does
+    daily_moods = DailyMood.objects.filter(owner=users[0], date__gte="2024-03-01", date__lte="2024-03-31")
+
+    # Then - They're looked up in the (owner, date) index
+    assert_uses_index(daily_moods.order_by("date"), unique_index(DailyMood, ["owner_id", "date"]))
@@ -0,0 +1,184 @@
+import pytest
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APIClient
+from thought.models import Thought, Tombstone
+from thought.tests.factories import TagFactory, ThoughtFactory
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    user = user_model.objects.create_user(username="user", password="password")
+    user.save()
+    return user
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+def age(queryset, **delta):
+    """Move the updates or deletions in `queryset` into the past."""
+
+    field = "deleted_at" if queryset.model is Tombstone else "updated_at"
+    queryset.update(**{field: timezone.now() - timedelta(**delta)})
+
+
+@pytest.mark.django_db
+def test_full_sync(authenticated_client, user):
+    """Without a watermark, sync returns all of the user's thoughts and tags."""
+
+    # Given - The user's thought and tag, and another user's thought
+    thought = ThoughtFactory(owner=user)
+    tag = TagFactory(owner=user)
+    ThoughtFactory()
+
+    # When - The client syncs for the first time
+    response = authenticated_client.get(reverse("sync"))
+
+    # Then - The client is sent everything, with a watermark for next time
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["full"] is True
+    assert [row["id"] for row in response.data["thoughts"]] == [str(thought.id)]
+    assert [row["id"] for row in response.data["tags"]] == [str(tag.id)]
+    assert response.data["watermark"]
+    assert response.data["next"] is None
+
+
+@pytest.mark.django_db
+def test_full_sync_pages(authenticated_client, user, settings):
+    """A full sync is sent a page at a time, each with the watermark from when it started."""
+
+    # Given - Three thoughts and a tag, with room for two of each per page
+    settings.SYNC_PAGE_SIZE = 2
+    thoughts = ThoughtFactory.create_batch(3, owner=user)
+    tag = TagFactory(owner=user)
+
+    # When - The client syncs for the first time
+    first = authenticated_client.get(reverse("sync")).data
+
+    # And - Follows the cursor to the next page
+    second = authenticated_client.get(reverse("sync"), {"cursor": first["next"]}).data
+
+    # Then - The client is sent every thought and tag once, and the same watermark on each page
+    assert len(first["thoughts"]) == 2
+    assert [row["id"] for row in first["tags"]] == [str(tag.id)]
+    assert len(second["thoughts"]) == 1
+    assert second["tags"] == []
+    assert {row["id"] for row in first["thoughts"] + second["thoughts"]} == {str(thought.id) for thought in thoughts}
+    assert second["full"] is True
+    assert second["next"] is None
+    assert second["watermark"] == first["watermark"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("cursor", ["next", "MjAyNC0wMS0wMQ=="])
+def test_sync_invalid_cursor(authenticated_client, cursor):
+    """Cursors that weren't issued by the server are rejected."""
+
+    # When - The client pages with a made up cursor
+    response = authenticated_client.get(reverse("sync"), {"cursor": cursor})
+
+    # Then - The request is rejected
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_delta_sync(authenticated_client, user):
+    """With a watermark, sync only returns what changed since then, including deletions."""
+
+    # Given - A client that synced a minute ago
+    old, edited, deleted = ThoughtFactory.create_batch(3, owner=user)
+    tag = TagFactory(owner=user)
+    age(Thought.objects.all(), minutes=2)
+    age(tag.__class__.objects.all(), minutes=2)
+    watermark = authenticated_client.get(reverse("sync")).data["watermark"]
+
+    # When - One thought is edited and another deleted
+    edited.content = "Edited"
+    edited.save()
+    deleted_id = deleted.id
+    deleted.delete()
+
+    # And - The client syncs again
+    response = authenticated_client.get(reverse("sync"), {"since": watermark})
+
+    # Then - The client is only sent the changes
+    assert response.data["full"] is False
+    assert [row["content"] for row in response.data["thoughts"]] == ["Edited"]
+    assert response.data["tags"] == []
+    assert response.data["deleted"] == {"thoughts": [deleted_id], "tags": []}
+
+
+@pytest.mark.django_db
+def test_sync_ignores_deleted_users(user):
+    """Deleting a user doesn't leave tombstones behind for their thoughts and tags."""
+
+    # Given - A user with a tagged thought
+    ThoughtFactory(owner=user).tags.add(TagFactory(owner=user))
+
+    # When - The user is deleted
+    user.delete()
+
+    # Then - There are no tombstones
+    assert not Tombstone.objects.exists()
+
+
+@pytest.mark.django_db
+def test_sync_old_watermark(authenticated_client, user, settings):
+    """A watermark older than the tombstones gets a full sync."""
+
+    # Given - A client that last synced before the oldest tombstone
+    settings.SYNC_TOMBSTONE_TTL = 60
+    ThoughtFactory(owner=user)
+    watermark = authenticated_client.get(reverse("sync")).data["watermark"]
+    settings.SYNC_TOMBSTONE_TTL = 0
+
+    # When - The client syncs
+    response = authenticated_client.get(reverse("sync"), {"since": watermark})
+
+    # Then - The client is sent everything
+    assert response.data["full"] is True
+    assert len(response.data["thoughts"]) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("since", ["yesterday", "MjAyNC0wMS0wMQ=="])
+def test_sync_invalid_watermark(authenticated_client, since):
+    """Watermarks that weren't issued by the server are rejected."""
+
+    # When - The client syncs with a made up watermark
+    response = authenticated_client.get(reverse("sync"), {"since": since})
+
+    # Then - The request is rejected
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_prune_tombstones(user, settings):
+    """The prune_tombstones command deletes tombstones older than SYNC_TOMBSTONE_TTL."""
+
+    # Given - An old and a recent deletion
+    settings.SYNC_TOMBSTONE_TTL = 60 * 60
+    ThoughtFactory(owner=user).delete()
+    age(Tombstone.objects.all(), hours=2)
+    ThoughtFactory(owner=user).delete()
+
+    # When - The command runs
+    call_command("prune_tombstones", stdout=StringIO())
+
+    # Then - Only the recent tombstone is left
+    assert Tombstone.objects.count() == 1
@@ -47,6 +47,7 @@ def test_create_tag(authenticated_client, user):
     assert Tag.objects.filter(name="Test Tag").exists()
     new_tag = Tag.objects.get(name="Test Tag")
     assert user.has_perm("view_tag", new_tag)
+    assert new_tag.owner == user
 
 
 @pytest.mark.django_db
@@ -70,6 +71,25 @@ def test_list_tags_with_permissions(authenticated_client, user):
     assert {tag["name"] for tag in response.data["results"]} == {tag1.name, tag2.name}
 
 
+@pytest.mark.django_db
+def test_list_owned_tags(authenticated_client, user):
+    """User can list the tags they own, but not tags owned by someone else."""
+
+    # Given - A tag owned by the user and one owned by another user
+    other_user = get_user_model().objects.create_user(username="other", password="password")
+    tag = TagFactory(owner=user)
+    TagFactory(owner=other_user)
+
+    url = reverse("tag-list")
+
+    # When - The user lists tags
+    response = authenticated_client.get(url)
+
+    # Then - Only the owned tag is listed
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["name"] for result in response.data["results"]] == [tag.name]
+
+
 @pytest.mark.django_db
 def test_retrieve_tag_with_permissions(authenticated_client, user):
     """User can retrieve a tag they have permission to view."""
@@ -1,12 +1,16 @@
 import pytest
 from datetime import datetime, timedelta
 from dateutil.parser import parse as parse_date
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from guardian.shortcuts import assign_perm
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import assign_perm, remove_perm
 from thought.tests.factories import ThoughtFactory, TagFactory
+from api.serializers import HeadlineField
 
 from thought.models import Thought
 
@@ -52,6 +56,10 @@ def test_create_thought(authenticated_client, user):
     new_thought = Thought.objects.get(content="This is a thought")
     assert user.has_perm("view_thought", new_thought)
 
+    # And - Permissions come from ownership rather than per-object permission rows
+    assert new_thought.owner == user
+    assert not UserObjectPermission.objects.exists()
+
 
 @pytest.mark.django_db
 def test_list_thoughts_with_permissions(authenticated_client, user):
@@ -74,6 +82,44 @@ def test_list_thoughts_with_permissions(authenticated_client, user):
     assert len(results) == 2
 
 
+@pytest.mark.django_db
+def test_list_owned_thoughts(authenticated_client, user):
+    """User can list the thoughts they own, but not thoughts owned by someone else."""
+
+    # Given - A thought owned by the user and one owned by another user
+    other_user = get_user_model().objects.create_user(username="other", password="password")
+    thought = ThoughtFactory(owner=user)
+    ThoughtFactory(owner=other_user)
+
+    url = reverse("thought-list")
+
+    # When - The user retrieves the list of thoughts
+    response = authenticated_client.get(url)
+
+    # Then - Only the owned thought is listed
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert [result["id"] for result in results] == [str(thought.id)]
+
+
+@pytest.mark.django_db
+def test_edit_owned_thought(authenticated_client, user):
+    """User can edit a thought they own without any object permissions."""
+
+    # Given - A thought owned by the user
+    thought = ThoughtFactory(content="Original thought", owner=user)
+
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+
+    # When - The user updates the Thought
+    response = authenticated_client.put(url, {"content": "Updated thought"})
+
+    # Then - The response is successful and Thought is updated
+    assert response.status_code == status.HTTP_200_OK
+    thought.refresh_from_db()
+    assert thought.content == "Updated thought"
+
+
 @pytest.mark.django_db
 def test_thoughts_are_listed_in_creation_order(authenticated_client, user):
     """Thoughts are listed in creation order."""
@@ -128,6 +174,109 @@ def test_max_ten_thoughts_are_listed(authenticated_client, user):
     assert len(results) == 10
 
 
+@pytest.mark.django_db
+def test_cursor_pagination_pages_through_every_thought(authenticated_client, user):
+    """Cursor pagination visits every thought exactly once, newest first."""
+
+    # Given - Twenty five thoughts spread over five days, several per day
+    thoughts = ThoughtFactory.create_batch(25, owner=user)
+    for i, thought in enumerate(thoughts):
+        thought.created_at = datetime.now().date() - timedelta(days=i % 5)
+        thought.save()
+
+    # When - The user follows the cursor links until there are no more pages
+    url = reverse("thought-list") + "?pagination=cursor"
+    pages = []
+    while url:
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        pages.append(response.json())
+        url = pages[-1]["next"]
+
+    # Then - Every thought is returned once, in timeline order, without a count
+    assert [len(page["results"]) for page in pages] == [10, 10, 5]
+    assert all("count" not in page for page in pages)
+    ids = [result["id"] for page in pages for result in page["results"]]
+    expected = sorted(thoughts, key=lambda t: (t.created_at, str(t.id)), reverse=True)
+    assert ids == [str(thought.id) for thought in expected]
+
+
+@pytest.mark.django_db
+def test_cursor_pagination_count_is_optional(authenticated_client, user):
+    """Cursor pagination only counts the thoughts when asked to."""
+
+    # Given - Eleven thoughts owned by the user
+    ThoughtFactory.create_batch(11, owner=user)
+
+    url = reverse("thought-list")
+
+    # When - The user asks for the first page with a count
+    response = authenticated_client.get(url, {"pagination": "cursor", "count": "true"})
+
+    # Then - The count is returned and the next link does not ask for it again
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["count"] == 11
+    assert "count=" not in response.json()["next"]
+
+
+@pytest.mark.django_db
+def test_cursor_pagination_invalid_cursor(authenticated_client, user):
+    """A malformed cursor is rejected."""
+
+    url = reverse("thought-list")
+
+    # When - The user passes a cursor that was not issued by the server
+    response = authenticated_client.get(url, {"cursor": "not-a-cursor"})
+
+    # Then - The response is not found
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{}, {"expand": "tags"}, {"pagination": "cursor"}])
+def test_list_thoughts_query_count_is_constant(authenticated_client, user, params):
+    """Listing thoughts costs the same number of queries however many thoughts and tags are on the page."""
+
+    def count_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = authenticated_client.get(reverse("thought-list"), params)
+        assert response.status_code == status.HTTP_200_OK
+        return len(context.captured_queries)
+
+    tags = TagFactory.create_batch(3, owner=user)
+
+    # Given - A page with a single tagged thought
+    ThoughtFactory(owner=user).tags.add(tags[0])
+    count_queries()
+    single = count_queries()
+
+    # When - The page fills up with thoughts carrying several tags each
+    for _ in range(9):
+        ThoughtFactory(owner=user).tags.add(*tags)
+    full = count_queries()
+
+    # Then - The number of queries does not grow with the page
+    assert full == single
+
+
+@pytest.mark.django_db
+def test_list_thoughts_expand_tags(authenticated_client, user):
+    """Setting expand=tags embeds compact tags rather than their ids."""
+
+    # Given - A tagged thought
+    tag = TagFactory(owner=user, name="work", colour="#ff0000")
+    ThoughtFactory(owner=user).tags.add(tag)
+
+    url = reverse("thought-list")
+
+    # When - The user lists thoughts with tags expanded
+    response = authenticated_client.get(url, {"expand": "tags"})
+
+    # Then - The tags are embedded in the response
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["results"][0]["tags"] == [{"id": str(tag.id), "name": "work", "colour": "#ff0000"}]
+
+
 @pytest.mark.django_db
 def test_filter_thoughts_by_start_date(authenticated_client, user):
     """Setting start_date return only thoughts created after that date."""
@@ -212,6 +361,177 @@ def test_filter_thoughts_by_tags(authenticated_client, user):
     assert results[0]["id"] == str(thought1.id)
 
 
+@pytest.mark.django_db
+def test_filter_thoughts_by_any_tag(authenticated_client, user):
+    """Thoughts matching several of the requested tags are only returned once."""
+
+    # Given - One thought with both tags, one with a single tag and one with neither
+    tag1 = TagFactory(owner=user)
+    tag2 = TagFactory(owner=user)
+    both = ThoughtFactory(owner=user)
+    both.tags.add(tag1, tag2)
+    one = ThoughtFactory(owner=user)
+    one.tags.add(tag2)
+    ThoughtFactory(owner=user)
+
+    url = reverse("thought-list")
+
+    # When - The user filters by either tag
+    response = authenticated_client.get(url, {"tags": f"{tag1.id},{tag2.id}"})
+
+    # Then - Each matching thought is returned once and counted once
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["count"] == 2
+    assert {result["id"] for result in response.json()["results"]} == {str(both.id), str(one.id)}
+
+
+@pytest.mark.django_db
+def test_filter_thoughts_by_all_tags(authenticated_client, user):
+    """Setting tags_match=all returns only thoughts carrying every requested tag."""
+
+    # Given - One thought with both tags and one with a single tag
+    tag1 = TagFactory(owner=user)
+    tag2 = TagFactory(owner=user)
+    both = ThoughtFactory(owner=user)
+    both.tags.add(tag1, tag2)
+    ThoughtFactory(owner=user).tags.add(tag2)
+
+    url = reverse("thought-list")
+
+    # When - The user filters by both tags
+    response = authenticated_client.get(url, {"tags": f"{tag1.id},{tag2.id}", "tags_match": "all"})
+
+    # Then - Only the thought with both tags is returned
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["id"] for result in response.json()["results"]] == [str(both.id)]
+
+
+@pytest.mark.django_db
+def test_search_thoughts(authenticated_client, user):
+    """Setting q returns only thoughts matching the search, combined with the other filters."""
+
+    # Given - Three thoughts, two mentioning risotto and only one of those tagged
+    tag = TagFactory(owner=user)
+    tagged = ThoughtFactory(content="Cooked a risotto for dinner tonight.", owner=user)
+    tagged.tags.add(tag)
+    ThoughtFactory(content="Another risotto, still needs more salt.", owner=user)
+    ThoughtFactory(content="Went for a long walk.", owner=user)
+
+    url = reverse("thought-list")
+
+    # When - The user searches within the tag
+    response = authenticated_client.get(url, {"q": "risotto", "tags": str(tag.id)})
+
+    # Then - Only the tagged risotto thought is returned, without its search vector
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert [result["id"] for result in results] == [str(tagged.id)]
+    assert "search_vector" not in results[0]
+
+
+@pytest.mark.django_db
+def test_search_ignores_cursor_pagination(authenticated_client, user):
+    """Searches are paginated by page number even when cursor pagination is asked for, to keep their ranking."""
+
+    # Given - More matching thoughts than fit on a page
+    ThoughtFactory.create_batch(12, content="Walked the dog", owner=user)
+
+    # When - The user searches with cursor pagination
+    response = authenticated_client.get(reverse("thought-list"), {"q": "dog", "pagination": "cursor"})
+
+    # Then - The results are paginated by page number
+    data = response.json()
+    assert data["count"] == 12
+    assert len(data["results"]) == 10
+    assert "page=2" in data["next"]
+    assert "cursor=" not in data["next"]
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="Full text search requires Postgres.")
+@pytest.mark.django_db
+def test_search_thoughts_ranked_with_headlines(authenticated_client, user):
+    """Search results are ranked by relevance and include a highlighted snippet."""
+
+    # Given - One thought that mentions cooking once and one that is all about it
+    ThoughtFactory(content="Went for a walk, then did some cooking.", owner=user)
+    best = ThoughtFactory(content="Cooking all day. I love cooking, the cooking class was great.", owner=user)
+
+    url = reverse("thought-list")
+
+    # When - The user searches for a stemmed form of the word
+    response = authenticated_client.get(url, {"q": "cooked"})
+
+    # Then - Both match, the most relevant first, with highlights
+    results = response.json()["results"]
+    assert [result["id"] for result in results][0] == str(best.id)
+    assert len(results) == 2
+    assert "<mark>Cooking</mark>" in results[0]["headline"]
+    assert results[0]["rank"] > results[1]["rank"]
+
+
+def test_search_headline_is_escaped():
+    """Headlines escape the thought's content, so only the highlighting is markup."""
+
+    # Given - A headline of content with markup in it
+    headline = "<img src=x onerror=alert(1)> \x02cooking\x03 & <script>"
+
+    # When - It's serialized
+    html = HeadlineField().to_representation(headline)
+
+    # Then - The content is escaped and the match highlighted
+    assert html == "&lt;img src=x onerror=alert(1)&gt; <mark>cooking</mark> &amp; &lt;script&gt;"
+
+
+@pytest.mark.django_db
+def test_set_thought_tags(authenticated_client, user):
+    """Tags can be set when creating a thought and changed when editing it."""
+
+    # Given - Two tags
+    tags = TagFactory.create_batch(2, owner=user)
+
+    # When - A thought is created with the first tag, then edited to carry the second
+    response = authenticated_client.post(
+        reverse("thought-list"), {"content": "Tagged", "tags": [str(tags[0].id)]}, format="json"
+    )
+    thought = Thought.objects.get(id=response.data["id"])
+    assert list(thought.tags.all()) == [tags[0]]
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+    response = authenticated_client.patch(url, {"tags": [str(tags[1].id)]}, format="json")
+
+    # Then - The thought carries the second tag
+    assert response.status_code == status.HTTP_200_OK
+    assert list(thought.tags.all()) == [tags[1]]
+
+
+@pytest.mark.django_db
+def test_set_thought_tags_of_another_user(authenticated_client, user):
+    """Thoughts can't be given tags the user can't see, unless they've been shared with them."""
+
+    # Given - A thought, another user's tag and a tag shared with the user
+    thought = ThoughtFactory(owner=user)
+    other, shared = TagFactory(), TagFactory()
+    assign_perm("view_tag", user, shared)
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+
+    # When - A thought is created with the other user's tag, and the thought edited to carry it
+    created = authenticated_client.post(
+        reverse("thought-list"), {"content": "Hi", "tags": [str(other.id)]}, format="json"
+    )
+    edited = authenticated_client.patch(url, {"tags": [str(other.id)]}, format="json")
+
+    # Then - Both are refused
+    assert created.status_code == status.HTTP_400_BAD_REQUEST
+    assert edited.status_code == status.HTTP_400_BAD_REQUEST
+    assert not thought.tags.exists()
+
+    # When - The thought is edited to carry the shared tag
+    response = authenticated_client.patch(url, {"tags": [str(shared.id)]}, format="json")
+
+    # Then - It does
+    assert response.status_code == status.HTTP_200_OK
+    assert list(thought.tags.all()) == [shared]
+
+
 @pytest.mark.django_db
 def test_view_thought(authenticated_client, user):
     """User with permission can view an existing Thought."""
@@ -322,3 +642,88 @@ def test_delete_thought_no_permission(authenticated_client, user):
     # Then - The response should be forbidden
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert Thought.objects.filter(id=thought.id).exists()
+
+
+@pytest.mark.django_db
+def test_delete_owned_thought(authenticated_client, user):
+    """Owners can delete their thoughts without any guardian permission."""
+
+    # Given - A thought owned by the user
+    thought = ThoughtFactory(owner=user)
+
+    # When - The user deletes it
+    response = authenticated_client.delete(reverse("thought-detail", kwargs={"pk": thought.id}))
+
+    # Then - It's deleted
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert not Thought.objects.filter(id=thought.id).exists()
+
+
+@pytest.mark.django_db
+def test_owned_lookups_skip_guardian(authenticated_client, user):
+    """Users with nothing shared with them are served without querying guardian, once that's known."""
+
+    # Given - An owned thought, once fetched, edited and listed
+    thought = ThoughtFactory(owner=user)
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+
+    def requests():
+        authenticated_client.get(url)
+        authenticated_client.patch(url, {"content": "Edited"}, format="json")
+        authenticated_client.get(reverse("thought-list"))
+
+    requests()
+
+    # When - It's fetched, edited and listed again
+    with CaptureQueriesContext(connection) as context:
+        requests()
+
+    # Then - None of the queries touch guardian's tables
+    assert not [query for query in context.captured_queries if "guardian" in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_shared_thought_visible_once_shared(authenticated_client, user):
+    """A thought shared with a user can be fetched straight away, even after they were known to have no shares."""
+
+    # Given - A user who has looked up a thought with nothing shared with them
+    thought = ThoughtFactory(content="Shared later")
+    url = reverse("thought-detail", kwargs={"pk": thought.id})
+    assert authenticated_client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    # When - The thought is shared with them, and then unshared
+    assign_perm("view_thought", user, thought)
+    shared = authenticated_client.get(url)
+    remove_perm("view_thought", user, thought)
+    unshared = authenticated_client.get(url)
+
+    # Then - It's visible only while shared
+    assert shared.status_code == status.HTTP_200_OK
+    assert unshared.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_saving_thought_schedules_analysis(authenticated_client, user, mocker):
+    """Creating a thought or changing its content schedules its analysis, other edits don't."""
+
+    # Given - Analysis that is never actually scheduled
+    schedule_analysis = mocker.patch("api.views.schedule_analysis")
+
+    # When - A thought is created
+    response = authenticated_client.post(reverse("thought-list"), {"content": "Tired."}, format="json")
+    url = reverse("thought-detail", kwargs={"pk": response.data["id"]})
+
+    # Then - Its analysis is scheduled
+    schedule_analysis.assert_called_once()
+
+    # When - Its content is left unchanged by an edit
+    authenticated_client.patch(url, {"content": "Tired."}, format="json")
+
+    # Then - No analysis is scheduled
+    assert schedule_analysis.call_count == 1
+
+    # When - Its content is edited
+    authenticated_client.patch(url, {"content": "Good day"}, format="json")
+
+    # Then - Its analysis is scheduled again
+    assert schedule_analysis.call_count == 2
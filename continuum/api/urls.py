@@ -8,4 +8,7 @@ router.register(r"thoughts", views.ThoughtViewSet)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("cache-stats/", views.cache_stats, name="cache-stats"),
+    path("mood-trend/", views.mood_trend, name="mood-trend"),
+    path("sync/", views.sync, name="sync"),
 ]
@@ -1,34 +1,51 @@
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from contextlib import suppress
+from datetime import timedelta
 from logging import getLogger
+from uuid import UUID
 
-from api.serializers import TagSerializer, ThoughtSerializer
-from django.contrib.postgres.search import SearchVector
+from api.asynchronous import AsyncReadMixin
+from api.bulk import BulkMixin
+from api.caching import CachedListMixin, ConditionalMixin
+from api.export import aiterate, buffered, csv_lines, export_rows, gzipped, ndjson_lines
+from api.pagination import AsyncPageNumberPagination, KeysetPagination
+from api.serializers import BulkTagSerializer, BulkThoughtSerializer, TagSerializer, ThoughtSerializer
+from continuum.cache import get_cache_stats
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_date, parse_datetime
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.db.models import Q
-from guardian.shortcuts import assign_perm, get_objects_for_user
-from rest_framework import status, viewsets
-from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
-from thought.models import Tag, Thought
+from django.db.models import Count, Max, Prefetch, Q
+from rest_framework import exceptions, status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from thought.models import DailyMood, Tag, Thought, ThoughtTag, Tombstone
+from thought.signals import refresh_days
+from thought.tasks import analyse_thoughts, schedule_analysis
 
 
 logger = getLogger(__name__)
 
 
-class CustomPageNumberPagination(PageNumberPagination):
+class CustomPageNumberPagination(AsyncPageNumberPagination):
     page_size = 10
 
 
-class CustomTagPageNumberPagination(PageNumberPagination):
+class CustomTagPageNumberPagination(AsyncPageNumberPagination):
     page_size = 100
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(BulkMixin, ConditionalMixin, CachedListMixin, AsyncReadMixin, viewsets.ModelViewSet):
+    cache_name = "tags"
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    bulk_serializer_class = BulkTagSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomTagPageNumberPagination
 
@@ -38,22 +55,51 @@ class TagViewSet(viewsets.ModelViewSet):
         return None
 
     def get_queryset(self):
-        return get_objects_for_user(self.request.user, "view_tag", klass=Tag)
+        queryset = Tag.objects.visible_to(self.request.user, "view_tag")
+        return queryset.order_by("name", "id")
 
     def perform_create(self, serializer):
-        tag = serializer.save()
-        assign_perm("view_tag", self.request.user, tag)
+        serializer.save(owner=self.request.user)
+        self.bump_generations(serializer.instance)
 
 
-class ThoughtViewSet(viewsets.ModelViewSet):
+class ThoughtViewSet(BulkMixin, ConditionalMixin, CachedListMixin, AsyncReadMixin, viewsets.ModelViewSet):
+    cache_name = "thoughts"
     queryset = Thought.objects.all()
     serializer_class = ThoughtSerializer
+    bulk_serializer_class = BulkThoughtSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPageNumberPagination
+    cursor_pagination_class = KeysetPagination
+    # Renaming a tag changes `?expand=tags`, and deleting one changes every representation.
+    related_validators = {"tags_updated_at": Max("tags__updated_at"), "tag_count": Count("tags")}
+    export_chunk_size = 500
+    export_types = {
+        "ndjson": (ndjson_lines, "application/x-ndjson"),
+        "csv": (csv_lines, "text/csv"),
+    }
+
+    @property
+    def paginator(self):
+        """Clients opt into keyset pagination with `?pagination=cursor`, or by following a `next` cursor link.
+
+        Searches are ordered by rank, which isn't a keyset, so they're always paginated by page number.
+
+        """
+
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params
+            if not params.get("q") and (params.get("pagination") == "cursor" or "cursor" in params):
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
+        ordering = ["-created_at", "-id"]
+
         if self.action == "list":
-            queryset = get_objects_for_user(self.request.user, "view_thought", klass=Thought)
+            queryset = Thought.objects.visible_to(self.request.user, "view_thought")
 
             # Filter by start and end date
             start_date = self.request.query_params.get("start_date", None)
@@ -79,28 +125,312 @@ class ThoughtViewSet(viewsets.ModelViewSet):
                 except ValidationError:
                     pass
 
-            # Filter by tags
+            # Filter by tags, matching any of them unless tags_match=all.
             tags = self.request.query_params.get("tags", None)
             if tags:
-                tags = tags.split(",")
-                queryset = queryset.filter(tags__id__in=tags)
+                tag_ids = []
+                for tag_id in tags.split(","):
+                    with suppress(ValueError):
+                        tag_ids.append(UUID(tag_id))
+
+                match = self.request.query_params.get("tags_match", "any")
+                queryset = queryset.with_tags(tag_ids, match=match)
+
+            # Full text search, best matches first.
+            query = self.request.query_params.get("q", None)
+            if query:
+                queryset = queryset.search(query)
+                if "rank" in queryset.query.annotations:
+                    ordering = ["-rank", *ordering]
 
-        elif self.action == "update":
-            queryset = get_objects_for_user(self.request.user, "change_thought", klass=Thought)
+        elif self.action in ("update", "partial_update"):
+            queryset = Thought.objects.visible_to(self.request.user, "change_thought")
         elif self.action == "destroy":
-            queryset = get_objects_for_user(self.request.user, "delete_thought", klass=Thought)
+            queryset = Thought.objects.visible_to(self.request.user, "delete_thought")
         else:
-            queryset = get_objects_for_user(self.request.user, "view_thought", klass=Thought)
+            queryset = Thought.objects.visible_to(self.request.user, "view_thought")
 
-        queryset = queryset.order_by("-created_at")
+        if self.action in ("list", "retrieve", "bulk"):
+            queryset = queryset.prefetch_related(Prefetch("tags", queryset=Tag.objects.only("id", "name", "colour")))
+
+        queryset = queryset.defer("search_vector").order_by(*ordering)
         return queryset
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["expand"] = set(filter(None, self.request.query_params.get("expand", "").split(",")))
+        return context
+
     def paginate_queryset(self, queryset):
         if self.action == "list":
             return super().paginate_queryset(queryset)
         return None
 
+    def perform_bulk_create(self, items):
+        tag_ids = [item.pop("tags", ()) for item in items]
+        thoughts = super().perform_bulk_create(items)
+        ThoughtTag.objects.bulk_create(
+            [
+                ThoughtTag(thought=thought, tag_id=tag_id)
+                for thought, tags in zip(thoughts, tag_ids)
+                for tag_id in set(tags)
+            ]
+        )
+        self.after_bulk_write(thoughts, thoughts)
+        return thoughts
+
+    def perform_bulk_update(self, items):
+        tag_ids = {item["id"]: item.pop("tags") for item in items if "tags" in item}
+        edited = {item["id"] for item in items if "content" in item}
+        thoughts = super().perform_bulk_update(items)
+        ThoughtTag.objects.filter(thought_id__in=tag_ids).delete()
+        ThoughtTag.objects.bulk_create(
+            [
+                ThoughtTag(thought_id=thought_id, tag_id=tag_id)
+                for thought_id, tags in tag_ids.items()
+                for tag_id in set(tags)
+            ]
+        )
+        self.after_bulk_write(thoughts, [thought for thought in thoughts if thought.id in edited])
+        return thoughts
+
+    def after_bulk_write(self, thoughts, edited):
+        """Refresh the rollups that bulk writes skip the signals for, and analyse the edited thoughts in one task."""
+
+        refresh_days({(thought.owner_id, thought.created_at) for thought in thoughts})
+        if thought_ids := [str(thought.id) for thought in edited]:
+            transaction.on_commit(lambda: analyse_thoughts.delay(thought_ids))
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Stream all of the user's thoughts with their tags.
+
+        The export is NDJSON, or CSV with `?type=csv`, and is gzipped with `?gzip=true`. Thoughts are read from a
+        server-side cursor and written out a chunk at a time, so memory use stays flat however many there are. Under
+        ASGI the chunks are served by an async iterator, as Django reads a sync one into a list before sending it.
+
+        """
+
+        export_type = request.query_params.get("type", "ndjson")
+        if export_type not in self.export_types:
+            return Response({"type": f"Must be one of {', '.join(self.export_types)}."}, status.HTTP_400_BAD_REQUEST)
+        format_lines, content_type = self.export_types[export_type]
+
+        thoughts = (
+            Thought.objects.owned_by(request.user)
+            .prefetch_related(Prefetch("tags", queryset=Tag.objects.only("id", "name")))
+            .defer("search_vector", "analysis_hash")
+            .order_by("created_at", "id")
+        )
+        chunks = buffered(format_lines(export_rows(thoughts, self.export_chunk_size)))
+        filename = f"thoughts.{export_type}"
+        if request.query_params.get("gzip") == "true":
+            chunks = gzipped(chunks)
+            content_type = "application/gzip"
+            filename += ".gz"
+
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
     def perform_create(self, serializer):
-        thought = serializer.save()
-        assign_perm("view_thought", self.request.user, thought)
-        assign_perm("change_thought", self.request.user, thought)
+        serializer.save(owner=self.request.user)
+        self.bump_generations(serializer.instance)
+        schedule_analysis(serializer.instance.id)
+
+    def perform_update(self, serializer):
+        content = serializer.validated_data.get("content", serializer.instance.content)
+        content_changed = content != serializer.instance.content
+        super().perform_update(serializer)
+        if content_changed:
+            schedule_analysis(serializer.instance.id)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """Hit and miss counts for the list response caches and the thought analysis cache."""
+
+    names = (TagViewSet.cache_name, ThoughtViewSet.cache_name, "analysis")
+    return Response({name: get_cache_stats(name) for name in names})
+
+
+MOOD_TREND_BUCKETS = {
+    "day": lambda date: date,
+    "week": lambda date: date - timedelta(days=date.weekday()),
+    "month": lambda date: date.replace(day=1),
+}
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def mood_trend(request):
+    """The user's mood by day, week or month, from the daily rollups.
+
+    Reads one row per day in the range, by a range scan over the (owner, date) index, and buckets them here. Each bucket
+    starts on its first day and has the number of thoughts, the average mood, and the number of thoughts by mood and
+    by tag. Buckets with no thoughts are left out.
+
+    """
+
+    bucket = request.query_params.get("bucket", "day")
+    if bucket not in MOOD_TREND_BUCKETS:
+        raise exceptions.ValidationError({"bucket": f"Must be one of {', '.join(MOOD_TREND_BUCKETS)}."})
+
+    daily_moods = DailyMood.objects.filter(owner=request.user).order_by("date")
+    for param, lookup in (("start_date", "date__gte"), ("end_date", "date__lte")):
+        value = request.query_params.get(param, None)
+        if value:
+            date = None
+            with suppress(ValueError):
+                date = parse_date(value)
+            if date is None:
+                raise exceptions.ValidationError({param: "Must be a date in the format YYYY-MM-DD."})
+            daily_moods = daily_moods.filter(**{lookup: date})
+
+    buckets = {}
+    for daily_mood in daily_moods:
+        start = MOOD_TREND_BUCKETS[bucket](daily_mood.date)
+        if start not in buckets:
+            buckets[start] = {
+                "date": start,
+                "count": 0,
+                "mood_count": 0,
+                "mood_sum": 0,
+                "histogram": {},
+                "tag_counts": {},
+            }
+
+        totals = buckets[start]
+        totals["count"] += daily_mood.count
+        totals["mood_count"] += daily_mood.mood_count
+        totals["mood_sum"] += daily_mood.mood_sum
+        for field in ("histogram", "tag_counts"):
+            for key, count in getattr(daily_mood, field).items():
+                totals[field][key] = totals[field].get(key, 0) + count
+
+    results = []
+    for totals in buckets.values():
+        mood_sum = totals.pop("mood_sum")
+        totals["average_mood"] = mood_sum / totals["mood_count"] if totals["mood_count"] else None
+        results.append(totals)
+    return Response({"bucket": bucket, "results": results})
+
+
+def encode_watermark(timestamp):
+    return b64encode(timestamp.isoformat().encode()).decode()
+
+
+def decode_watermark(watermark):
+    """Decode a watermark issued by `sync`, raising a ValidationError if it wasn't."""
+
+    timestamp = None
+    with suppress(BinasciiError, UnicodeDecodeError, ValueError):
+        timestamp = parse_datetime(b64decode(watermark.encode(), validate=True).decode())
+    if timestamp is None or timestamp.tzinfo is None:
+        raise exceptions.ValidationError({"since": "Invalid watermark."})
+    return timestamp
+
+
+def encode_sync_cursor(watermark, *positions):
+    """A cursor to the next page of a full sync, from its watermark and the last `(updated_at, id)` of each model."""
+
+    keys = [watermark.isoformat()]
+    for position in positions:
+        keys += [position[0].isoformat(), str(position[1])] if position else ["", ""]
+    return b64encode("|".join(keys).encode()).decode()
+
+
+def decode_sync_cursor(cursor):
+    """Decode a cursor issued by `sync` into its watermark and positions, raising a ValidationError if it wasn't."""
+
+    decoded = None
+    with suppress(BinasciiError, UnicodeDecodeError, ValueError):
+        watermark, thought_at, thought_id, tag_at, tag_id = (
+            b64decode(cursor.encode(), validate=True).decode().split("|")
+        )
+        positions = [
+            (parse_datetime(updated_at), UUID(pk)) if updated_at else None
+            for updated_at, pk in ((thought_at, thought_id), (tag_at, tag_id))
+        ]
+        decoded = parse_datetime(watermark), positions
+    timestamps = [decoded[0], *(position[0] for position in decoded[1] if position)] if decoded else [None]
+    if any(timestamp is None or timestamp.tzinfo is None for timestamp in timestamps):
+        raise exceptions.ValidationError({"cursor": "Invalid cursor."})
+    return decoded
+
+
+def sync_page(queryset, position):
+    """The SYNC_PAGE_SIZE rows of `queryset` after `position`, and one more to tell whether there's another page."""
+
+    if position is not None:
+        updated_at, pk = position
+        # The leading `updated_at >= x` gives the planner a range bound on the index, the OR then breaks ties.
+        queryset = queryset.filter(updated_at__gte=updated_at).filter(Q(updated_at__gt=updated_at) | Q(id__gt=pk))
+    return list(queryset.order_by("updated_at", "id")[: settings.SYNC_PAGE_SIZE + 1])
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    """The user's thoughts and tags changed since `?since=<watermark>`, the ids of those deleted, and a new watermark.
+
+    Leave out `since` to get everything. Changes are read by range scans over the (owner, updated_at) indexes, from
+    SYNC_OVERLAP seconds before the watermark so that writes which committed late aren't missed. Clients may see a
+    change twice and should apply them idempotently. When `full` is set, because there was no watermark or it's older
+    than the tombstones, the client should replace what it has.
+
+    A full sync is sent SYNC_PAGE_SIZE thoughts and tags at a time. While `next` is set the client fetches the rest
+    with `?cursor=<next>`, and keeps the watermark once it's null. Every page carries the watermark of the first one,
+    so changes made while paging are sent again by the next sync.
+
+    """
+
+    user = request.user
+    now = timezone.now()
+    since = request.query_params.get("since", None)
+    since = decode_watermark(since) if since else None
+    cursor = request.query_params.get("cursor", None)
+    positions = [None, None]
+    if cursor:
+        now, positions = decode_sync_cursor(cursor)
+    full = bool(cursor) or since is None or since < now - timedelta(seconds=settings.SYNC_TOMBSTONE_TTL)
+
+    thoughts = (
+        Thought.objects.owned_by(user)
+        .prefetch_related(Prefetch("tags", queryset=Tag.objects.only("id")))
+        .defer("search_vector")
+        .order_by("updated_at")
+    )
+    tags = Tag.objects.owned_by(user).order_by("updated_at")
+    deleted = {"thoughts": [], "tags": []}
+    next_cursor = None
+    if full:
+        pages = [sync_page(thoughts, positions[0]), sync_page(tags, positions[1])]
+        if any(len(page) > settings.SYNC_PAGE_SIZE for page in pages):
+            pages = [page[: settings.SYNC_PAGE_SIZE] for page in pages]
+            positions = [
+                (page[-1].updated_at, page[-1].id) if page else position for page, position in zip(pages, positions)
+            ]
+            next_cursor = encode_sync_cursor(now, *positions)
+        thoughts, tags = pages
+    else:
+        start = since - timedelta(seconds=settings.SYNC_OVERLAP)
+        thoughts = thoughts.filter(updated_at__gte=start)
+        tags = tags.filter(updated_at__gte=start)
+        tombstones = Tombstone.objects.filter(owner=user, deleted_at__gte=start).order_by("deleted_at")
+        for model, object_id in tombstones.values_list("model", "object_id"):
+            deleted[f"{model}s"].append(object_id)
+
+    return Response(
+        {
+            "watermark": encode_watermark(now),
+            "full": full,
+            "next": next_cursor,
+            "thoughts": ThoughtSerializer(thoughts, many=True).data,
+            "tags": TagSerializer(tags, many=True).data,
+            "deleted": deleted,
+        }
+    )
@@ -0,0 +1,86 @@
+"""Benchmark the API and the analysis tasks against a database of seeded users.
+
+Run from the directory with manage.py, with the same environment:
+
+    python -m benchmarks --users 20 --thoughts 1000 --save-baseline baseline.json
+    python -m benchmarks --users 20 --thoughts 1000 --baseline baseline.json
+
+The benchmarks run against a test database, created and destroyed like the test suite's, using the configured cache.
+Set API_CACHE_ENABLED=1 to also measure lists served from the cache.
+Compared to a baseline, the run fails when a scenario's p95 latency or peak allocation grows by more than
+`--tolerance`, or it makes more queries. Timings only compare between runs on the same machine, so record the baseline
+where the comparison will run, e.g. on CI from the main branch.
+
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=10, help="Number of users seeded.")
+    parser.add_argument("--thoughts", type=int, default=500, help="Number of thoughts seeded for each user.")
+    parser.add_argument("--tags", type=int, default=20, help="Number of tags seeded for each user.")
+    parser.add_argument("--shares", type=int, default=50, help="Number of other users' thoughts shared with each user.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated data.")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed runs of each scenario.")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed runs of each scenario before timing it.")
+    parser.add_argument(
+        "--scenario", action="append", help="Only run the scenarios matching this glob, can be given more than once."
+    )
+    parser.add_argument("--llm-latency", type=float, default=0, help="Seconds the stubbed completions take.")
+    parser.add_argument("--baseline", type=Path, help="Compare to the results saved by an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Fraction a metric may grow by before failing.")
+    parser.add_argument("--save-baseline", type=Path, help="Save the results for later runs to compare to.")
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "continuum.settings")
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from .measure import compare, format_results
+    from .scenarios import Context, run_scenarios, stubbed
+    from thought.seeding import Seeder
+
+    baseline = json.loads(options.baseline.read_text()) if options.baseline else None
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f"Seeding {options.users} users with {options.thoughts} thoughts each...", file=sys.stderr)
+        end = date.today()
+        seeder = Seeder(end - timedelta(days=364), end, seed=options.seed, prefix="benchmark")
+        users = seeder.seed(options.users, options.thoughts, options.tags, shares=options.shares)
+        with stubbed(options.llm_latency):
+            results = run_scenarios(
+                Context(users), options.scenario or ["*"], iterations=options.iterations, warmup=options.warmup
+            )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    print(format_results(results, baseline))
+    if options.save_baseline:
+        options.save_baseline.write_text(json.dumps(results, indent=2) + "\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, options.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressions from {options.baseline}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  REGRESSED {regression}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions from {options.baseline}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
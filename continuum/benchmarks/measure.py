@@ -0,0 +1,87 @@
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def measure(run, iterations, warmup=3, reset=None):
+    """Time `iterations` calls of `run` after `warmup` untimed calls, calling `reset` untimed before each.
+
+    Queries and allocations are counted on one more call, since tracing them would slow down the timed calls. Returns
+    the latency percentiles and mean in milliseconds, the number of queries and the peak memory allocated in KiB.
+
+    """
+
+    for _ in range(warmup):
+        if reset is not None:
+            reset()
+        run()
+
+    timings = []
+    for _ in range(iterations):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    percentiles = statistics.quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentiles[49], 3),
+        "p95_ms": round(percentiles[94], 3),
+        "p99_ms": round(percentiles[98], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": len(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of each regression from `baseline`, the results of an earlier run.
+
+    A scenario regresses when its p95 latency or peak allocation grows by more than `tolerance`, a fraction, or when
+    it makes any more queries. Scenarios missing from either run are skipped.
+
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        before = baseline[name]
+        for metric in ("p95_ms", "peak_kib"):
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} went from {before[metric]} to {result[metric]}")
+        if result["queries"] > before["queries"]:
+            regressions.append(f"{name}: queries went from {before['queries']} to {result['queries']}")
+    return regressions
+
+
+def format_results(results, baseline=None):
+    """Format the results as a table, with the change in p95 from `baseline` if there is one."""
+
+    lines = [f"{'scenario':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'queries':>9}{'peak KiB':>10}"]
+    for name, result in results.items():
+        line = (
+            f"{name:<28}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+            f"{result['mean_ms']:>10.2f}{result['queries']:>9}{result['peak_kib']:>10.1f}"
+        )
+        if baseline and name in baseline and baseline[name]["p95_ms"]:
+            change = result["p95_ms"] / baseline[name]["p95_ms"] - 1
+            line += f"  p95 {change:+.0%}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,243 @@
+import asyncio
+import json
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
+from fnmatch import fnmatch
+from types import SimpleNamespace
+from unittest import mock
+
+from continuum.cache import bump_user_generation
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from thought.analysis import ANALYSIS_BATCH_INSTRUCTIONS
+from thought.llm import LLMClient, llm
+from thought.models import Tag, Thought
+from thought.tasks import analyse_thought, analyse_thoughts
+from user.auth import Auth0Authentication, forget_user
+from user.tasks import fetch_user_info
+
+from .measure import measure
+
+# Scenarios by name. Each is a function given the Context that returns a function to time, and a function to call
+# untimed before each timing or None. Scenarios that don't apply to the settings return None instead.
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+
+    return register
+
+
+class Context:
+    """The seeded users the scenarios run against. The first makes the requests, with a client logged in as them."""
+
+    def __init__(self, users):
+        """Make requests as the first of `users`."""
+
+        self.users = users
+        self.user = users[0]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.iteration = 0
+
+    def invalidate(self):
+        """Empty the user's list caches."""
+
+        bump_user_generation(self.user.pk)
+
+
+def expect(response, status_code):
+    if response.status_code != status_code:
+        raise RuntimeError(f"Expected a {status_code} but got {response.status_code}: {response.content[:200]!r}")
+    return response
+
+
+def get(client, url, params=None):
+    return lambda: expect(client.get(url, params), 200)
+
+
+class StubCompletions:
+    """Answers completions the way the analysis model does, after `latency` seconds, without calling OpenAI."""
+
+    def __init__(self, latency):
+        """Wait `latency` seconds before each answer."""
+
+        self.latency = latency
+
+    async def create(self, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        if messages[0]["content"].endswith(ANALYSIS_BATCH_INSTRUCTIONS):
+            texts = json.loads(messages[-1]["content"])["texts"]
+            content = json.dumps({"results": [{"id": text["id"], "mood": 3, "actions": []} for text in texts]})
+        else:
+            content = json.dumps({"mood": 3, "actions": []})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@contextmanager
+def stubbed(llm_latency=0):
+    """Stand in for the services outside the process, so the scenarios measure only our own code.
+
+    Analysis uses the OpenAI backend with completions answered by StubCompletions, and no rate limit. Bearer tokens are
+    accepted without checking their signature, as the sub they contain, and users' details aren't fetched from Auth0.
+    Analysis isn't queued when thoughts are saved, there's a scenario for it instead.
+
+    Yields:
+        None: While the stubs are in place.
+
+    """
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(llm_latency)))
+    with ExitStack() as stack:
+        stack.enter_context(
+            override_settings(
+                ANALYSIS_BACKEND="thought.backends.OpenAIBackend",
+                ANALYSIS_FALLBACK_BACKEND="",
+                LLM_RATE_LIMIT=1_000_000,
+                LLM_RATE_BURST=1_000_000,
+            )
+        )
+        stack.enter_context(mock.patch.object(LLMClient, "client", client))
+        stack.enter_context(
+            mock.patch.object(
+                JWTAuthentication,
+                "get_validated_token",
+                lambda self, raw_token: SimpleNamespace(payload={"sub": raw_token.decode()}),
+            )
+        )
+        stack.enter_context(mock.patch.object(fetch_user_info, "delay"))
+        stack.enter_context(mock.patch.object(analyse_thought, "apply_async"))
+        stack.callback(llm._reset)
+        llm._reset()  # Make the token bucket again with the new rate limit.
+        yield
+
+
+@scenario("thought-list")
+def thought_list(context):
+    """The first page of thoughts, with the list cache empty."""
+
+    return get(context.client, reverse("thought-list")), context.invalidate
+
+
+@scenario("thought-list-cached")
+def thought_list_cached(context):
+    """The first page of thoughts, from the list cache."""
+
+    if not settings.API_CACHE_ENABLED:
+        return None
+    return get(context.client, reverse("thought-list")), None
+
+
+@scenario("thought-list-dates")
+def thought_list_dates(context):
+    """The last month's thoughts."""
+
+    params = {"start_date": str(date.today() - timedelta(days=30)), "end_date": str(date.today())}
+    return get(context.client, reverse("thought-list"), params), context.invalidate
+
+
+@scenario("thought-list-tags")
+def thought_list_tags(context):
+    """Thoughts carrying any of two tags."""
+
+    tags = Tag.objects.filter(owner=context.user).values_list("id", flat=True)[:2]
+    params = {"tags": ",".join(map(str, tags))}
+    return get(context.client, reverse("thought-list"), params), context.invalidate
+
+
+@scenario("thought-list-cursor")
+def thought_list_cursor(context):
+    """The first page of thoughts, by keyset pagination."""
+
+    return get(context.client, reverse("thought-list"), {"pagination": "cursor"}), context.invalidate
+
+
+@scenario("thought-search")
+def thought_search(context):
+    """Thoughts matching a search."""
+
+    return get(context.client, reverse("thought-list"), {"q": "happy"}), context.invalidate
+
+
+@scenario("thought-create")
+def thought_create(context):
+    """Writing a thought."""
+
+    url = reverse("thought-list")
+    data = {"content": "Had a good walk, need to call mum", "mood": 4}
+    return lambda: expect(context.client.post(url, data, format="json"), 201), None
+
+
+@scenario("tag-list")
+def tag_list(context):
+    """The user's tags, with the list cache empty."""
+
+    return get(context.client, reverse("tag-list")), context.invalidate
+
+
+@scenario("tag-list-cached")
+def tag_list_cached(context):
+    """The user's tags, from the list cache."""
+
+    if not settings.API_CACHE_ENABLED:
+        return None
+    return get(context.client, reverse("tag-list")), None
+
+
+@scenario("auth")
+def auth(context):
+    """Authenticating a bearer token from a user who is cached."""
+
+    request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {context.user.sub}")
+    return lambda: Auth0Authentication().authenticate(request), None
+
+
+@scenario("auth-uncached")
+def auth_uncached(context):
+    """Authenticating a bearer token from a user who has to be read from the database."""
+
+    request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {context.user.sub}")
+    return lambda: Auth0Authentication().authenticate(request), lambda: forget_user(context.user.sub)
+
+
+def edit(context, thoughts):
+    """Change the content of `thoughts`, so that they're analysed again."""
+
+    context.iteration += 1
+    for thought in thoughts:
+        thought.content = f"{thought.content.split(' #')[0]} #{context.iteration}"
+    Thought.objects.bulk_update(thoughts, ["content"])
+
+
+@scenario("analyse-thought")
+def analyse_one(context):
+    """Analysing a thought, with the completion stubbed."""
+
+    thought = Thought.objects.filter(owner=context.user).first()
+    return lambda: analyse_thought(str(thought.id)), lambda: edit(context, [thought])
+
+
+@scenario("analyse-thoughts")
+def analyse_many(context):
+    """Analysing a hundred thoughts in bulk, with the completions stubbed."""
+
+    thoughts = list(Thought.objects.filter(owner=context.user)[:100])
+    thought_ids = [str(thought.id) for thought in thoughts]
+    return lambda: analyse_thoughts(thought_ids), lambda: edit(context, thoughts)
+
+
+def run_scenarios(context, patterns=("*",), iterations=50, warmup=3):
+    """Measure the scenarios with names matching any of `patterns`, returning the results by name."""
+
+    results = {}
+    for name, setup in SCENARIOS.items():
+        if any(fnmatch(name, pattern) for pattern in patterns) and (scenario := setup(context)) is not None:
+            run, reset = scenario
+            results[name] = measure(run, iterations, warmup=warmup, reset=reset)
+    return results
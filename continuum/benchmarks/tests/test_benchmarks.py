@@ -0,0 +1,73 @@
+import pytest
+from datetime import date
+from benchmarks.measure import compare, measure
+from benchmarks.scenarios import SCENARIOS, Context, run_scenarios, stubbed
+from thought.models import Thought
+from thought.seeding import Seeder
+
+
+@pytest.mark.django_db
+def test_scenarios_run(settings):
+    """Every scenario runs against seeded data and is measured."""
+
+    # Given - A few seeded users, with the list cache enabled so that every scenario applies
+    settings.API_CACHE_ENABLED = True
+    users = Seeder(date(2024, 1, 1), date(2024, 12, 31)).seed(users=2, thoughts=20, tags=3, shares=5)
+    assert Thought.objects.count() == 40
+
+    # When - The scenarios are run
+    with stubbed():
+        results = run_scenarios(Context(users), iterations=2, warmup=0)
+
+    # Then - Each one is measured
+    assert set(results) == set(SCENARIOS)
+    for result in results.values():
+        assert result["iterations"] == 2
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+    assert results["thought-list"]["queries"] > 0
+    assert results["thought-list-cached"]["queries"] == 0
+
+
+@pytest.mark.django_db
+def test_measure_resets_before_each_run():
+    """The reset runs before every call, warm up and timed."""
+
+    # Given - A scenario counting its runs and resets
+    calls = []
+
+    # When - It's measured
+    result = measure(lambda: calls.append("run"), iterations=3, warmup=1, reset=lambda: calls.append("reset"))
+
+    # Then - Each run was preceded by a reset, including the one counting queries and allocations
+    assert calls == ["reset", "run"] * 5
+    assert result["iterations"] == 3
+    assert result["queries"] == 0
+
+
+def test_compare_finds_regressions():
+    """Slower p95s, larger allocations and extra queries beyond the tolerance are regressions."""
+
+    # Given - A baseline
+    baseline = {
+        "fast": {"p95_ms": 10, "peak_kib": 100, "queries": 3},
+        "slow": {"p95_ms": 10, "peak_kib": 100, "queries": 3},
+        "removed": {"p95_ms": 10, "peak_kib": 100, "queries": 3},
+    }
+
+    # When - Results are compared to it
+    regressions = compare(
+        {
+            "fast": {"p95_ms": 11.5, "peak_kib": 90, "queries": 3},
+            "slow": {"p95_ms": 13, "peak_kib": 200, "queries": 4},
+            "added": {"p95_ms": 50, "peak_kib": 100, "queries": 3},
+        },
+        baseline,
+        tolerance=0.2,
+    )
+
+    # Then - Only the changes beyond the tolerance are regressions
+    assert regressions == [
+        "slow: p95_ms went from 10 to 13",
+        "slow: peak_kib went from 100 to 200",
+        "slow: queries went from 3 to 4",
+    ]
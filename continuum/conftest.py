@@ -0,0 +1,42 @@
+import importlib
+import pytest
+import sys
+from collections.abc import Iterator
+from django.core.cache import cache
+from django.urls import clear_url_caches
+from thought.analysis import local_analysis_cache
+from user.auth import local_user_cache
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches() -> None:
+    """Caches outlive the test database transaction, so start every test with them empty."""
+
+    cache.clear()
+    local_user_cache.clear()
+    local_analysis_cache.clear()
+
+
+def reload_urls():
+    """Build the views again, as whether reads are async is decided when the URLs are loaded."""
+
+    for module in ("api.urls", "continuum.urls"):
+        if module in sys.modules:
+            importlib.reload(sys.modules[module])
+    clear_url_caches()
+
+
+@pytest.fixture
+def _async_views(settings) -> Iterator[None]:
+    """Serve thought and tag reads from the async views.
+
+    Yields:
+        None: While the async views are routed to.
+
+    """
+
+    settings.ASYNC_VIEWS_ENABLED = True
+    reload_urls()
+    yield
+    settings.ASYNC_VIEWS_ENABLED = False
+    reload_urls()
@@ -1,10 +1,66 @@
 import logging
+import threading
+import time
+from collections import OrderedDict
 
+from django.core.cache import cache
 from django_redis.cache import RedisCache
 
+from continuum.metrics import record_cache_get
+
 logger = logging.getLogger("continuum")
 
 
+class LocalLRUCache:
+    """A small thread-safe, in-process LRU cache whose entries expire after `ttl` seconds.
+
+    Used in front of Redis for values read on nearly every request, where even a Redis round trip is worth saving.
+    Entries are private to the process, so keep the TTL short enough that staleness across workers is acceptable.
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        """Hold up to `maxsize` entries, each for `ttl` seconds unless given a TTL of its own."""
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
 class LoggingRedisCache(RedisCache):
     def get(self, key, default=None, version=None):
         """Override get method to log cache hits and misses."""
@@ -13,9 +69,11 @@ class LoggingRedisCache(RedisCache):
 
         if value == default:
             logger.debug(f"Cache miss for key: {key}")
+            record_cache_get(False)
 
         else:
             logger.debug(f"Cache hit for key: {key}")
+            record_cache_get(True)
 
         return value
 
@@ -24,3 +82,80 @@ class LoggingRedisCache(RedisCache):
 
         super().set(key, value, timeout=timeout, version=version)
         logger.debug(f"Cache set for key: {key} with timeout: {timeout}")
+
+
+def user_generation_key(user_id):
+    return f"generation:user:{user_id}"
+
+
+def get_user_generation(user_id):
+    """The current generation of a user's data, which changes whenever any of their thoughts or tags do."""
+
+    key = user_generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock rather than zero, so a counter evicted from the cache never repeats an old value.
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_user_generation(user_id):
+    """`get_user_generation` for async views."""
+
+    key = user_generation_key(user_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_user_generation(user_id):
+    """Invalidate everything cached against the user's current generation."""
+
+    if user_id is None:
+        return
+
+    key = user_generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def shared_perms_key(user_id):
+    return f"shared:user:{user_id}"
+
+
+def forget_shared_perms(user_id):
+    """Forget which permissions have objects shared with a user, after their guardian rows change."""
+
+    cache.delete(shared_perms_key(user_id))
+
+
+def record_cache_lookup(name, hit):
+    """Count a hit or miss against the cache called `name`."""
+
+    key = f"stats:{name}:{'hits' if hit else 'misses'}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+async def arecord_cache_lookup(name, hit):
+    """`record_cache_lookup` for async views."""
+
+    key = f"stats:{name}:{'hits' if hit else 'misses'}"
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=None)
+
+
+def get_cache_stats(name):
+    hits = cache.get(f"stats:{name}:hits", 0)
+    misses = cache.get(f"stats:{name}:misses", 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else None}
@@ -1,9 +1,18 @@
 import os
 
-from celery import Celery
+from celery import Celery, signals
+
+from continuum.sampling import init_sentry
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "continuum.settings")
 app = Celery("continuum")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+@signals.celeryd_init.connect
+@signals.beat_init.connect
+def setup_sentry(**kwargs):
+    # Before the worker forks its pool processes, which keep the setup.
+    init_sentry()
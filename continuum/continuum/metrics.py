@@ -0,0 +1,326 @@
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from logging import getLogger
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+logger = getLogger(__name__)
+
+# The stats of the request being handled, or None when metrics are disabled or there isn't one.
+current_stats = ContextVar("current_stats", default=None)
+
+# Upper bounds in seconds of the request duration histogram's buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Each worker's metrics are published to this Redis hash, for the endpoint to sum. Snapshots from workers that
+# haven't published for METRICS_SNAPSHOT_TTL seconds, having exited, are dropped.
+SNAPSHOTS_KEY = "metrics:snapshots"
+METRICS_SNAPSHOT_TTL = 60 * 60
+
+METRIC_HELP = {
+    "continuum_requests_total": ("counter", "Requests handled, by view, method and status."),
+    "continuum_request_duration_seconds": ("histogram", "Time to handle a request, excluding streamed bodies."),
+    "continuum_db_queries_total": ("counter", "SQL queries made."),
+    "continuum_db_duration_seconds_total": ("counter", "Time spent waiting for SQL queries."),
+    "continuum_cache_hits_total": ("counter", "Cache reads that found a value."),
+    "continuum_cache_misses_total": ("counter", "Cache reads that found nothing."),
+    "continuum_serialize_duration_seconds_total": ("counter", "Time spent serializing objects into data."),
+    "continuum_render_duration_seconds_total": ("counter", "Time spent rendering responses."),
+}
+
+
+class RequestStats:
+    """The queries, cache reads and time spent on one request."""
+
+    def __init__(self):
+        """Start timing the request."""
+
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.render_start = None
+        self.render_time = 0.0
+        self.total_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        """Count and time a query, as a `connection.execute_wrapper`."""
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def finish(self):
+        """Stop timing the request, and its rendering if that started."""
+
+        end = time.perf_counter()
+        if self.render_start is not None:
+            self.render_time = end - self.render_start
+        self.total_time = end - self.start
+
+    def server_timing(self):
+        """The stats as a Server-Timing header, in milliseconds."""
+
+        return ", ".join(
+            [
+                f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+                f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+                f"serialize;dur={self.serialize_time * 1000:.1f}",
+                f"render;dur={self.render_time * 1000:.1f}",
+                f"total;dur={self.total_time * 1000:.1f}",
+            ]
+        )
+
+
+def record_cache_get(hit):
+    """Count a cache read against the current request, if metrics are enabled."""
+
+    if (stats := current_stats.get()) is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+class TimedSerializerMixin:
+    """Counts the time a serializer spends turning objects into data towards the current request's metrics.
+
+    Only the outermost serializer is timed, so nested serializers aren't counted twice.
+
+    """
+
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+
+        stats.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializing = False
+            stats.serialize_time += time.perf_counter() - start
+
+
+class Registry:
+    """Metrics summed over the requests a worker has handled, by metric name and labels."""
+
+    def __init__(self):
+        """Start with no metrics."""
+
+        self.reset()
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self._values = {}
+        self._flusher = None
+        self.process = f"{socket.gethostname()}:{os.getpid()}"
+
+    def add(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        self._values[key] = self._values.get(key, 0) + value
+
+    def record(self, view, method, status, stats):
+        """Add a request's stats to the totals for its view."""
+
+        labels = {"view": view}
+        with self._lock:
+            self.add("continuum_requests_total", {**labels, "method": method, "status": str(status)}, 1)
+            for bound in DURATION_BUCKETS:
+                if stats.total_time <= bound:
+                    self.add("continuum_request_duration_seconds_bucket", {**labels, "le": str(bound)}, 1)
+            self.add("continuum_request_duration_seconds_bucket", {**labels, "le": "+Inf"}, 1)
+            self.add("continuum_request_duration_seconds_sum", labels, stats.total_time)
+            self.add("continuum_request_duration_seconds_count", labels, 1)
+            self.add("continuum_db_queries_total", labels, stats.queries)
+            self.add("continuum_db_duration_seconds_total", labels, stats.db_time)
+            self.add("continuum_cache_hits_total", labels, stats.cache_hits)
+            self.add("continuum_cache_misses_total", labels, stats.cache_misses)
+            self.add("continuum_serialize_duration_seconds_total", labels, stats.serialize_time)
+            self.add("continuum_render_duration_seconds_total", labels, stats.render_time)
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, dict(labels), value] for (name, labels), value in self._values.items()]
+
+    def start_flushing(self):
+        """Publish the metrics to Redis every METRICS_FLUSH_INTERVAL seconds from a thread, off the request path.
+
+        Started by the first request a worker handles, as threads started before forking don't run in the children.
+
+        """
+
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self.flush_periodically, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def flush_periodically(self):
+        # Stops once the registry is reset, which forgets this thread.
+        while self._flusher is threading.current_thread():
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to publish the metrics")
+
+    def flush(self):
+        from django_redis import get_redis_connection  # Import here, only needed when the cache is Redis.
+
+        try:
+            redis = get_redis_connection("default")
+        except NotImplementedError:
+            return
+        snapshot = {"time": time.time(), "metrics": self.snapshot()}
+        redis.hset(SNAPSHOTS_KEY, self.process, json.dumps(snapshot))
+
+    def collect(self):
+        """Sum the metrics published by every worker, or return this worker's when the cache isn't Redis."""
+
+        from django_redis import get_redis_connection  # Import here, only needed when the cache is Redis.
+
+        try:
+            redis = get_redis_connection("default")
+        except NotImplementedError:
+            return self.snapshot()
+
+        self.flush()
+        totals = Registry()
+        for process, data in redis.hgetall(SNAPSHOTS_KEY).items():
+            snapshot = json.loads(data)
+            if snapshot["time"] < time.time() - METRICS_SNAPSHOT_TTL:
+                redis.hdel(SNAPSHOTS_KEY, process)
+                continue
+            for name, labels, value in snapshot["metrics"]:
+                totals.add(name, labels, value)
+        return totals.snapshot()
+
+
+registry = Registry()
+
+# A forked child starts counting from zero, rather than counting its parent's requests again.
+os.register_at_fork(after_in_child=registry.reset)
+
+
+def format_metrics(metrics):
+    """Format metrics in the Prometheus text exposition format."""
+
+    by_family = {}
+    for name, labels, value in sorted(metrics, key=lambda metric: (metric[0], sorted(metric[1].items()))):
+        family = name.removesuffix("_bucket").removesuffix("_sum").removesuffix("_count")
+        by_family.setdefault(family if family in METRIC_HELP else name, []).append((name, labels, value))
+
+    lines = []
+    for family, samples in by_family.items():
+        kind, description = METRIC_HELP.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {description}")
+        lines.append(f"# TYPE {family} {kind}")
+        for name, labels, value in samples:
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics(request):
+    """The metrics of every worker, for Prometheus to scrape with METRICS_TOKEN as a bearer token."""
+
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise Http404()
+
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+        return HttpResponse(status=401)
+    return HttpResponse(format_metrics(registry.collect()), content_type="text/plain; version=0.0.4")
+
+
+class MetricsMiddleware:
+    """Counts the queries, cache reads and time spent on each request when METRICS_ENABLED is set.
+
+    Each response gets a Server-Timing header, which browser developer tools show alongside the request, and the stats
+    are summed by view for the metrics endpoint. When disabled the middleware removes itself, and the only cost left is
+    the cache and serializer hooks finding no request to count against.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Remove the middleware unless METRICS_ENABLED is set."""
+
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            with ExitStack() as stack:
+                self.wrap_connections(stack, stats)
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        self.record(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        stack = ExitStack()
+        try:
+            # Connections belong to a thread, and the request's queries run in its thread for synchronous code.
+            await sync_to_async(self.wrap_connections)(stack, stats)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            current_stats.reset(token)
+
+        self.record(request, response, stats)
+        return response
+
+    def wrap_connections(self, stack, stats):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats.record_query))
+
+    def record(self, request, response, stats):
+        stats.finish()
+        response["Server-Timing"] = stats.server_timing()
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        registry.record(view, request.method, response.status_code, stats)
+        registry.start_flushing()
+
+    def process_template_response(self, request, response):
+        # Called just before the response is rendered, which is all that's left of the request.
+        if (stats := current_stats.get()) is not None:
+            stats.render_start = time.perf_counter()
+        return response
@@ -0,0 +1,131 @@
+import cProfile
+import random
+import re
+import time
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from continuum.metrics import current_stats
+from continuum.sampling import PROFILE_HEADER, is_forced
+
+logger = getLogger(__name__)
+
+
+def view_name(request):
+    match = request.resolver_match
+    return match.view_name if match is not None else "unmatched"
+
+
+class SlowRequestMiddleware:
+    """Reports requests slower than SLOW_REQUEST_SECONDS to Sentry when they weren't traced.
+
+    Sentry decides whether to trace a request when it starts, before anyone knows whether it will be slow, so at low
+    sample rates most slow requests would go unseen. Each untraced slow request is sent as a warning instead, grouped
+    by view, with its timing and, when metrics are enabled, its queries. Responses with a server error status that
+    didn't come from an exception are reported the same way, exceptions are already reported as errors.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Remove the middleware unless SLOW_REQUEST_SECONDS is set."""
+
+        if not settings.SLOW_REQUEST_SECONDS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.check(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.check(request, response, time.perf_counter() - start)
+        return response
+
+    def check(self, request, response, duration):
+        slow = duration >= settings.SLOW_REQUEST_SECONDS
+        failed = response.status_code >= 500 and not getattr(request, "raised_exception", False)
+        if slow or failed:
+            import sentry_sdk  # Import here, it's slow to import and only needed once a request is slow or failed.
+
+            transaction = sentry_sdk.Hub.current.scope.transaction
+            if transaction is None or not transaction.sampled:
+                self.report(request, response, duration, "Slow" if slow else "Failed")
+
+    def process_exception(self, request, exception):
+        request.raised_exception = True
+
+    def report(self, request, response, duration, kind):
+        import sentry_sdk  # Import here, it's slow to import and only needed once a request is slow or failed.
+
+        view = view_name(request)
+        timing = {"duration_ms": round(duration * 1000, 1), "status": response.status_code, "path": request.path}
+        if (stats := current_stats.get()) is not None:
+            timing.update(queries=stats.queries, db_ms=round(stats.db_time * 1000, 1))
+
+        with sentry_sdk.push_scope() as scope:
+            scope.fingerprint = [f"{kind.lower()}-request", view]
+            scope.set_tag("view", view)
+            scope.set_context("timing", timing)
+            sentry_sdk.capture_message(f"{kind} request to {view}", level="warning")
+
+
+class ProfilingMiddleware:
+    """Profiles requests with cProfile when PROFILING_ENABLED is set, saving their stats to PROFILING_DIR.
+
+    Requests with the PROFILING_TOKEN in an X-Profile header are always profiled, and PROFILING_SAMPLE_RATE of the rest.
+    Read the files with `python -m pstats` or a viewer such as snakeviz. Streamed response bodies aren't profiled. It's
+    synchronous only, so under ASGI each request holds a thread while profiling is enabled.
+
+    """
+
+    def __init__(self, get_response):
+        """Remove the middleware unless PROFILING_ENABLED is set."""
+
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        forced = is_forced(request.headers.get(PROFILE_HEADER))
+        if not forced and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        path = self.dump(profiler, view_name(request), duration)
+        if forced:
+            response["X-Profile-File"] = path.name
+        return response
+
+    def dump(self, profiler, view, duration):
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^\w.-]+", "-", view)
+        path = directory / f"{datetime.now():%Y%m%dT%H%M%S.%f}-{slug}-{duration * 1000:.0f}ms.prof"
+        profiler.dump_stats(path)
+        logger.info(f"Saved the profile of a request to {view} to {path}")
+        return path
@@ -0,0 +1,79 @@
+import hmac
+from functools import cache
+
+from django.conf import settings
+
+# Requests with PROFILING_TOKEN in this header are always traced and profiled.
+PROFILE_HEADER = "X-Profile"
+
+
+def is_forced(value):
+    """Whether an X-Profile header value asks for the request to be profiled, which needs the PROFILING_TOKEN."""
+
+    return bool(settings.PROFILING_TOKEN and value) and hmac.compare_digest(value, settings.PROFILING_TOKEN)
+
+
+def request_from(sampling_context):
+    """The path and X-Profile header of the request a transaction is for, or None if it isn't for a request."""
+
+    if (environ := sampling_context.get("wsgi_environ")) is not None:
+        return environ.get("PATH_INFO", ""), environ.get("HTTP_X_PROFILE", "")
+    if (scope := sampling_context.get("asgi_scope")) is not None:
+        headers = dict(scope.get("headers", ()))
+        return scope.get("path", ""), headers.get(PROFILE_HEADER.lower().encode(), b"").decode("latin-1")
+    return None
+
+
+def path_sample_rate(path):
+    """The rate for the longest prefix of `path` in SENTRY_TRACES_SAMPLE_RATES, or SENTRY_TRACES_SAMPLE_RATE."""
+
+    prefixes = [prefix for prefix in settings.SENTRY_TRACES_SAMPLE_RATES if path.startswith(prefix)]
+    if not prefixes:
+        return settings.SENTRY_TRACES_SAMPLE_RATE
+    return settings.SENTRY_TRACES_SAMPLE_RATES[max(prefixes, key=len)]
+
+
+def traces_sampler(sampling_context):
+    """Sentry's `traces_sampler`, deciding the rate at which to trace a request or task.
+
+    Traces continued from another service follow its decision. Requests are traced at the rate for their path, or
+    always with the PROFILING_TOKEN in an X-Profile header, and Celery tasks at the rate for their name.
+
+    """
+
+    if (parent_sampled := sampling_context.get("parent_sampled")) is not None:
+        return float(parent_sampled)
+
+    if (job := sampling_context.get("celery_job")) is not None:
+        return settings.SENTRY_TASK_SAMPLE_RATES.get(job["task"], settings.SENTRY_TRACES_SAMPLE_RATE)
+
+    if (request := request_from(sampling_context)) is not None:
+        path, header = request
+        return 1.0 if is_forced(header) else path_sample_rate(path)
+
+    return settings.SENTRY_TRACES_SAMPLE_RATE
+
+
+def profiles_sampler(sampling_context):
+    """Sentry's `profiles_sampler`, deciding the rate at which to profile the transactions that are traced."""
+
+    if (request := request_from(sampling_context)) is not None and is_forced(request[1]):
+        return 1.0
+    return settings.SENTRY_PROFILES_SAMPLE_RATE
+
+
+@cache
+def init_sentry():
+    """Set up Sentry in this process, once, unless DEBUG is set or SENTRY_DSN is empty.
+
+    Called as web and worker processes start, rather than by the settings, so that management commands don't import or
+    start it. Processes forked afterwards keep the setup, the SDK starts its sending thread again in each of them.
+
+    """
+
+    if settings.DEBUG or not settings.SENTRY_DSN:
+        return
+
+    import sentry_sdk  # Import here, it's slow to import and only needed by web and worker processes.
+
+    sentry_sdk.init(dsn=settings.SENTRY_DSN, traces_sampler=traces_sampler, profiles_sampler=profiles_sampler)
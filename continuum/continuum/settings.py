@@ -13,9 +13,6 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from os import getenv
 from pathlib import Path
 
-import sentry_sdk
-from openai import OpenAI
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "continuum.metrics.MetricsMiddleware",
+    "continuum.profiling.SlowRequestMiddleware",
+    "continuum.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -114,6 +114,14 @@ CACHES = {
 # Time-to-live for the cache in seconds (e.g., 1 hour here)
 CACHE_TTL = 60 * 60
 
+# Serve thought and tag list responses from the cache until the user's data changes.
+API_CACHE_ENABLED = getenv("API_CACHE_ENABLED", "0") == "1"
+
+if getenv("TESTING", "0") == "1":
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -140,16 +148,27 @@ AUTH_PASSWORD_VALIDATORS = [
 AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",
     "guardian.backends.ObjectPermissionBackend",
+    "user.backends.OwnerPermissionBackend",
     # django.contrib.auth.backends.RemoteUserBackend',
 )
 
+# Thoughts and tags are owned by a single user. Guardian object permissions are only used to share them with
+# other users, disabling this skips the guardian lookup entirely.
+THOUGHT_SHARING_ENABLED = getenv("THOUGHT_SHARING_ENABLED", "1") == "1"
+
+# Sync looks for changes from SYNC_OVERLAP seconds before a client's watermark, so writes that committed late aren't
+# missed. Tombstones of deleted thoughts and tags are kept for SYNC_TOMBSTONE_TTL seconds, clients with an older
+# watermark are sent everything again, SYNC_PAGE_SIZE thoughts and tags at a time.
+SYNC_OVERLAP = 5
+SYNC_TOMBSTONE_TTL = int(getenv("SYNC_TOMBSTONE_TTL", str(60 * 60 * 24 * 90)))
+SYNC_PAGE_SIZE = int(getenv("SYNC_PAGE_SIZE", "500"))
+
 
 # Auth
 SIMPLE_JWT = {
     "ALGORITHM": "RS256",
     "AUDIENCE": "api.continuum-journal.com",
     "ISSUER": f"https://continuum.uk.auth0.com/",
-    "USER_INFO_ENDPOINT": f"https://continuum.uk.auth0.com/userinfo",
     "JWK_URL": f"https://continuum.uk.auth0.com/.well-known/jwks.json",
     "USER_ID_CLAIM": "sub",
     "USER_ID_FIELD": "sub",
@@ -157,11 +176,34 @@ SIMPLE_JWT = {
     "TOKEN_TYPE_CLAIM": None,
 }
 
+# How long an authenticated user is cached for, per process and in Redis, before it is read from the database again.
+AUTH_USER_CACHE_TTL = int(getenv("AUTH_USER_CACHE_TTL", "60"))
+
+# How long the signing keys fetched from JWK_URL are cached for before they are fetched again.
+JWKS_CACHE_TTL = int(getenv("JWKS_CACHE_TTL", str(60 * 60)))
+
+# Timeout in seconds for calls to Auth0.
+AUTH0_TIMEOUT = 5
+
+# New users' details are fetched in the background from the Auth0 Management API, with the credentials of a machine to
+# machine application allowed to read users. Without them users keep their sub as their username.
+AUTH0_MANAGEMENT_API = "https://continuum.uk.auth0.com/api/v2/"
+AUTH0_TOKEN_ENDPOINT = "https://continuum.uk.auth0.com/oauth/token"  # noqa: S105 - A URL.
+AUTH0_MANAGEMENT_CLIENT_ID = getenv("AUTH0_MANAGEMENT_CLIENT_ID", "")
+AUTH0_MANAGEMENT_CLIENT_SECRET = getenv("AUTH0_MANAGEMENT_CLIENT_SECRET", "")
+
+# How often, in seconds, to queue fetching a user's details again while their email is missing.
+USER_INFO_RETRY_SECONDS = int(getenv("USER_INFO_RETRY_SECONDS", "60"))
+
 # REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": ("user.auth.Auth0Authentication",),
 }
 
+# Serve thought and tag reads from async views, for when the app runs under an ASGI server such as uvicorn. Under WSGI
+# each request to them would need an event loop of its own, so leave this off there.
+ASYNC_VIEWS_ENABLED = getenv("ASYNC_VIEWS_ENABLED", "0") == "1"
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -233,13 +275,44 @@ LOGGING = {
     },
 }
 
-# Sentry
-if not DEBUG:
-    sentry_sdk.init(
-        dsn="https://f89e9eab93a47612114118cb9b2be922@o382306.ingest.us.sentry.io/4507040255180800",
-        traces_sample_rate=1.0,
-        profiles_sample_rate=1.0,
+# Per-request query counts, cache reads and timings, sent as Server-Timing headers and summed by view for Prometheus
+# to scrape from /internal/metrics/ with METRICS_TOKEN as a bearer token. Workers publish their sums to Redis from a
+# thread every METRICS_FLUSH_INTERVAL seconds. When disabled the middleware removes itself.
+METRICS_ENABLED = getenv("METRICS_ENABLED", "0") == "1"
+METRICS_TOKEN = getenv("METRICS_TOKEN", "")
+METRICS_FLUSH_INTERVAL = int(getenv("METRICS_FLUSH_INTERVAL", "15"))
+
+# Sentry traces SENTRY_TRACES_SAMPLE_RATE of requests and tasks, unless a rate is set for the request's path prefix or
+# the task's name, as comma separated pairs, e.g. "/api/thoughts/=0.5,/health_check/=0". SENTRY_PROFILES_SAMPLE_RATE of
+# the traced requests and tasks are profiled too. Requests with PROFILING_TOKEN in an X-Profile header are always traced
+# and profiled, and requests taking longer than SLOW_REQUEST_SECONDS are reported even when they aren't traced.
+# Sentry is set up by the WSGI and ASGI applications and the Celery workers, not here, so that management commands and
+# the tests don't pay for it. Nothing is sent when DEBUG is set or SENTRY_DSN is empty.
+SENTRY_DSN = getenv(
+    "SENTRY_DSN", "https://f89e9eab93a47612114118cb9b2be922@o382306.ingest.us.sentry.io/4507040255180800"
+)
+SENTRY_TRACES_SAMPLE_RATE = float(getenv("SENTRY_TRACES_SAMPLE_RATE", "0.1"))
+SENTRY_TRACES_SAMPLE_RATES = {
+    prefix: float(rate)
+    for prefix, _, rate in (
+        pair.partition("=")
+        for pair in getenv("SENTRY_TRACES_SAMPLE_RATES", "/health_check/=0,/version/=0,/internal/=0").split(",")
+        if pair
     )
+}
+SENTRY_TASK_SAMPLE_RATES = {
+    task: float(rate)
+    for task, _, rate in (pair.partition("=") for pair in getenv("SENTRY_TASK_SAMPLE_RATES", "").split(",") if pair)
+}
+SENTRY_PROFILES_SAMPLE_RATE = float(getenv("SENTRY_PROFILES_SAMPLE_RATE", "0.1"))
+SLOW_REQUEST_SECONDS = float(getenv("SLOW_REQUEST_SECONDS", "2"))
+
+# Profile PROFILING_SAMPLE_RATE of requests, and those with PROFILING_TOKEN in an X-Profile header, with cProfile,
+# saving the stats to PROFILING_DIR. Meant for local use, it's off unless PROFILING_ENABLED is set.
+PROFILING_ENABLED = getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_TOKEN = getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = getenv("PROFILING_DIR", str(BASE_DIR / "profiles"))
 
 
 # Email
@@ -254,8 +327,50 @@ DEFAULT_FROM_EMAIL = "report@continuum.ai"
 
 # OpenAI
 OPENAI_KEY = getenv("OPENAI_KEY")
-OPENAI_CLIENT = OpenAI(api_key=OPENAI_KEY)
+
+# The backend that analyses thoughts, and the one used instead when it fails (empty for none). The local backend is a
+# fast, deterministic stand-in for OpenAI, so the tests never make a request.
+ANALYSIS_BACKEND = getenv("ANALYSIS_BACKEND", "thought.backends.OpenAIBackend")
+ANALYSIS_FALLBACK_BACKEND = getenv("ANALYSIS_FALLBACK_BACKEND", "thought.backends.LocalBackend")
+
+if getenv("TESTING", "0") == "1":
+    ANALYSIS_BACKEND = "thought.backends.LocalBackend"
+
+# Analysis results are cached by a hash of the content and backend, so identical thoughts are only analysed once.
+ANALYSIS_CACHE_TTL = int(getenv("ANALYSIS_CACHE_TTL", str(60 * 60 * 24 * 30)))
+ANALYSIS_CACHE_MAXSIZE = int(getenv("ANALYSIS_CACHE_MAXSIZE", "4096"))
+
+# Seconds to wait after a thought is saved before analysing it, coalescing any saves made in the meantime.
+ANALYSIS_DEBOUNCE = int(getenv("ANALYSIS_DEBOUNCE", "30"))
+
+# How long past ANALYSIS_DEBOUNCE a scheduled analysis may wait in the queue before a later save schedules another. A
+# task that never runs, such as one lost with its worker, holds off new analyses of the thought for this long.
+ANALYSIS_QUEUE_GRACE = int(getenv("ANALYSIS_QUEUE_GRACE", str(10 * 60)))
+
+# How many thoughts are packed into each completion when analysing them in bulk.
+ANALYSIS_BATCH_SIZE = int(getenv("ANALYSIS_BATCH_SIZE", "20"))
+
+# Completions in flight at once per worker process, and the rate (per second) and burst allowed across all workers.
+LLM_MAX_CONCURRENCY = int(getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RATE_LIMIT = float(getenv("LLM_REQUESTS_PER_MINUTE", "500")) / 60
+LLM_RATE_BURST = int(getenv("LLM_RATE_BURST", "10"))
+
+# Completions time out after LLM_TIMEOUT seconds and are retried with exponential backoff from LLM_BACKOFF_BASE
+# seconds up to LLM_BACKOFF_MAX seconds.
+LLM_TIMEOUT = float(getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = 1
+LLM_BACKOFF_MAX = 30
 
 # Celery
 CELERY_BROKER_URL = getenv("CELERY_BROKER", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = getenv("CELERY_BROKER", "redis://redis:6379/0")
+
+# Workers run tasks in threads rather than forked processes. Analysis tasks spend their time waiting on completions,
+# and every thread shares the process's LLM client, so up to LLM_MAX_CONCURRENCY of them are in flight at once instead
+# of one per process. Each thread holds a database connection of its own.
+CELERY_WORKER_POOL = getenv("CELERY_WORKER_POOL", "threads")
+CELERY_WORKER_CONCURRENCY = int(getenv("CELERY_WORKER_CONCURRENCY", "16"))
+
+if getenv("TESTING", "0") == "1":
+    CELERY_TASK_ALWAYS_EAGER = True
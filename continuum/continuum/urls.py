@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.http import HttpResponse, JsonResponse
 from django.urls import include, path
 
+from continuum.metrics import metrics
 from continuum.version import VERSION, VERSION_NOTES
 
 
@@ -19,4 +20,5 @@ urlpatterns = [
     path("api/", include("api.urls")),
     path("health_check/", health_check),
     path("version/", version),
+    path("internal/metrics/", metrics, name="metrics"),
 ]
@@ -11,6 +11,10 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from continuum.sampling import init_sentry
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "continuum.settings")
 
 application = get_wsgi_application()
+
+init_sentry()
@@ -0,0 +1,174 @@
+import pytest
+import re
+import threading
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django_redis.cache import RedisCache
+from rest_framework.test import APIClient
+from continuum.cache import LoggingRedisCache
+from continuum.metrics import RequestStats, current_stats, registry
+from thought.tests.factories import ThoughtFactory
+
+
+@pytest.fixture
+def _metrics(settings) -> None:
+    """Enable the metrics, starting from none, with a token for the endpoint."""
+
+    settings.METRICS_ENABLED = True
+    settings.METRICS_TOKEN = "secret"  # noqa: S105 - A test token.
+    registry.reset()
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    return user_model.objects.create_user(username="user", password="password")
+
+
+@pytest.fixture
+def authenticated_client(user):
+    # Made after the settings are changed, as the middleware is loaded with the client's first request.
+    api_client = APIClient()
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+def metric(text, name, **labels):
+    """The value of the sample of metric `name` with `labels` in the endpoint's output."""
+
+    for line in text.splitlines():
+        match = re.fullmatch(re.escape(name) + r"\{(.*)\} (\S+)", line)
+        if match and dict(re.findall(r'(\w+)="([^"]*)"', match.group(1))) == labels:
+            return float(match.group(2))
+    return None
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_metrics")
+def test_server_timing(authenticated_client, user):
+    """Each response says how many queries it made and where its time went."""
+
+    # Given - Some thoughts
+    ThoughtFactory.create_batch(3, owner=user)
+
+    # When - They're listed
+    with CaptureQueriesContext(connection) as captured:
+        response = authenticated_client.get(reverse("thought-list"))
+
+    # Then - The Server-Timing header counts the queries and times each stage
+    timing = response["Server-Timing"]
+    assert f'desc="{len(captured)} queries"' in timing
+    for name in ("db", "serialize", "render", "total"):
+        assert re.search(rf"\b{name};dur=\d+\.\d", timing)
+
+
+@pytest.mark.django_db
+def test_disabled(authenticated_client, user, settings):
+    """Disabled, the middleware removes itself."""
+
+    # Given - Metrics are disabled
+    settings.METRICS_ENABLED = False
+    registry.reset()
+
+    # When - A request is made
+    response = authenticated_client.get(reverse("thought-list"))
+
+    # Then - It isn't measured
+    assert "Server-Timing" not in response
+    assert registry.snapshot() == []
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_metrics")
+def test_metrics_endpoint(authenticated_client, user):
+    """The endpoint sums the stats of the requests by view, for Prometheus."""
+
+    # Given - Two lists of thoughts
+    ThoughtFactory.create_batch(2, owner=user)
+    queries = 0
+    for _ in range(2):
+        response = authenticated_client.get(reverse("thought-list"))
+        queries += int(re.search(r'"(\d+) queries"', response["Server-Timing"]).group(1))
+
+    # When - The metrics are scraped
+    response = APIClient().get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+
+    # Then - The requests, their queries and their durations are counted by view
+    text = response.content.decode()
+    assert response.status_code == 200
+    assert metric(text, "continuum_requests_total", method="GET", status="200", view="thought-list") == 2
+    assert metric(text, "continuum_db_queries_total", view="thought-list") == queries
+    assert metric(text, "continuum_request_duration_seconds_count", view="thought-list") == 2
+    assert metric(text, "continuum_request_duration_seconds_bucket", view="thought-list", le="+Inf") == 2
+    assert metric(text, "continuum_serialize_duration_seconds_total", view="thought-list") > 0
+    assert "# TYPE continuum_request_duration_seconds histogram" in text
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_metrics")
+def test_metrics_published_off_the_request_path(authenticated_client, settings, mocker):
+    """Workers publish their metrics from a thread of their own, not while handling a request."""
+
+    # Given - Metrics published once a minute
+    settings.METRICS_FLUSH_INTERVAL = 60
+    flush = mocker.patch.object(registry, "flush")
+
+    # When - A request is made
+    authenticated_client.get(reverse("thought-list"))
+
+    # Then - The request didn't publish them, but started the thread that will
+    flush.assert_not_called()
+    assert "metrics-flush" in [thread.name for thread in threading.enumerate()]
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_metrics")
+@pytest.mark.parametrize(("token", "status_code"), [(None, 401), ("wrong", 401)])
+def test_metrics_endpoint_needs_token(token, status_code):
+    """Only Prometheus, with the token, can scrape the metrics."""
+
+    # When - The metrics are scraped without the right token
+    headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+    response = APIClient().get(reverse("metrics"), **headers)
+
+    # Then - They're refused
+    assert response.status_code == status_code
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_hidden_without_token(settings):
+    """Without a token configured, the endpoint doesn't exist."""
+
+    # Given - Metrics are enabled without a token
+    settings.METRICS_ENABLED = True
+    settings.METRICS_TOKEN = ""  # noqa: S105 - No token.
+
+    # When - The metrics are scraped
+    response = APIClient().get(reverse("metrics"))
+
+    # Then - There's nothing there
+    assert response.status_code == 404
+
+
+def test_cache_reads_are_counted(mocker):
+    """Reads from the Redis cache count as hits or misses against the current request."""
+
+    # Given - A request being measured, and a cache that has one key
+    stats = RequestStats()
+    token = current_stats.set(stats)
+    mocker.patch.object(
+        RedisCache, "get", side_effect=lambda key, default=None, version=None: 1 if key == "a" else default
+    )
+    cache = LoggingRedisCache("redis://localhost:6379/1", {})
+
+    # When - A key is read that is there, and one that isn't
+    try:
+        cache.get("a")
+        cache.get("b")
+    finally:
+        current_stats.reset(token)
+
+    # Then - There's a hit and a miss
+    assert (stats.cache_hits, stats.cache_misses) == (1, 1)
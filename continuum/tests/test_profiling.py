@@ -0,0 +1,126 @@
+import pstats
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from continuum.sampling import profiles_sampler, traces_sampler
+
+
+@pytest.fixture
+def _sampling(settings) -> None:
+    """Sample rates for a path, a task and everything else, with a token to force profiling."""
+
+    settings.PROFILING_TOKEN = "secret"  # noqa: S105 - A test token.
+    settings.SENTRY_TRACES_SAMPLE_RATE = 0.1
+    settings.SENTRY_TRACES_SAMPLE_RATES = {"/api/": 0.5, "/api/thoughts/": 0.25, "/health_check/": 0}
+    settings.SENTRY_TASK_SAMPLE_RATES = {"thought.tasks.analyse_thought": 1.0}
+    settings.SENTRY_PROFILES_SAMPLE_RATE = 0.2
+
+
+@pytest.fixture
+def user(db):
+    user_model = get_user_model()
+    return user_model.objects.create_user(username="user", password="password")
+
+
+@pytest.fixture
+def authenticated_client(user):
+    # Made after the settings are changed, as the middleware is loaded with the client's first request.
+    api_client = APIClient()
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+def wsgi(path, **headers):
+    return {"wsgi_environ": {"PATH_INFO": path, **headers}, "parent_sampled": None}
+
+
+@pytest.mark.usefixtures("_sampling")
+@pytest.mark.parametrize(
+    ("sampling_context", "rate"),
+    [
+        (wsgi("/health_check/"), 0),
+        (wsgi("/api/tags/"), 0.5),
+        (wsgi("/api/thoughts/1/"), 0.25),
+        (wsgi("/admin/"), 0.1),
+        (wsgi("/health_check/", HTTP_X_PROFILE="secret"), 1.0),
+        (wsgi("/health_check/", HTTP_X_PROFILE="wrong"), 0),
+        ({"asgi_scope": {"path": "/api/tags/", "headers": []}}, 0.5),
+        ({"asgi_scope": {"path": "/health_check/", "headers": [(b"x-profile", b"secret")]}}, 1.0),
+        ({"celery_job": {"task": "thought.tasks.analyse_thought", "args": [], "kwargs": {}}}, 1.0),
+        ({"celery_job": {"task": "thought.tasks.analyse_thoughts", "args": [], "kwargs": {}}}, 0.1),
+        ({**wsgi("/health_check/"), "parent_sampled": True}, 1.0),
+        ({**wsgi("/api/tags/"), "parent_sampled": False}, 0),
+    ],
+)
+def test_traces_sampler(sampling_context, rate):
+    """Requests are traced at the rate for their path and tasks at the rate for their name, unless forced."""
+
+    # When - The sampler decides the rate
+    # Then - It is the most specific one configured
+    assert traces_sampler(sampling_context) == rate
+
+
+@pytest.mark.usefixtures("_sampling")
+def test_profiles_sampler(settings):
+    """Traced requests are profiled at the configured rate, or always with the token."""
+
+    # When - The sampler decides the rate for requests with and without the token
+    # Then - Only the forced request is always profiled
+    assert profiles_sampler(wsgi("/api/tags/")) == 0.2
+    assert profiles_sampler(wsgi("/api/tags/", HTTP_X_PROFILE="secret")) == 1.0
+
+    # And - Nothing is forced without a token configured
+    settings.PROFILING_TOKEN = ""  # noqa: S105 - No token.
+    assert profiles_sampler(wsgi("/api/tags/", HTTP_X_PROFILE="")) == 0.2
+
+
+@pytest.mark.django_db
+def test_slow_request_reported(settings, mocker, authenticated_client):
+    """Untraced requests slower than the threshold are reported to Sentry."""
+
+    # Given - Every request counts as slow
+    settings.SLOW_REQUEST_SECONDS = 1e-9
+    capture = mocker.patch("sentry_sdk.capture_message")
+
+    # When - A request is made without being traced
+    authenticated_client.get(reverse("thought-list"))
+
+    # Then - It is reported as slow, named after its view
+    capture.assert_called_once_with("Slow request to thought-list", level="warning")
+
+
+@pytest.mark.django_db
+def test_fast_request_not_reported(settings, mocker, authenticated_client):
+    """Requests within the threshold aren't reported."""
+
+    # Given - A threshold no request reaches
+    settings.SLOW_REQUEST_SECONDS = 60
+    capture = mocker.patch("sentry_sdk.capture_message")
+
+    # When - A request is made
+    authenticated_client.get(reverse("thought-list"))
+
+    # Then - Nothing is reported
+    capture.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_profiling(settings, tmp_path, authenticated_client):
+    """Requests with the token are profiled and their stats saved."""
+
+    # Given - Profiling enabled, with no requests sampled
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_TOKEN = "secret"  # noqa: S105 - A test token.
+    settings.PROFILING_SAMPLE_RATE = 0
+    settings.PROFILING_DIR = str(tmp_path)
+
+    # When - A request is made with the token and another without
+    response = authenticated_client.get(reverse("thought-list"), HTTP_X_PROFILE="secret")
+    authenticated_client.get(reverse("thought-list"))
+
+    # Then - Only the first is profiled, with its stats saved under the file it names
+    files = list(tmp_path.iterdir())
+    assert [file.name for file in files] == [response["X-Profile-File"]]
+    assert "-thought-list-" in files[0].name
+    assert pstats.Stats(str(files[0])).total_calls > 0
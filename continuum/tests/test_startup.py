@@ -0,0 +1,52 @@
+import os
+import re
+import subprocess  # noqa: S404 - Runs the interpreter the tests run in.
+import sys
+from django.conf import settings
+
+# Slow to import and only needed by some processes, so nothing should import them while starting up.
+DEFERRED_MODULES = ("openai", "sentry_sdk")
+
+# The most time starting up may spend importing modules, about twice what it takes on a laptop, so that only large
+# regressions fail rather than slow machines.
+IMPORT_BUDGET_SECONDS = 2.0
+
+# Sets up Django and builds the request handlers, which loads the middleware, then loads the URLs.
+STARTUP = (
+    "import django; django.setup(); "
+    "from django.core.handlers.wsgi import WSGIHandler; from django.core.handlers.asgi import ASGIHandler; "
+    f"WSGIHandler(); ASGIHandler(); import {settings.ROOT_URLCONF}"
+)
+
+
+def import_times():
+    """The cumulative seconds spent importing each module while setting up Django, its handlers and the URLs."""
+
+    result = subprocess.run(  # noqa: S603 - A fixed command.
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "continuum.settings"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if match := re.fullmatch(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line):
+            cumulative, indent, module = match.groups()
+            times[module] = (int(cumulative) / 1e6, not indent)
+    return times
+
+
+def test_startup_imports():
+    """Starting up doesn't import the slow clients and stays within its import time budget."""
+
+    # When - Django and its request handlers are set up in a fresh process
+    times = import_times()
+
+    # Then - The slow clients aren't imported
+    assert not [module for module in DEFERRED_MODULES if module in times]
+
+    # And - The top level imports fit in the budget
+    total = sum(seconds for seconds, top_level in times.values() if top_level)
+    assert total < IMPORT_BUDGET_SECONDS, f"Imports took {total:.2f}s, over the {IMPORT_BUDGET_SECONDS}s budget"
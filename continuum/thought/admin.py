@@ -1,12 +1,12 @@
 from django.contrib import admin
 from guardian.admin import GuardedModelAdmin
 
-from .models import Tag, Thought
+from .models import DailyMood, Tag, Thought
 
 
 @admin.register(Tag)
 class TagAdmin(GuardedModelAdmin):
-    list_display = ["name", "colour", "description"]
+    list_display = ["name", "colour", "description", "owner"]
     search_fields = ["name"]
 
 
@@ -17,5 +17,11 @@ class ThoughtInline(admin.TabularInline):
 
 @admin.register(Thought)
 class ThoughtAdmin(GuardedModelAdmin):
-    list_display = ["content", "created_at", "updated_at"]
+    list_display = ["content", "owner", "created_at", "updated_at"]
     search_fields = ["content"]
+
+
+@admin.register(DailyMood)
+class DailyMoodAdmin(admin.ModelAdmin):
+    list_display = ["owner", "date", "count", "mood_count", "mood_sum"]
+    list_filter = ["date"]
@@ -0,0 +1,144 @@
+import json
+import re
+from hashlib import sha256
+
+from continuum.cache import LocalLRUCache, record_cache_lookup
+from django.conf import settings
+from django.core.cache import cache
+
+
+ANALYSIS_MODEL = "gpt-3.5-turbo"
+
+ANALYSIS_PROMPT = """
+Task:
+To analyse the text and return a JSON object with two keys:
+- "mood": a single number from 1 to 5 indicating the mood of the user where 1 is very unhappy and 5 is very happy.
+- "actions": a list of maximum three todo list items implied by the text, which may be empty.
+
+Only imply an action when the text points at something concrete to do, not for broad sweeping statements.
+
+# Example 1 - No actions implied.
+Text: I have had such an awful day, I got fired from my job for absolutely no reason at all.
+Response: {"mood": 1, "actions": []}
+
+# Example 2 - One action implied.
+Text: My cat just had kittens and they are the cutest things I have ever seen. I must remember to get them chipped.
+Response: {"mood": 5, "actions": ["Remember to get kittens chipped"]}
+
+# Example 3 - No action implied because it's a broad sweeping statement.
+Text: I am feeling okay, I've not had much motivation today, I think I need to get more sleep.
+Response: {"mood": 3, "actions": []}
+
+# Example 4 - One action implied, processed into concrete action.
+Text: I am feeling okay, I've not had much motivation today, I think I need to get more sleep. I read that going to bed at the same time every day can help.
+Response: {"mood": 3, "actions": ["Decide on a time to go to bed every day"]}
+
+# Example 5 - No action implied, the improvement is for some future time.
+Text: I've just learned to cook a risotto, finally. Took me long enough, it turned out okay but could definitely do with a bit more salt next time.
+Response: {"mood": 4, "actions": []}
+
+# Example 6 - Two actions implied.
+Text: Quick note to self, need to grab more butter. Also need to remember to call mum.
+Response: {"mood": 3, "actions": ["Grab more butter", "Remember to call mum"]}
+"""
+
+
+# Appended to the prompt when several thoughts are analysed in one completion.
+ANALYSIS_BATCH_INSTRUCTIONS = """
+####################
+
+You will be given several texts at once as a JSON object like {"texts": [{"id": 0, "text": "..."}]}. Analyse each
+text on its own as above and return a JSON object like {"results": [{"id": 0, "mood": 3, "actions": []}]} with one
+result for every id.
+"""
+
+
+def clean_analysis(data):
+    """Validate a single analysis into a mood and a semicolon separated string of actions.
+
+    Each half is validated on its own, so an invalid mood doesn't throw away valid actions or vice versa.
+
+    """
+
+    if not isinstance(data, dict):
+        return None, ""
+
+    mood = data.get("mood")
+    if not isinstance(mood, int) or isinstance(mood, bool) or mood < 1 or mood > 5:
+        mood = None
+
+    actions = data.get("actions")
+    if isinstance(actions, list) and all(isinstance(action, str) for action in actions):
+        # Remove all ';' characters from the actions, they are special.
+        actions = ";".join(action.replace(";", "") for action in actions[:3])
+    else:
+        actions = ""
+
+    return mood, actions
+
+
+def parse_analysis(response):
+    """Parse the model's JSON response for a single text."""
+
+    try:
+        return clean_analysis(json.loads(response.strip()))
+    except ValueError:
+        return None, ""
+
+
+def parse_batch_analysis(response):
+    """Parse the model's JSON response for several texts into a dict of analyses by id."""
+
+    try:
+        results = json.loads(response.strip()).get("results")
+    except (AttributeError, ValueError):
+        return {}
+
+    if not isinstance(results, list):
+        return {}
+
+    return {
+        data["id"]: clean_analysis(data)
+        for data in results
+        if isinstance(data, dict) and isinstance(data.get("id"), int)
+    }
+
+
+# Changes whenever the prompt does, so results cached for an old prompt are never reused.
+ANALYSIS_PROMPT_VERSION = sha256(ANALYSIS_PROMPT.encode()).hexdigest()[:12]
+
+# Results are cached in Redis, with the most recent in process in front of it.
+local_analysis_cache = LocalLRUCache(maxsize=settings.ANALYSIS_CACHE_MAXSIZE, ttl=settings.ANALYSIS_CACHE_TTL)
+
+
+def normalise_content(content):
+    """Fold the differences that don't change the analysis, such as case and whitespace."""
+
+    return re.sub(r"\s+", " ", content).strip().casefold()
+
+
+def analysis_hash(content, version):
+    """Identify the analysis of `content` by the normalised content and the version of the backend that produces it."""
+
+    key = f"{version}:{normalise_content(content)}"
+    return sha256(key.encode()).hexdigest()
+
+
+def get_cached_analysis(content_hash):
+    """Return the cached `(mood, actions)` for a content hash, or None."""
+
+    key = f"analysis:{content_hash}"
+    result = local_analysis_cache.get(key)
+    if result is None:
+        result = cache.get(key)
+        if result is not None:
+            local_analysis_cache.set(key, result)
+
+    record_cache_lookup("analysis", result is not None)
+    return result
+
+
+def set_cached_analysis(content_hash, result):
+    key = f"analysis:{content_hash}"
+    local_analysis_cache.set(key, result)
+    cache.set(key, result, timeout=settings.ANALYSIS_CACHE_TTL)
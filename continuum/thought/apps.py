@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ThoughtConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "thought"
+
+    def ready(self):
+        from . import signals  # noqa: F401 - Connects the signal receivers.
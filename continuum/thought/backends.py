@@ -0,0 +1,203 @@
+import asyncio
+import json
+import re
+from functools import lru_cache
+from hashlib import sha256
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .analysis import (
+    ANALYSIS_BATCH_INSTRUCTIONS,
+    ANALYSIS_MODEL,
+    ANALYSIS_PROMPT,
+    ANALYSIS_PROMPT_VERSION,
+    clean_analysis,
+    parse_analysis,
+    parse_batch_analysis,
+)
+from .llm import llm
+
+
+class AnalysisBackend:
+    """Extracts the mood and actions of a thought's content.
+
+    `version` identifies the results a backend gives, and changes whenever they would, so that cached results are
+    never reused across backends. Failures a backend expects, such as a remote model being down, are listed in `errors`
+    so that they can be handed to a fallback backend.
+
+    """
+
+    version = ""
+    errors = ()
+
+    def analyse(self, content):
+        """Return `(mood, actions)` for the content."""
+
+        raise NotImplementedError
+
+    def analyse_many(self, contents):
+        """Return `(mood, actions)` for each of the contents, or the error analysing it failed with."""
+
+        results = []
+        for content in contents:
+            try:
+                results.append(self.analyse(content))
+            except self.errors as error:
+                results.append(error)
+        return results
+
+
+class OpenAIBackend(AnalysisBackend):
+    """Analysis by an OpenAI chat model, packing up to ANALYSIS_BATCH_SIZE contents into each completion in bulk."""
+
+    version = f"{ANALYSIS_PROMPT_VERSION}:{ANALYSIS_MODEL}"
+
+    @property
+    def errors(self):
+        from openai import OpenAIError  # Import here, see LLMClient.client.
+
+        return (OpenAIError, asyncio.TimeoutError)
+
+    def analyse(self, content):
+        response = llm.complete(
+            [
+                {"role": "system", "content": ANALYSIS_PROMPT},
+                {"role": "user", "content": content},
+            ],
+            model=ANALYSIS_MODEL,
+            response_format={"type": "json_object"},
+        )
+        return parse_analysis(response)
+
+    def analyse_many(self, contents):
+        batches = []
+        for start in range(0, len(contents), settings.ANALYSIS_BATCH_SIZE):
+            end = start + settings.ANALYSIS_BATCH_SIZE
+            batches.append(contents[start:end])
+
+        messages_list = [
+            [
+                {"role": "system", "content": ANALYSIS_PROMPT + ANALYSIS_BATCH_INSTRUCTIONS},
+                {
+                    "role": "user",
+                    "content": json.dumps({"texts": [{"id": i, "text": text} for i, text in enumerate(batch)]}),
+                },
+            ]
+            for batch in batches
+        ]
+        responses = llm.complete_many(messages_list, model=ANALYSIS_MODEL, response_format={"type": "json_object"})
+
+        results = []
+        for batch, response in zip(batches, responses):
+            if isinstance(response, Exception):
+                results.extend(response for _ in batch)
+            else:
+                parsed = parse_batch_analysis(response)
+                # Texts the response leaves out, all of them if it doesn't parse, failed like those whose call did.
+                missing = ValueError("The response left out the text")
+                results.extend(parsed.get(i, missing) for i in range(len(batch)))
+        return results
+
+
+# Words scored from -3, very unhappy, to 3, very happy.
+MOOD_LEXICON = {
+    **dict.fromkeys(["awful", "terrible", "horrible", "miserable", "devastated", "hate", "depressed", "fired"], -3),
+    **dict.fromkeys(["sad", "upset", "angry", "lonely", "anxious", "worried", "stressed", "exhausted", "hurt"], -2),
+    **dict.fromkeys(["cry", "crying", "cried", "scared", "afraid", "frustrated", "disappointed", "sick", "ill"], -2),
+    **dict.fromkeys(["bad", "tired", "bored", "annoyed", "meh", "rough", "struggling", "unmotivated", "lost"], -1),
+    **dict.fromkeys(["okay", "fine", "calm", "relaxed", "productive", "better", "nice", "finally", "proud"], 1),
+    **dict.fromkeys(["good", "happy", "glad", "grateful", "thankful", "excited", "fun", "enjoyed", "lovely"], 2),
+    **dict.fromkeys(["love", "loved", "great", "cute", "cutest", "beautiful", "delighted", "relieved"], 2),
+    **dict.fromkeys(["amazing", "fantastic", "wonderful", "brilliant", "awesome", "perfect", "thrilled"], 3),
+}
+
+# Words that flip the score of the next few words, and words that strengthen the next word.
+NEGATIONS = {"not", "no", "never", "nothing", "hardly", "dont", "don't", "didnt", "didn't", "isnt", "isn't", "cant"}
+INTENSIFIERS = {"very", "really", "so", "extremely", "super", "incredibly", "absolutely"}
+
+WORD_PATTERN = re.compile(r"[a-z']+")
+SENTENCE_PATTERN = re.compile(r"[.!?;\n]+")
+ACTION_PATTERN = re.compile(
+    r"\b(?:need to|needs to|have to|has to|must|got to|gotta|should|remember to|don't forget to|todo:?|to do:?)\s+"
+    r"(?!(?:be|feel|have|get more|do better)\b)(.+)",
+    re.IGNORECASE,
+)
+
+
+def score_mood(content):
+    """Score the mood of the content from 1 to 5 by summing the scores of the words in MOOD_LEXICON."""
+
+    score = 0
+    negated = 0
+    intensity = 1
+    for word in WORD_PATTERN.findall(content.lower()):
+        if word in NEGATIONS:
+            negated = 3
+            continue
+        if word in INTENSIFIERS:
+            intensity = 1.5
+            continue
+
+        word_score = MOOD_LEXICON.get(word, 0) * intensity
+        score += -word_score if negated else word_score
+        negated = max(0, negated - 1)
+        intensity = 1
+
+    if score <= -4:
+        return 1
+    if score <= -1:
+        return 2
+    if score < 2:
+        return 3
+    if score < 5:
+        return 4
+    return 5
+
+
+def extract_actions(content):
+    """Return up to three actions from sentences that say something needs doing, e.g. "need to call mum"."""
+
+    actions = []
+    for sentence in SENTENCE_PATTERN.split(content):
+        match = ACTION_PATTERN.search(sentence)
+        if match:
+            action = match.group(1).strip(" ,")
+            actions.append(action[:1].upper() + action[1:])
+    return actions[:3]
+
+
+class LocalBackend(AnalysisBackend):
+    """Analysis in process, in microseconds, by a mood lexicon and rules for spotting actions.
+
+    Much cruder than a model, but fast, free and deterministic, so it suits tests, benchmarks and filling in while the
+    remote model is unavailable.
+
+    """
+
+    version = (
+        "local:"
+        + sha256(repr((MOOD_LEXICON, NEGATIONS, INTENSIFIERS, ACTION_PATTERN.pattern)).encode()).hexdigest()[:12]
+    )
+
+    def analyse(self, content):
+        return clean_analysis({"mood": score_mood(content), "actions": extract_actions(content)})
+
+
+@lru_cache
+def load_backend(path):
+    return import_string(path)()
+
+
+def get_analysis_backend():
+    """Return the backend configured by ANALYSIS_BACKEND."""
+
+    return load_backend(settings.ANALYSIS_BACKEND)
+
+
+def get_fallback_backend():
+    """Return the backend configured by ANALYSIS_FALLBACK_BACKEND, or None if there isn't one."""
+
+    if not settings.ANALYSIS_FALLBACK_BACKEND or settings.ANALYSIS_FALLBACK_BACKEND == settings.ANALYSIS_BACKEND:
+        return None
+    return load_backend(settings.ANALYSIS_FALLBACK_BACKEND)
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from logging import getLogger
+
+from django.conf import settings
+
+logger = getLogger(__name__)
+
+
+# Refill a token bucket stored in a Redis hash and take a token from it if there is one. Returns the number of
+# seconds to wait before trying again, or 0 if a token was taken. Uses the Redis server's clock so that every worker
+# agrees on the time.
+RATE_LIMIT_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'timestamp', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """A rate limit of `rate` calls per second with bursts of up to `capacity`.
+
+    The bucket is shared by every worker through Redis. When the default cache isn't Redis, as in the tests, each
+    process gets a bucket of its own instead.
+
+    """
+
+    def __init__(self, key, rate, capacity):
+        """Limit calls made under `key`."""
+
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._timestamp = time.monotonic()
+        self._lock = threading.Lock()
+        self._script = None
+
+    def take(self):
+        """Take a token, returning 0, or return how many seconds to wait before trying again."""
+
+        from django_redis import get_redis_connection  # Import here, only needed when the cache is Redis.
+
+        try:
+            redis = get_redis_connection("default")
+        except NotImplementedError:
+            return self._take_local()
+
+        if self._script is None:
+            self._script = redis.register_script(RATE_LIMIT_SCRIPT)
+        return float(self._script(keys=[self.key], args=[self.rate, self.capacity]))
+
+    async def acquire(self):
+        while (wait := await asyncio.to_thread(self.take)) > 0:
+            await asyncio.sleep(wait)
+
+    def _take_local(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._timestamp) * self.rate)
+            self._timestamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+def retryable_errors():
+    """Errors worth trying again after a pause, timeouts are a kind of connection error."""
+
+    from openai import APIConnectionError, InternalServerError, RateLimitError  # Import here, see LLMClient.client.
+
+    return (APIConnectionError, InternalServerError, RateLimitError, asyncio.TimeoutError)
+
+
+class LLMClient:
+    """Completions from OpenAI, made concurrently on an event loop that runs in a background thread.
+
+    Every thread in the process shares the loop, the client and its connection pool, so a worker can have up to
+    LLM_MAX_CONCURRENCY completions in flight. Calls are rate limited across all workers by a token bucket, time out
+    after LLM_TIMEOUT seconds and are retried LLM_MAX_RETRIES times with jittered exponential backoff.
+
+    """
+
+    def __init__(self):
+        """Start nothing until the first completion is made."""
+
+        self._reset()
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._bucket = None
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported here, as they take longer to import than the rest of the app does to start.
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(
+                api_key=settings.OPENAI_KEY,
+                max_retries=0,
+                timeout=settings.LLM_TIMEOUT,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=settings.LLM_MAX_CONCURRENCY),
+                    timeout=settings.LLM_TIMEOUT,
+                ),
+            )
+        return self._client
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        return self._semaphore
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            self._bucket = TokenBucket("llm:rate-limit", settings.LLM_RATE_LIMIT, settings.LLM_RATE_BURST)
+        return self._bucket
+
+    def complete(self, messages, **kwargs):
+        """Return the content of a single completion."""
+
+        return asyncio.run_coroutine_threadsafe(self._complete(messages, **kwargs), self.loop).result()
+
+    def complete_many(self, messages_list, **kwargs):
+        """Return the content of several completions made concurrently, or the exception each one failed with."""
+
+        async def complete_all():
+            completions = [self._complete(messages, **kwargs) for messages in messages_list]
+            return await asyncio.gather(*completions, return_exceptions=True)
+
+        return asyncio.run_coroutine_threadsafe(complete_all(), self.loop).result()
+
+    async def _complete(self, messages, **kwargs) -> str:
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            try:
+                async with self.semaphore:
+                    await self.bucket.acquire()
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(messages=messages, **kwargs), settings.LLM_TIMEOUT
+                    )
+                return response.choices[0].message.content
+            except retryable_errors() as error:
+                if attempt == settings.LLM_MAX_RETRIES:
+                    raise
+
+                # Full jitter, so workers throttled at the same moment don't all retry together. The backoff is slept
+                # outside the semaphore, so other completions can be made meanwhile.
+                delay = random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2**attempt))
+                logger.warning(f"Completion failed with {error!r}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+
+llm = LLMClient()
+
+# A forked child can't use its parent's loop thread or connections, so give it a fresh start.
+os.register_at_fork(after_in_child=llm._reset)
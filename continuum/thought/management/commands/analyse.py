@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+from thought.models import Thought
+from thought.tasks import analyse_thoughts
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyse the mood and actions of thoughts in bulk, by default only those without a mood or whose analysis "
+        "didn't succeed, such as those analysed by the fallback backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-analyse every thought, e.g. after a prompt change.")
+        parser.add_argument("--batch-size", type=int, default=100, help="Number of thoughts analysed by each task.")
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Number of batches analysed at once when running in process."
+        )
+        parser.add_argument(
+            "--enqueue", action="store_true", help="Queue the batches for the Celery workers instead of running them."
+        )
+
+    def handle(self, *args, **options):
+        """Analyse the thoughts in batches."""
+
+        if options["all"]:
+            thoughts = Thought.objects.all()
+        else:
+            # The fallback's results have a mood but no analysis hash, so that they're analysed again.
+            thoughts = Thought.objects.filter(Q(mood__isnull=True) | Q(analysis_hash=""))
+        thought_ids = [str(thought_id) for thought_id in thoughts.values_list("id", flat=True).iterator()]
+        batches = []
+        for start in range(0, len(thought_ids), options["batch_size"]):
+            end = start + options["batch_size"]
+            batches.append(thought_ids[start:end])
+        self.stdout.write(self.style.HTTP_INFO(f"Analysing {len(thought_ids)} thoughts in {len(batches)} batches..."))
+
+        if options["enqueue"]:
+            for batch in batches:
+                analyse_thoughts.delay(batch)
+            self.stdout.write(self.style.SUCCESS(f"Queued {len(batches)} batches."))
+            return
+
+        if options["concurrency"] <= 1:
+            for batch in batches:
+                analyse_thoughts(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                for _ in executor.map(self.analyse_batch, batches):
+                    pass
+
+        self.stdout.write(self.style.SUCCESS(f"Analysed {len(thought_ids)} thoughts."))
+
+    def analyse_batch(self, batch):
+        try:
+            analyse_thoughts(batch)
+        finally:
+            # Each thread has its own database connection, don't leave them open.
+            close_old_connections()
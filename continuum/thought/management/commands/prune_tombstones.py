@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from thought.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = "Delete the tombstones older than SYNC_TOMBSTONE_TTL, clients that last synced before then resync fully."
+
+    def handle(self, *args, **options):
+        """Delete the old tombstones."""
+
+        cutoff = timezone.now() - timedelta(seconds=settings.SYNC_TOMBSTONE_TTL)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstones."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from thought.models import DailyMood, Thought
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily mood rollups from every thought, e.g. after thoughts were changed without signals."
+
+    def handle(self, *args, **options):
+        """Recompute the rollup of every day with thoughts, and delete the rest."""
+
+        days = Thought.objects.filter(owner__isnull=False).order_by().values_list("owner_id", "created_at").distinct()
+        days = set(days)
+        self.stdout.write(self.style.HTTP_INFO(f"Rolling up {len(days)} days..."))
+
+        stale = [
+            daily_mood.pk
+            for daily_mood in DailyMood.objects.only("owner_id", "date")
+            if (daily_mood.owner_id, daily_mood.date) not in days
+        ]
+        DailyMood.objects.filter(pk__in=stale).delete()
+        for owner_id, date in days:
+            DailyMood.objects.refresh(owner_id, date)
+
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {len(days)} days and deleted {len(stale)} stale rollups."))
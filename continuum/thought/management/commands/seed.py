@@ -1,10 +1,11 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
 from thought.models import Tag, Thought
+from thought.seeding import Seeder
 from user.models import User
-from datetime import datetime
+from datetime import date, datetime
 from datetime import timedelta
 from random import randint, choice
-from guardian.shortcuts import assign_perm
 
 TAGS = [
     {"name": "tag_1", "description": "Description for tag_1", "colour": "rgb(185,131,137)"},
@@ -24,11 +25,31 @@ for i in range(1, 30):
 
 
 class Command(BaseCommand):
-    help = "Seed the database with initial data."
+    help = "Seed the database with initial data, or with --users, generate users with thoughts in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, help="Generate this many users in bulk instead.")
+        parser.add_argument("--thoughts", type=int, default=365, help="Number of thoughts generated for each user.")
+        parser.add_argument("--tags", type=int, default=10, help="Number of tags generated for each user.")
+        parser.add_argument("--shares", type=int, default=0, help="Number of other users' thoughts shared with each.")
+        parser.add_argument("--start", type=parse_date, help="Date of the earliest thoughts, a year ago by default.")
+        parser.add_argument("--end", type=parse_date, help="Date of the latest thoughts, today by default.")
+        parser.add_argument(
+            "--moods", default="1,1,1,1,1", help="Relative weights of moods 1 to 5, e.g. 1,2,4,3,1 for mostly okay."
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for the generated data, the same seed gives the same data."
+        )
+        parser.add_argument("--prefix", default="seed", help="Usernames are the prefix and a number, e.g. seed-0.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows inserted at a time.")
 
     def handle(self, *args, **options):
         """Seed the database with initial data."""
 
+        if options["users"] is not None:
+            self.seed_bulk(options)
+            return
+
         self.stdout.write(self.style.HTTP_INFO("Creating Users..."))
         user_admin, _ = User.objects.get_or_create(username="admin")
         user_admin.set_password("admin")
@@ -42,19 +63,45 @@ class Command(BaseCommand):
         self.stdout.write(self.style.HTTP_INFO("Creating Tags..."))
         tags = {}
         for t in TAGS:
-            tag, _ = Tag.objects.get_or_create(name=t["name"], description=t["description"], colour=t["colour"])
-            assign_perm("view_tag", henry, tag)
+            tag, _ = Tag.objects.get_or_create(
+                name=t["name"], description=t["description"], colour=t["colour"], owner=henry
+            )
             tags[tag.name] = tag
 
         self.stdout.write(self.style.HTTP_INFO("Creating Thoughts..."))
         for t in THOUGHTS.values():
-            thought, _ = Thought.objects.get_or_create(content=t["content"], mood=t["mood"])
+            thought, _ = Thought.objects.get_or_create(content=t["content"], mood=t["mood"], owner=henry)
             for tag in t["tags"]:
                 thought.tags.add(tags[tag["name"]])
 
             # Override created at.
             thought.created_at = t["created_at"]
             thought.save()
-            assign_perm("view_thought", henry, thought)
 
         self.stdout.write(self.style.SUCCESS("Successfully seeded database."))
+
+    def seed_bulk(self, options):
+        """Generate users with thoughts, tags and shares in bulk."""
+
+        end = options["end"] or date.today()
+        start = options["start"] or end - timedelta(days=364)
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+        try:
+            moods = [float(weight) for weight in options["moods"].split(",")]
+        except ValueError:
+            moods = []
+        if len(moods) != 5 or min(moods) < 0 or not sum(moods):
+            raise CommandError("--moods must be five non-negative weights, e.g. 1,2,4,3,1.")
+
+        seeder = Seeder(
+            start,
+            end,
+            mood_weights=moods,
+            seed=options["seed"],
+            prefix=options["prefix"],
+            batch_size=options["batch_size"],
+            log=lambda message: self.stdout.write(self.style.HTTP_INFO(f"{message}...")),
+        )
+        seeder.seed(options["users"], options["thoughts"], options["tags"], shares=options["shares"])
+        self.stdout.write(self.style.SUCCESS(f"Successfully seeded {options['users'] * options['thoughts']} thoughts."))
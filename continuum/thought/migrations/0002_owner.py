@@ -0,0 +1,108 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The permission that identifies the owner of each model, the first holder of it wins. Objects without a holder
+# fall back to the first user they were shared with.
+OWNER_PERMISSIONS = {"thought": "change_thought", "tag": "view_tag"}
+
+
+def backfill_owners(apps, schema_editor):
+    """Set owners from the guardian rows written when each object was created, then drop the redundant rows."""
+
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    UserObjectPermission = apps.get_model("guardian", "UserObjectPermission")
+
+    for model_name, owner_perm in OWNER_PERMISSIONS.items():
+        model = apps.get_model("thought", model_name)
+        content_type = ContentType.objects.filter(app_label="thought", model=model_name).first()
+        if content_type is None:
+            continue
+
+        owners = {}
+        rows = (
+            UserObjectPermission.objects.filter(content_type=content_type)
+            .order_by("id")
+            .values_list("object_pk", "user_id", "permission__codename")
+        )
+        for object_pk, user_id, codename in rows.iterator(chunk_size=2000):
+            current = owners.get(object_pk)
+            if current is None or (codename == owner_perm and not current[1]):
+                owners[object_pk] = (user_id, codename == owner_perm)
+
+        object_pks_by_user = {}
+        for object_pk, (user_id, _) in owners.items():
+            object_pks_by_user.setdefault(user_id, []).append(object_pk)
+
+        for user_id, object_pks in object_pks_by_user.items():
+            model.objects.filter(pk__in=object_pks, owner__isnull=True).update(owner_id=user_id)
+            UserObjectPermission.objects.filter(
+                content_type=content_type, user_id=user_id, object_pk__in=object_pks
+            ).delete()
+
+
+def restore_owner_permissions(apps, schema_editor):
+    """Recreate the guardian rows that owners were given before ownership existed."""
+
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Permission = apps.get_model("auth", "Permission")
+    UserObjectPermission = apps.get_model("guardian", "UserObjectPermission")
+
+    owner_codenames = {"thought": ["view_thought", "change_thought"], "tag": ["view_tag"]}
+    for model_name, codenames in owner_codenames.items():
+        model = apps.get_model("thought", model_name)
+        content_type = ContentType.objects.filter(app_label="thought", model=model_name).first()
+        if content_type is None:
+            continue
+
+        permissions = list(Permission.objects.filter(content_type=content_type, codename__in=codenames))
+        owned = model.objects.filter(owner__isnull=False).values_list("pk", "owner_id")
+        UserObjectPermission.objects.bulk_create(
+            [
+                UserObjectPermission(
+                    content_type=content_type, object_pk=str(pk), user_id=owner_id, permission=permission
+                )
+                for pk, owner_id in owned.iterator(chunk_size=2000)
+                for permission in permissions
+            ],
+            batch_size=2000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("guardian", "0002_generic_permissions_index"),
+        ("thought", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tag",
+            name="owner",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tags",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="thought",
+            name="owner",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="thoughts",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.RunPython(backfill_owners, restore_owner_permissions),
+    ]
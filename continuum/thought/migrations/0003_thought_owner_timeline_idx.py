@@ -0,0 +1,16 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("thought", "0002_owner"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="thought",
+            index=models.Index(fields=["owner", "-created_at", "-id"], name="thought_owner_timeline_idx"),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(fields=["search_vector"], name="thought_search_vector_idx")
+
+
+def create_search_vector(apps, schema_editor):
+    """Keep `search_vector` up to date with a trigger, backfill it and index it.
+
+    Only Postgres supports full text search, other databases keep the (unused) column so the schema matches.
+
+    """
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute(
+        """
+        CREATE TRIGGER thought_search_vector_update
+        BEFORE INSERT OR UPDATE OF content ON thought_thought
+        FOR EACH ROW EXECUTE FUNCTION
+        tsvector_update_trigger(search_vector, 'pg_catalog.english', content);
+        """
+    )
+    schema_editor.execute("UPDATE thought_thought SET search_vector = to_tsvector('pg_catalog.english', content);")
+    schema_editor.add_index(apps.get_model("thought", "Thought"), SEARCH_INDEX)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.remove_index(apps.get_model("thought", "Thought"), SEARCH_INDEX)
+    schema_editor.execute("DROP TRIGGER IF EXISTS thought_search_vector_update ON thought_thought;")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("thought", "0003_thought_owner_timeline_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thought",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name="thought", index=SEARCH_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_vector, drop_search_vector),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("thought", "0004_thought_search_vector"),
+    ]
+
+    operations = [
+        # ThoughtTag takes over the existing auto-created join table, so only the migration state changes.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="ThoughtTag",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                            ),
+                        ),
+                        ("tag", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="thought.tag")),
+                        (
+                            "thought",
+                            models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="thought.thought"),
+                        ),
+                    ],
+                    options={
+                        "db_table": "thought_thought_tags",
+                        "unique_together": {("thought", "tag")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="thought",
+                    name="tags",
+                    field=models.ManyToManyField(blank=True, through="thought.ThoughtTag", to="thought.tag"),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="thoughttag",
+            index=models.Index(fields=["tag", "thought"], name="thought_tag_thought_idx"),
+        ),
+    ]
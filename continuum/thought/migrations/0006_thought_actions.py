@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("thought", "0005_thoughttag"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thought",
+            name="actions",
+            field=models.TextField(blank=True, default=""),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("thought", "0006_thought_actions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thought",
+            name="analysis_hash",
+            field=models.CharField(blank=True, default="", editable=False, max_length=64),
+        ),
+    ]
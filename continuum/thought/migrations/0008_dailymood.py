@@ -0,0 +1,47 @@
+# Generated by Django 4.2.4 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("thought", "0007_thought_analysis_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyMood",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("mood_count", models.PositiveIntegerField(default=0)),
+                ("mood_sum", models.PositiveIntegerField(default=0)),
+                ("histogram", models.JSONField(default=dict)),
+                ("tag_counts", models.JSONField(default=dict)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_moods",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("owner", "date")},
+            },
+        ),
+    ]
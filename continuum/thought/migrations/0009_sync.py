@@ -0,0 +1,53 @@
+# Generated by Django 4.2.4 on 2026-10-18 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("thought", "0008_dailymood"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=32)),
+                ("object_id", models.UUIDField()),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="tag",
+            index=models.Index(fields=["owner", "updated_at"], name="tag_owner_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="thought",
+            index=models.Index(fields=["owner", "updated_at"], name="thought_owner_updated_idx"),
+        ),
+        migrations.AddField(
+            model_name="tombstone",
+            name="owner",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tombstones",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tombstone",
+            index=models.Index(fields=["owner", "deleted_at"], name="tombstone_owner_deleted_idx"),
+        ),
+    ]
@@ -1,6 +1,13 @@
 from uuid import uuid4
 
-from django.db import models
+from continuum.cache import shared_perms_key
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVectorField
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.utils import timezone
 
 
 MOOD_CHOICES = [
@@ -11,6 +18,98 @@ MOOD_CHOICES = [
     (5, "Very Happy"),
 ]
 
+# Text search configuration used for the stored search vector and for search queries, they must match.
+SEARCH_CONFIG = "english"
+
+# Delimit the matches in search headlines. Control characters can't be mistaken for markup in the content, which is
+# escaped before they're turned into <mark> tags.
+HEADLINE_START, HEADLINE_STOP = "\x02", "\x03"
+
+
+class OwnedQuerySet(models.QuerySet):
+    """QuerySet for models that belong to a single user and can optionally be shared."""
+
+    def owned_by(self, user):
+        return self.filter(owner=user)
+
+    def visible_to(self, user, perm, check_shared=True):
+        """Objects owned by `user`, plus any shared with them through guardian for `perm`.
+
+        Ownership is a plain indexed foreign key lookup. Guardian is only consulted for objects that
+        have been explicitly shared, so its permission table no longer grows with every object created.
+
+        With `check_shared`, guardian is only consulted if anything is shared with the user at all, per `has_shared`.
+        Most users have nothing shared, and for them every lookup is a plain owner filter rather than an OR with
+        guardian's subquery, which lists can walk in index order.
+
+        Otherwise the shared primary keys are looked up first. Postgres can only plan an OR with guardian's subquery
+        as a scan of the whole table, but an OR with a list of keys is two index lookups.
+
+        """
+        from guardian.shortcuts import get_objects_for_user  # Import here to avoid loading guardian at import.
+
+        owned = self.owned_by(user)
+        if not settings.THOUGHT_SHARING_ENABLED or (check_shared and not self.has_shared(user, perm)):
+            return owned
+        shared = get_objects_for_user(user, perm, klass=self).values_list("pk", flat=True)
+        return self.filter(Q(owner=user) | Q(pk__in=list(shared)))
+
+    def has_shared(self, user, perm):
+        """Whether any object of this model is shared with `user` for `perm`.
+
+        Cached per user until their guardian rows are saved or deleted, or for CACHE_TTL. Permissions granted through
+        a group, or rows written without signals, may take that long to be seen.
+
+        """
+        from guardian.shortcuts import get_objects_for_user  # Import here to avoid loading guardian at import.
+
+        key = shared_perms_key(user.pk)
+        shared = cache.get(key) or {}
+        if perm not in shared:
+            shared[perm] = get_objects_for_user(user, perm, klass=self.model).exists()
+            cache.set(key, shared, timeout=settings.CACHE_TTL)
+        return shared[perm]
+
+
+class ThoughtQuerySet(OwnedQuerySet):
+    def search(self, query):
+        """Thoughts matching a web search style `query`, ranked and with snippets delimiting the matches.
+
+        On Postgres this matches against the stored `search_vector` column, which a trigger keeps up to date and a
+        GIN index makes cheap to search. Other databases fall back to a plain substring match.
+
+        """
+
+        if connection.vendor != "postgresql":
+            return self.filter(content__icontains=query)
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+        return self.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F("search_vector"), search_query),
+            headline=SearchHeadline(
+                "content", search_query, config=SEARCH_CONFIG, start_sel=HEADLINE_START, stop_sel=HEADLINE_STOP
+            ),
+        )
+
+    def with_tags(self, tag_ids, match="any"):
+        """Thoughts carrying any (or, with `match="all"`, every one) of `tag_ids`.
+
+        Each condition is an EXISTS subquery against the tag index on the through table, so a thought matching
+        several tags is still returned once and the joined rows never fan out.
+
+        """
+
+        tag_ids = set(tag_ids)
+        if not tag_ids:
+            return self.none()
+
+        if match == "all":
+            conditions = [ThoughtTag.objects.filter(thought=OuterRef("pk"), tag_id=tag_id) for tag_id in tag_ids]
+        else:
+            conditions = [ThoughtTag.objects.filter(thought=OuterRef("pk"), tag_id__in=tag_ids)]
+
+        return self.filter(*[Exists(condition) for condition in conditions])
+
 
 class Tag(models.Model):
     """Tag Model."""
@@ -18,11 +117,29 @@ class Tag(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="tags",
+        db_index=False,  # Covered by the indexes below, which all start with the owner.
+    )
 
     name = models.CharField(max_length=100)
     description = models.TextField()
     colour = models.CharField(max_length=24)
 
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves sync, which looks up a user's tags changed since a watermark.
+            models.Index(fields=["owner", "updated_at"], name="tag_owner_updated_idx"),
+            # Serves the tag list, a user's tags in name order.
+            models.Index(fields=["owner", "name", "id"], name="tag_owner_name_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -34,11 +151,182 @@ class Thought(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     created_at = models.DateField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    tags = models.ManyToManyField(Tag, blank=True)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="thoughts",
+        db_index=False,  # Covered by the indexes below, which all start with the owner.
+    )
+    tags = models.ManyToManyField(Tag, blank=True, through="ThoughtTag")
 
     # Content fields.
     content = models.TextField(blank=True)
     mood = models.IntegerField(choices=MOOD_CHOICES, null=True)
+    actions = models.TextField(blank=True, default="")  # Semicolon separated todo items implied by the content.
+    analysis_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
+
+    # Search fields, maintained by a database trigger on Postgres.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ThoughtQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the timeline: a user's thoughts newest first, paged by the (created_at, id) keyset.
+            models.Index(fields=["owner", "-created_at", "-id"], name="thought_owner_timeline_idx"),
+            # Serves sync, which looks up a user's thoughts changed since a watermark.
+            models.Index(fields=["owner", "updated_at"], name="thought_owner_updated_idx"),
+            GinIndex(fields=["search_vector"], name="thought_search_vector_idx"),
+        ]
 
     def __str__(self):
         return self.content
+
+
+class ThoughtTag(models.Model):
+    """The tags on a thought, a model of its own so the join table can be indexed from the tag side."""
+
+    # Both columns are covered by the indexes below, one starting with each.
+    thought = models.ForeignKey(Thought, on_delete=models.CASCADE, db_index=False)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        db_table = "thought_thought_tags"
+        unique_together = [("thought", "tag")]
+        indexes = [
+            # Serves tag filters, which look up the thoughts carrying a tag.
+            models.Index(fields=["tag", "thought"], name="thought_tag_thought_idx"),
+        ]
+
+
+class DailyMoodQuerySet(models.QuerySet):
+    def adjust(self, owner_id, date, count=0, moods=None, tags=None):
+        """Apply changes to the rollup of a user's thoughts on a date, or recompute it if the day has no rollup yet.
+
+        `count` is the change in the number of thoughts, and `moods` and `tags` map moods and tag ids to the change in
+        the number of thoughts with them. A change to the count alone is one update. Others lock the row, so that
+        concurrent changes to its histogram and tag counts aren't lost, and cost two queries.
+
+        """
+
+        moods = {mood: change for mood, change in (moods or {}).items() if mood is not None and change}
+        tags = {str(tag_id): change for tag_id, change in (tags or {}).items() if change}
+        if owner_id is None or not (count or moods or tags):
+            return
+
+        rows = self.filter(owner_id=owner_id, date=date)
+        if not (moods or tags):
+            if not rows.update(count=F("count") + count, updated_at=timezone.now()):
+                self.refresh(owner_id, date)
+            return
+
+        with transaction.atomic():
+            daily_mood = rows.select_for_update().first()
+            if daily_mood is None:
+                self.refresh(owner_id, date)
+                return
+
+            daily_mood.count += count
+            for mood, change in moods.items():
+                daily_mood.mood_count += change
+                daily_mood.mood_sum += mood * change
+                daily_mood.histogram[str(mood)] = daily_mood.histogram.get(str(mood), 0) + change
+            for tag_id, change in tags.items():
+                if tag_count := daily_mood.tag_counts.get(tag_id, 0) + change:
+                    daily_mood.tag_counts[tag_id] = tag_count
+                else:
+                    daily_mood.tag_counts.pop(tag_id, None)
+            daily_mood.save()
+
+    def refresh(self, owner_id, date):
+        """Recompute the rollup of a user's thoughts on a date, deleting it if there are none left.
+
+        Recomputing from the day's thoughts keeps the rollup right however the thoughts changed, for changes that
+        `adjust` can't describe. It's one aggregate over the timeline index plus one over the day's tags.
+
+        """
+
+        if owner_id is None:
+            return None
+
+        thoughts = Thought.objects.filter(owner_id=owner_id, created_at=date)
+        stats = thoughts.aggregate(
+            count=Count("id"),
+            mood_count=Count("mood"),
+            mood_sum=Sum("mood", default=0),
+            **{f"mood_{mood}": Count("id", filter=Q(mood=mood)) for mood, _ in MOOD_CHOICES},
+        )
+        if not stats["count"]:
+            self.filter(owner_id=owner_id, date=date).delete()
+            return None
+
+        tag_counts = (
+            ThoughtTag.objects.filter(thought__owner_id=owner_id, thought__created_at=date)
+            .values_list("tag_id")
+            .annotate(count=Count("id"))
+        )
+        daily_mood, _ = self.update_or_create(
+            owner_id=owner_id,
+            date=date,
+            defaults={
+                "count": stats["count"],
+                "mood_count": stats["mood_count"],
+                "mood_sum": stats["mood_sum"],
+                "histogram": {str(mood): stats[f"mood_{mood}"] for mood, _ in MOOD_CHOICES},
+                "tag_counts": {str(tag_id): count for tag_id, count in tag_counts},
+            },
+        )
+        return daily_mood
+
+
+class DailyMood(models.Model):
+    """A rollup of a user's thoughts on one day, so mood trends read a row per day rather than every thought.
+
+    Kept up to date by the signals in `thought.signals` and by the analysis tasks.
+
+    """
+
+    # Covered by the unique index below, which starts with the owner.
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="daily_moods", db_index=False
+    )
+    date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    count = models.PositiveIntegerField(default=0)  # Thoughts on the day.
+    mood_count = models.PositiveIntegerField(default=0)  # Thoughts on the day with a mood.
+    mood_sum = models.PositiveIntegerField(default=0)
+    histogram = models.JSONField(default=dict)  # Number of thoughts by mood.
+    tag_counts = models.JSONField(default=dict)  # Number of thoughts by tag id.
+
+    objects = DailyMoodQuerySet.as_manager()
+
+    class Meta:
+        # Also serves mood trends, a range scan over a user's days.
+        unique_together = [("owner", "date")]
+
+    def __str__(self):
+        return f"{self.owner} on {self.date}"
+
+
+class Tombstone(models.Model):
+    """A deleted thought or tag, kept for SYNC_TOMBSTONE_TTL so that syncing clients hear about the deletion."""
+
+    # Covered by the index below, which starts with the owner.
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tombstones", db_index=False
+    )
+    model = models.CharField(max_length=32)  # The model name, "thought" or "tag".
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Serves sync, which looks up a user's deletions since a watermark.
+            models.Index(fields=["owner", "deleted_at"], name="tombstone_owner_deleted_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
@@ -0,0 +1,223 @@
+import csv
+import json
+import random
+from datetime import datetime, time, timedelta, timezone
+from io import StringIO
+from uuid import UUID
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models, transaction
+from guardian.models import UserObjectPermission
+
+from .backends import MOOD_LEXICON
+from .models import MOOD_CHOICES, DailyMood, Tag, Thought, ThoughtTag
+
+FILLER_WORDS = [
+    "today", "work", "walk", "dinner", "friends", "the", "a", "and", "was", "feeling", "after", "morning", "evening",
+    "sleep", "weekend", "run", "coffee", "meeting", "family", "book", "rain", "train", "lunch", "garden", "music",
+]  # fmt: skip
+
+# Words to write each mood with, from the local backend's lexicon, so that analysing the content roughly agrees.
+MOOD_WORDS = {
+    1: [word for word, score in MOOD_LEXICON.items() if score == -3],
+    2: [word for word, score in MOOD_LEXICON.items() if score in (-2, -1)],
+    3: ["okay", "fine", "calm"],
+    4: [word for word, score in MOOD_LEXICON.items() if score == 2],
+    5: [word for word, score in MOOD_LEXICON.items() if score == 3],
+}
+
+# Thoughts are shared from a random sample of this many, so sharing doesn't need every thought in memory.
+SHARE_POOL_SIZE = 10_000
+
+ACTIONS = ["need to call mum", "have to book the dentist", "remember to water the plants", "must reply to emails"]
+
+
+def copy_value(field, value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(field, models.JSONField):
+        return json.dumps(value)
+    return str(value)
+
+
+def insert(model, objects, batch_size):
+    """Insert `objects` with COPY on Postgres, or a raw insert elsewhere. Signals aren't sent either way.
+
+    Both save the values set on the objects, timestamps included, rather than letting `auto_now` fields fill them in.
+
+    """
+
+    # Leave out the columns the database fills in, serial ids and the search vector's trigger.
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if field.column != "search_vector" and not isinstance(field, models.fields.AutoFieldMixin)
+    ]
+    if connection.vendor != "postgresql":
+        # `raw` saves the values as set, as loaddata does. Batches are capped to the parameters SQLite allows.
+        batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, objects) or batch_size)
+        for start in range(0, len(objects), batch_size):
+            end = start + batch_size
+            model._base_manager._insert(objects[start:end], fields=fields, raw=True)
+        return
+
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    sql = f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    for start in range(0, len(objects), batch_size):
+        end = start + batch_size
+        # Strings are quoted and None isn't, which is how COPY tells an empty string from NULL.
+        buffer = StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for obj in objects[start:end]:
+            writer.writerow([copy_value(field, getattr(obj, field.attname)) for field in fields])
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+
+class Seeder:
+    """Generates users with thoughts, tags, shared thoughts and mood rollups, inserting them in batches.
+
+    Everything, ids included, is generated from `seed` and `prefix`, so the same arguments give the same data. Thoughts
+    are spread at random over the days from `start` to `end`, with moods drawn by the relative `mood_weights` of moods 1
+    to 5.
+    Rollups are worked out as the thoughts are generated rather than refreshed afterwards.
+
+    """
+
+    def __init__(self, start, end, mood_weights=(1, 1, 1, 1, 1), seed=0, prefix="seed", batch_size=5000, log=None):
+        """Seed thoughts made between the `start` and `end` dates, and users named after `prefix`."""
+
+        self.start = start
+        self.days = (end - start).days + 1
+        self.mood_weights = mood_weights
+        # Seeded by the prefix too, so that seeding more users under another prefix doesn't reuse the same ids.
+        self.randomiser = random.Random(f"{prefix}:{seed}")
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.seen = 0
+        self.pool = []
+
+    def uuid(self):
+        return UUID(int=self.randomiser.getrandbits(128), version=4)
+
+    def colour(self):
+        return "rgb({},{},{})".format(*(self.randomiser.randint(0, 255) for _ in range(3)))
+
+    def content(self, mood):
+        words = self.randomiser.choices(FILLER_WORDS, k=self.randomiser.randint(4, 40))
+        for _ in range(self.randomiser.randint(1, 3)):
+            words.insert(self.randomiser.randrange(len(words)), self.randomiser.choice(MOOD_WORDS[mood]))
+        content = " ".join(words).capitalize() + "."
+        if self.randomiser.random() < 0.2:
+            content += f" I {self.randomiser.choice(ACTIONS)}."
+        return content
+
+    def seed(self, users, thoughts, tags, shares=0):
+        """Create `users` users, each with `thoughts` thoughts and `tags` tags, and return them."""
+
+        user_model = get_user_model()
+        password = make_password(None)
+        created = [
+            user_model(username=f"{self.prefix}-{i}", sub=f"seed|{self.prefix}-{i}", password=password)
+            for i in range(users)
+        ]
+        with transaction.atomic():
+            user_model.objects.bulk_create(created, batch_size=self.batch_size)
+            self.log(f"Created {users} users")
+
+            # Users are seeded a batch at a time so that memory use doesn't grow with the number of thoughts.
+            users_per_batch = max(1, self.batch_size // max(1, thoughts))
+            for start in range(0, users, users_per_batch):
+                end = start + users_per_batch
+                self.seed_users(created[start:end], thoughts, tags)
+                self.log(f"Created {min(end, users) * thoughts} thoughts")
+
+            if shares and users > 1:
+                self.share(created, shares)
+                self.log(f"Shared {users * shares} thoughts")
+        return created
+
+    def seed_users(self, users, thoughts, tags):
+        """Seed the thoughts, tags and rollups of `users`."""
+
+        now = datetime.now(timezone.utc)
+        all_tags, all_thoughts, all_thought_tags, rollups = [], [], [], {}
+        for user in users:
+            user_tags = [
+                Tag(
+                    id=self.uuid(),
+                    owner_id=user.pk,
+                    name=f"tag {i + 1}",
+                    description=f"Description for tag {i + 1}",
+                    colour=self.colour(),
+                    created_at=now,
+                    updated_at=now,
+                )
+                for i in range(tags)
+            ]
+            all_tags.extend(user_tags)
+
+            for _ in range(thoughts):
+                mood = self.randomiser.choices(range(1, 6), weights=self.mood_weights)[0]
+                created_at = self.start + timedelta(days=self.randomiser.randrange(self.days))
+                seconds = self.randomiser.randrange(24 * 60 * 60)
+                thought = Thought(
+                    id=self.uuid(),
+                    owner_id=user.pk,
+                    content=self.content(mood),
+                    mood=mood,
+                    created_at=created_at,
+                    updated_at=datetime.combine(created_at, time(), timezone.utc) + timedelta(seconds=seconds),
+                )
+                all_thoughts.append(thought)
+                self.sample(thought)
+
+                if (user.pk, created_at) not in rollups:
+                    rollups[user.pk, created_at] = DailyMood(owner_id=user.pk, date=created_at, updated_at=now)
+                rollup = rollups[user.pk, created_at]
+                rollup.count += 1
+                rollup.mood_count += 1
+                rollup.mood_sum += mood
+                rollup.histogram[str(mood)] = rollup.histogram.get(str(mood), 0) + 1
+                for tag in self.randomiser.sample(user_tags, min(len(user_tags), self.randomiser.randint(0, 3))):
+                    all_thought_tags.append(ThoughtTag(thought_id=thought.id, tag_id=tag.id))
+                    rollup.tag_counts[str(tag.id)] = rollup.tag_counts.get(str(tag.id), 0) + 1
+
+        for rollup in rollups.values():
+            rollup.histogram = {str(mood): rollup.histogram.get(str(mood), 0) for mood, _ in MOOD_CHOICES}
+
+        insert(Tag, all_tags, self.batch_size)
+        insert(Thought, all_thoughts, self.batch_size)
+        insert(ThoughtTag, all_thought_tags, self.batch_size)
+        insert(DailyMood, list(rollups.values()), self.batch_size)
+
+    def sample(self, thought):
+        """Keep a uniform random sample of the thoughts seeded so far in `pool`, by reservoir sampling."""
+
+        self.seen += 1
+        if len(self.pool) < SHARE_POOL_SIZE:
+            self.pool.append((thought.owner_id, thought.id))
+        elif (index := self.randomiser.randrange(self.seen)) < SHARE_POOL_SIZE:
+            self.pool[index] = (thought.owner_id, thought.id)
+
+    def share(self, users, shares):
+        """Give each user view permission on up to `shares` of the other users' thoughts."""
+
+        content_type = ContentType.objects.get_for_model(Thought)
+        permission = Permission.objects.get(content_type=content_type, codename="view_thought")
+        permissions = []
+        for user in users:
+            shared = set()
+            for owner_id, thought_id in self.randomiser.sample(self.pool, min(len(self.pool), shares * 2)):
+                if owner_id != user.pk and len(shared) < shares:
+                    shared.add(thought_id)
+            permissions.extend(
+                UserObjectPermission(user=user, permission=permission, content_type=content_type, object_pk=str(pk))
+                for pk in sorted(shared)
+            )
+        UserObjectPermission.objects.bulk_create(permissions, batch_size=self.batch_size)
@@ -0,0 +1,175 @@
+import threading
+from contextlib import contextmanager
+
+from continuum.cache import forget_shared_perms
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from guardian.models import UserObjectPermission
+
+from .models import DailyMood, Tag, Thought, ThoughtTag, Tombstone
+
+
+def thought_days(thoughts):
+    """The distinct (owner, date) days of some thoughts, whose rollups they're counted in."""
+
+    return set(thoughts.order_by().values_list("owner_id", "created_at").distinct())
+
+
+# The days and tombstones waiting for `deferred_bookkeeping` to exit, per thread.
+deferred = threading.local()
+
+
+def refresh_days(days):
+    """Refresh the rollups of some (owner, date) days, now or when `deferred_bookkeeping` exits."""
+
+    pending = getattr(deferred, "days", None)
+    if pending is not None:
+        pending.update(days)
+        return
+
+    for owner_id, date in days:
+        DailyMood.objects.refresh(owner_id, date)
+
+
+def adjust_day(owner_id, date, **changes):
+    """Apply changes to the rollup of an (owner, date) day, now, or refresh it when `deferred_bookkeeping` exits."""
+
+    if getattr(deferred, "days", None) is not None:
+        deferred.days.add((owner_id, date))
+        return
+
+    DailyMood.objects.adjust(owner_id, date, **changes)
+
+
+def record_tombstones(tombstones):
+    """Save some tombstones, now or when `deferred_bookkeeping` exits."""
+
+    pending = getattr(deferred, "tombstones", None)
+    if pending is not None:
+        pending.extend(tombstones)
+        return
+
+    Tombstone.objects.bulk_create(tombstones)
+
+
+@contextmanager
+def deferred_bookkeeping():
+    """Refresh each day's rollup once and save the tombstones together on exit, rather than after every change.
+
+    For use while changing many thoughts or tags at once. Yields the set of days to refresh, which changes that skip
+    signals, like bulk_create, should add their days to.
+
+    Yields:
+        set: The (owner, date) days to refresh.
+
+    """
+
+    if getattr(deferred, "days", None) is not None:
+        yield deferred.days
+        return
+
+    deferred.days, deferred.tombstones = set(), []
+    try:
+        yield deferred.days
+        days, tombstones = deferred.days, deferred.tombstones
+    finally:
+        deferred.days = deferred.tombstones = None
+    refresh_days(days)
+    record_tombstones(tombstones)
+
+
+# The fields of a thought that its day's rollup depends on, and the names they can be saved under.
+ROLLUP_FIELDS = ("owner_id", "created_at", "mood")
+ROLLUP_FIELD_NAMES = {"owner", *ROLLUP_FIELDS}
+
+
+@receiver(pre_save, sender=Thought)
+def remember_thought_rollup(sender, instance, update_fields=None, **kwargs):
+    """Read what a thought counts as in its day's rollup before it's updated, so the rollup can be adjusted after.
+
+    Read here rather than when the thought is loaded, so that only thoughts being saved pay for it, with one lookup.
+
+    """
+
+    instance._rollup = None
+    if instance._state.adding or (update_fields is not None and not ROLLUP_FIELD_NAMES & update_fields):
+        return
+    instance._rollup = Thought.objects.filter(pk=instance.pk).values_list(*ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=Thought)
+def adjust_thought_day(sender, instance, created, **kwargs):
+    owner_id, date, mood = (getattr(instance, field) for field in ROLLUP_FIELDS)
+    if created:
+        adjust_day(owner_id, date, count=1, moods={mood: 1})
+        return
+
+    rollup, instance._rollup = getattr(instance, "_rollup", None), None
+    if rollup is None:
+        return
+
+    old_owner_id, old_date, old_mood = rollup
+    if (old_owner_id, old_date) != (owner_id, date):
+        # The thought moved to another owner or date, taking its tags with it.
+        refresh_days([(old_owner_id, old_date), (owner_id, date)])
+    elif old_mood != mood:
+        adjust_day(owner_id, date, moods={old_mood: -1, mood: 1})
+
+
+@receiver(post_delete, sender=Thought)
+def refresh_deleted_thought_day(sender, instance, **kwargs):
+    refresh_days([(instance.owner_id, instance.created_at)])
+
+
+@receiver(post_delete, sender=Thought)
+@receiver(post_delete, sender=Tag)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    """Remember deleted thoughts and tags, so that syncing clients can delete them too.
+
+    Nothing is remembered when the deletion cascaded from the owner, whose tombstones are going with them.
+
+    """
+
+    origin_model = getattr(origin, "model", type(origin))
+    if instance.owner_id is None or origin_model is not sender:
+        return
+
+    record_tombstones([Tombstone(owner_id=instance.owner_id, model=sender._meta.model_name, object_id=instance.pk)])
+
+
+@receiver(m2m_changed, sender=ThoughtTag)
+def refresh_tagged_days(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # Tags added are always new to the thought, but those removed may not have been on it, so removals refresh.
+        if action == "post_add":
+            adjust_day(instance.owner_id, instance.created_at, tags=dict.fromkeys(pk_set, 1))
+        elif action in ("post_remove", "post_clear"):
+            refresh_days([(instance.owner_id, instance.created_at)])
+        return
+
+    # Changed from the tag's side, so any number of days may be affected. A clear has to look them up before the
+    # thoughts lose the tag.
+    if action == "pre_clear":
+        instance._tagged_days = thought_days(Thought.objects.filter(tags=instance))
+    elif action == "post_clear":
+        refresh_days(getattr(instance, "_tagged_days", ()))
+    elif action in ("post_add", "post_remove"):
+        refresh_days(thought_days(Thought.objects.filter(pk__in=pk_set)))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_days(sender, instance, **kwargs):
+    instance._tagged_days = thought_days(Thought.objects.filter(tags=instance))
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_untagged_days(sender, instance, **kwargs):
+    refresh_days(getattr(instance, "_tagged_days", ()))
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+def forget_user_shares(sender, instance, **kwargs):
+    """Objects were shared with or unshared from a user, so check their shares again on their next lookup."""
+
+    forget_shared_perms(instance.user_id)
@@ -1,126 +1,185 @@
-import time
-
 from celery import shared_task
+from continuum.cache import bump_user_generation, record_cache_lookup
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
 from logging import getLogger
-import json
+
+from .analysis import analysis_hash, get_cached_analysis, set_cached_analysis
+from .backends import get_analysis_backend, get_fallback_backend
 
 logger = getLogger(__name__)
 
 
+def analysis_schedule_key(thought_id):
+    return f"analysis:scheduled:{thought_id}"
+
+
+def schedule_analysis(thought_id):
+    """Analyse a thought ANALYSIS_DEBOUNCE seconds after the current transaction commits.
+
+    Saves made while an analysis is scheduled are coalesced into it, since it reads the thought's content when it runs,
+    so a client autosaving every few seconds costs one analysis per window rather than one per save. The task clears
+    the key when it starts, which may be well after the countdown when the queue is backed up, so the key is kept for
+    ANALYSIS_QUEUE_GRACE longer.
+
+    """
+
+    def schedule():
+        timeout = settings.ANALYSIS_DEBOUNCE + settings.ANALYSIS_QUEUE_GRACE
+        if cache.add(analysis_schedule_key(thought_id), True, timeout=timeout):
+            analyse_thought.apply_async((str(thought_id),), countdown=settings.ANALYSIS_DEBOUNCE)
+
+    transaction.on_commit(schedule)
+
+
 @shared_task
-def extract_mood(thought_id):
-    from .models import Thought  # Import here to avoid circular imports
-
-    thought = Thought.objects.get(id=thought_id)
-    response = settings.OPENAI_CLIENT.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": """
-Task:
-To analyse the text and return a single number from 1 to 5 indicating the mood of the user where 1 is very unhappy and 5 is very happy.
-
-# Example 1
-Text: I have had such an awful day, I got fired from my job for absolutely no reason at all.
-Response: 1
-
-# Example 2
-Text: My cat just had kittens and they are the cutest things I have ever seen.
-Response: 5
-
-# Example 3
-Text: I am feeling okay, I've not had much motivation today, I think I need to get more sleep.
-Response: 3
-
-# Example 4
-Text: I've just learned to cook a risotto, finally. Took me long enough, it turned out okay but could definitely do with a bit more salt next time.
-Response: 4
-
-####################
-
-Text: {content}
-Response:
-""",
-            },
-            {
-                "role": "user",
-                "content": thought.content,
-            },
-        ],
+def analyse_thought(thought_id):
+    """Extract the mood and actions of a thought with the analysis backend.
+
+    The backend is skipped when the thought hasn't changed since it was last analysed, or when identical content has
+    been analysed before. If the backend fails, the fallback backend's analysis is saved but not remembered, so the
+    thought is analysed properly next time.
+
+    """
+
+    from .models import DailyMood, Thought  # Import here to avoid circular imports
+
+    # Saves from now on aren't covered by this analysis, so let them schedule another.
+    cache.delete(analysis_schedule_key(thought_id))
+
+    thought = Thought.objects.filter(id=thought_id).defer("search_vector").first()
+    if thought is None:
+        logger.info(f"Thought {thought_id} was deleted before it was analysed")
+        return
+
+    backend = get_analysis_backend()
+    content_hash = analysis_hash(thought.content, backend.version)
+    if thought.analysis_hash == content_hash:
+        record_cache_lookup("analysis", True)
+        logger.info(f"Thought {thought_id} is unchanged since it was last analysed")
+        return
+
+    result = get_cached_analysis(content_hash)
+    if result is None:
+        try:
+            result = backend.analyse(thought.content)
+        except backend.errors as error:
+            if (fallback := get_fallback_backend()) is None:
+                raise
+            logger.warning(f"Analysis of thought {thought_id} failed with {error!r}, falling back")
+            result = fallback.analyse(thought.content)
+            content_hash = ""
+        if content_hash and result[0] is not None:
+            set_cached_analysis(content_hash, result)
+
+    mood, actions = result
+    # Only write the analysis if the content is still what was analysed, otherwise the edit has scheduled another.
+    # Only the analysis fields are written, so edits made in the meantime aren't overwritten.
+    updated = Thought.objects.filter(id=thought.id, content=thought.content).update(
+        mood=mood,
+        actions=actions,
+        # Only remember the content as analysed when it worked, so it's retried next time.
+        analysis_hash=content_hash if mood is not None else "",
+        updated_at=timezone.now(),
     )
-    try:
-        response = response.choices[0].message.content
-        mood = int(response.strip())
-        if mood < 1 or mood > 5:
-            raise ValueError("Mood must be between 1 and 5.")
-    except ValueError:
-        mood = None
-    thought.mood = mood
-    thought.save()
-    logger.info(f"Extracted mood {mood} for thought {thought_id}")
+    if not updated:
+        logger.info(f"Thought {thought_id} changed while it was analysed, dropping the stale analysis")
+        return
+
+    DailyMood.objects.refresh(thought.owner_id, thought.created_at)
+    bump_user_generation(thought.owner_id)
+    logger.info(f"Extracted mood {mood} and actions for thought {thought_id}")
+
+
+@shared_task
+def analyse_thoughts(thought_ids):
+    """Extract the mood and actions of many thoughts with one call to the analysis backend.
+
+    The thoughts are loaded in one query and written back with one bulk update. Like `analyse_thought`, unchanged
+    thoughts and content that has been analysed before are skipped, identical content is only analysed once, and
+    content the backend fails on is analysed by the fallback backend instead. Without a fallback those thoughts are
+    left as they are, to be analysed again. Thoughts edited while they were analysed are left for the edit's own
+    analysis. Only thoughts whose analysis changed have their `updated_at` bumped.
+
+    """
+
+    from .models import DailyMood, Thought  # Import here to avoid circular imports
+
+    backend = get_analysis_backend()
+    thoughts_by_hash = {}
+    for thought in Thought.objects.filter(id__in=thought_ids).defer("search_vector"):
+        content_hash = analysis_hash(thought.content, backend.version)
+        if thought.analysis_hash == content_hash:
+            record_cache_lookup("analysis", True)
+        else:
+            thoughts_by_hash.setdefault(content_hash, []).append(thought)
+
+    results = {}
+    for content_hash in thoughts_by_hash:
+        if (result := get_cached_analysis(content_hash)) is not None:
+            results[content_hash] = result
+
+    uncached = [content_hash for content_hash in thoughts_by_hash if content_hash not in results]
+    contents = [thoughts_by_hash[content_hash][0].content for content_hash in uncached]
+    failed = {}
+    fallback = get_fallback_backend()
+    for content_hash, content, result in zip(uncached, contents, backend.analyse_many(contents)):
+        if isinstance(result, Exception):
+            failed[content_hash] = result
+            if fallback is None:
+                continue
+            result = fallback.analyse(content)
+        elif result[0] is not None:
+            set_cached_analysis(content_hash, result)
+        results[content_hash] = result
+
+    # Thoughts whose analysis changed are written with a new `updated_at`. Those that only need marking as analysed
+    # aren't, so clients syncing or revalidating them don't fetch them again for nothing.
+    now = timezone.now()
+    updated, analysed = [], []
+    for content_hash, (mood, actions) in results.items():
+        new_hash = content_hash if mood is not None and content_hash not in failed else ""
+        for thought in thoughts_by_hash[content_hash]:
+            if (thought.mood, thought.actions) != (mood, actions):
+                thought.mood, thought.actions, thought.analysis_hash, thought.updated_at = mood, actions, new_hash, now
+                updated.append(thought)
+            elif thought.analysis_hash != new_hash:
+                thought.analysis_hash = new_hash
+                analysed.append(thought)
+
+    with transaction.atomic():
+        # Like `analyse_thought`, only write the analysis if the content is still what was analysed, otherwise the edit
+        # has scheduled another. The rows are locked so that they can't be edited between checking and writing.
+        ids = [thought.id for thought in updated + analysed]
+        current = dict(Thought.objects.select_for_update().filter(id__in=ids).values_list("id", "content"))
+        stale = {thought.id for thought in updated + analysed if current.get(thought.id) != thought.content}
+        updated = [thought for thought in updated if thought.id not in stale]
+        analysed = [thought for thought in analysed if thought.id not in stale]
+        Thought.objects.bulk_update(updated, ["mood", "actions", "analysis_hash", "updated_at"], batch_size=500)
+        Thought.objects.bulk_update(analysed, ["analysis_hash"], batch_size=500)
+    if stale:
+        logger.info(f"{len(stale)} thoughts changed while they were analysed, dropping their stale analyses")
+    for owner_id, date in {(thought.owner_id, thought.created_at) for thought in updated}:
+        DailyMood.objects.refresh(owner_id, date)
+    for owner_id in {thought.owner_id for thought in updated}:
+        bump_user_generation(owner_id)
+    if failed:
+        outcome = "falling back" if fallback is not None else "leaving them to be analysed again"
+        logger.warning(f"Analysis of {len(failed)} texts failed with {set(map(repr, failed.values()))}, {outcome}")
+    logger.info(f"Extracted mood and actions for {len(updated)} of {len(thought_ids)} thoughts")
+
+
+@shared_task
+def extract_mood(thought_id):
+    """Kept for tasks already queued, the mood is now extracted together with the actions."""
+
+    analyse_thought(thought_id)
 
 
 @shared_task
 def extract_actions(thought_id):
-    from .models import Thought
-
-    thought = Thought.objects.get(id=thought_id)
-    response = settings.OPENAI_CLIENT.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": """
-Task:
-To analyse the text and return a list of maximum three todo list items implied by the text, in JSON format.
-
-# Example 1 - No actions implied.
-Text: I have had such an awful day, I got fired from my job for absolutely no reason at all.
-Response: []
-
-# Example 2 - One action implied.
-Text: My cat just had kittens and they are the cutest things I have ever seen. I must remember to get them chipped.
-Response: ["Remember to get kittens chipped"]
-
-# Example 3 - No action implied because it's a broad sweeping statement.
-Text: I am feeling okay, I've not had much motivation today, I think I need to get more sleep.
-Response: []
-
-# Example 4 - One action implied, processed into concrete action.
-Text: I am feeling okay, I've not had much motivation today, I think I need to get more sleep. I read that going to bed at the same time every day can help.
-Response: ["Decided on a time to go to bed every day."]
-
-# Example 5 - Two actions implied.
-Text: Quick note to self, need to grab more butter. Also need to remember to call mum.
-Response: ["Grab more butter", "Remember to call mum"]
-
-####################
-
-Text: {content}
-Response:
-""",
-            },
-            {
-                "role": "user",
-                "content": thought.content,
-            },
-        ],
-    )
-    try:
-        response = response.choices[0].message.content
-        json_data = json.loads(response.strip())
-
-        # Validate that the response is a list of strings
-        if not all(isinstance(action, str) for action in json_data):
-            raise ValueError("Response must be a list of strings.")
-
-        # Remove all ';' characters from the actions, they are special.
-        actions = [action.replace(";", "") for action in json_data]
-        actions = ";".join(actions)
-    except ValueError:
-        actions = ""
-    thought.actions = actions
-    thought.save()
-    logger.info(f"Extracted actions for thought {thought_id}")
+    """Kept for tasks already queued, the actions are now extracted together with the mood."""
+
+    analyse_thought(thought_id)
@@ -0,0 +1,61 @@
+import pytest
+from thought.backends import LocalBackend, OpenAIBackend, get_analysis_backend, get_fallback_backend
+
+
+@pytest.mark.parametrize(
+    ("content", "mood", "actions"),
+    [
+        ("I have had such an awful day, I got fired from my job for absolutely no reason at all.", 1, ""),
+        ("I am feeling okay, I've not had much motivation today.", 3, ""),
+        ("I'm not happy about the rain.", 2, ""),
+        (
+            "Really good day. Need to grab more butter. Also need to remember to call mum.",
+            4,
+            "Grab more butter;Remember to call mum",
+        ),
+        (
+            "My cat just had kittens, they are the cutest, most wonderful things. I must get them chipped!",
+            5,
+            "Get them chipped",
+        ),
+        ("I think I need to get more sleep.", 3, ""),
+    ],
+)
+def test_local_backend(content, mood, actions):
+    """The local backend scores the mood from a lexicon and finds actions in sentences saying what needs doing."""
+
+    # When - The content is analysed
+    result = LocalBackend().analyse(content)
+
+    # Then - The mood and actions are as expected
+    assert result == (mood, actions)
+
+
+def test_local_backend_many():
+    """The local backend analyses many contents in order."""
+
+    # When - Several contents are analysed
+    results = LocalBackend().analyse_many(["Awful.", "Fantastic!", ""])
+
+    # Then - There is a result for each
+    assert results == [(2, ""), (4, ""), (3, "")]
+
+
+def test_get_backends(settings):
+    """The backends are chosen by settings, and there is no fallback to the backend itself."""
+
+    # Given - OpenAI falling back to the local backend
+    settings.ANALYSIS_BACKEND = "thought.backends.OpenAIBackend"
+    settings.ANALYSIS_FALLBACK_BACKEND = "thought.backends.LocalBackend"
+
+    # Then - Both are loaded, once
+    assert isinstance(get_analysis_backend(), OpenAIBackend)
+    assert isinstance(get_fallback_backend(), LocalBackend)
+    assert get_fallback_backend() is get_fallback_backend()
+
+    # When - The local backend is used on its own
+    settings.ANALYSIS_BACKEND = "thought.backends.LocalBackend"
+
+    # Then - There is no fallback
+    assert get_fallback_backend() is None
+    assert OpenAIBackend.version != LocalBackend.version
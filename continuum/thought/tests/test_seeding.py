@@ -0,0 +1,104 @@
+import pytest
+from datetime import date
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from guardian.models import UserObjectPermission
+from thought.models import DailyMood, Thought, ThoughtTag
+from thought.seeding import Seeder
+
+
+def seeded_data():
+    thoughts = Thought.objects.order_by("id").values_list("id", "owner__username", "content", "mood", "created_at")
+    return list(thoughts), list(ThoughtTag.objects.order_by("thought_id", "tag_id").values_list("thought_id", "tag_id"))
+
+
+@pytest.mark.django_db
+def test_seed_in_bulk(django_assert_max_num_queries):
+    """Users, thoughts, tags, shares and rollups are inserted in batches, not a query per row."""
+
+    # When - Users are seeded in bulk
+    with django_assert_max_num_queries(40):
+        call_command(
+            "seed",
+            users=4,
+            thoughts=50,
+            tags=5,
+            shares=3,
+            start=date(2024, 1, 1),
+            end=date(2024, 1, 31),
+            stdout=StringIO(),
+        )
+
+    # Then - Each user has their thoughts within the dates, and shares of other users' thoughts
+    assert Thought.objects.count() == 200
+    assert set(Thought.objects.values_list("owner__username", flat=True)) == {"seed-0", "seed-1", "seed-2", "seed-3"}
+    assert Thought.objects.filter(created_at__lt=date(2024, 1, 1)).count() == 0
+    assert Thought.objects.filter(created_at__gt=date(2024, 1, 31)).count() == 0
+    assert UserObjectPermission.objects.count() == 12
+    for permission in UserObjectPermission.objects.all():
+        assert Thought.objects.get(id=permission.object_pk).owner_id != permission.user_id
+
+    # And - The rollups are what refreshing them from the thoughts gives
+    for daily_mood in DailyMood.objects.all():
+        refreshed = DailyMood.objects.refresh(daily_mood.owner_id, daily_mood.date)
+        assert (daily_mood.count, daily_mood.mood_sum, daily_mood.histogram, daily_mood.tag_counts) == (
+            refreshed.count,
+            refreshed.mood_sum,
+            refreshed.histogram,
+            refreshed.tag_counts,
+        )
+
+
+@pytest.mark.django_db
+def test_seed_is_deterministic():
+    """The same seed gives the same data."""
+
+    # Given - Data seeded once
+    seeder = Seeder(date(2024, 1, 1), date(2024, 12, 31), seed=1)
+    seeder.seed(users=2, thoughts=30, tags=4)
+    first = seeded_data()
+
+    # When - It's seeded again with the same seed, after a fresh start
+    get_user_model().objects.all().delete()
+    Seeder(date(2024, 1, 1), date(2024, 12, 31), seed=1).seed(users=2, thoughts=30, tags=4)
+
+    # Then - It's the same data
+    assert seeded_data() == first
+
+
+@pytest.mark.django_db
+def test_seed_keeps_timestamps():
+    """Seeded thoughts keep the update times generated for them, without changing how other saves set them."""
+
+    # When - Thoughts are seeded in the past
+    Seeder(date(2024, 1, 1), date(2024, 1, 31)).seed(users=1, thoughts=20, tags=2)
+
+    # Then - Each was last updated on the day it was made
+    for created_at, updated_at in Thought.objects.values_list("created_at", "updated_at"):
+        assert updated_at.date() == created_at
+
+    # And - Thoughts saved afterwards are still timestamped when they're saved
+    assert Thought._meta.get_field("updated_at").auto_now
+    assert Thought._meta.get_field("created_at").auto_now_add
+
+
+@pytest.mark.django_db
+def test_seed_mood_distribution():
+    """Moods are drawn by their weights."""
+
+    # When - Users are seeded with only moods 2 and 4
+    call_command("seed", users=1, thoughts=100, moods="0,1,0,1,0", stdout=StringIO())
+
+    # Then - Those are the only moods
+    assert set(Thought.objects.values_list("mood", flat=True)) == {2, 4}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("moods", ["1,2,3", "1,a,1,1,1", "0,0,0,0,0", "-1,1,1,1,1"])
+def test_seed_rejects_invalid_moods(moods):
+    """The mood weights must be five non-negative numbers."""
+
+    # When/Then - Seeding with invalid weights fails
+    with pytest.raises(CommandError):
+        call_command("seed", users=1, moods=moods, stdout=StringIO())
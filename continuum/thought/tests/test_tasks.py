@@ -0,0 +1,542 @@
+import asyncio
+import httpx
+import json
+import pytest
+from io import StringIO
+from openai import RateLimitError
+from unittest.mock import AsyncMock, Mock
+from django.core.cache import cache
+from django.core.management import call_command
+from continuum.cache import get_cache_stats
+from thought.models import Thought
+from thought.llm import LLMClient, TokenBucket, llm
+from thought.tasks import (
+    analyse_thought,
+    analyse_thoughts,
+    extract_actions,
+    extract_mood,
+    schedule_analysis,
+)
+from thought.tests.factories import ThoughtFactory
+
+
+@pytest.fixture
+def completion(mocker, settings):
+    """Analyse with OpenAI, and make the client answer every completion with the given content."""
+
+    settings.ANALYSIS_BACKEND = "thought.backends.OpenAIBackend"
+
+    def completion(content):
+        create = AsyncMock(return_value=Mock(choices=[Mock(message=Mock(content=content))]))
+        mocker.patch.object(LLMClient, "client", Mock(chat=Mock(completions=Mock(create=create))))
+        return create
+
+    return completion
+
+
+@pytest.fixture
+def batch_completion(mocker, settings):
+    """Analyse with OpenAI, and make the client answer batch completions from a dict of analyses by text."""
+
+    settings.ANALYSIS_BACKEND = "thought.backends.OpenAIBackend"
+
+    def batch_completion(analyses):
+        def create(messages, **kwargs):
+            texts = json.loads(messages[1]["content"])["texts"]
+            results = [
+                {"id": text["id"], "mood": analyses[text["text"]][0], "actions": analyses[text["text"]][1]}
+                for text in texts
+                if text["text"] in analyses
+            ]
+            return Mock(choices=[Mock(message=Mock(content=json.dumps({"results": results})))])
+
+        create = AsyncMock(side_effect=create)
+        mocker.patch.object(LLMClient, "client", Mock(chat=Mock(completions=Mock(create=create))))
+        return create
+
+    return batch_completion
+
+
+@pytest.mark.django_db
+def test_analyse_thought(completion):
+    """analyse_thought sets the mood and actions on the thought from a single completion."""
+
+    # Given - A thought.
+    thought = ThoughtFactory(content="Fantastic day! Need to buy milk; and call mum.")
+
+    # And - The model finds it happy with two actions.
+    create = completion('{"mood": 4, "actions": ["Buy milk;", "Call mum"]}')
+
+    # When - the analyse_thought task is called
+    analyse_thought(thought_id=thought.id)
+
+    # Then - the mood and actions are saved from one request for JSON
+    thought.refresh_from_db()
+    assert thought.mood == 4
+    assert thought.actions == "Buy milk;Call mum"
+    assert create.call_count == 1
+    assert create.call_args.kwargs["response_format"] == {"type": "json_object"}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ("content", "mood", "actions"),
+    [
+        ("the user is happy", None, ""),
+        ('{"mood": 9, "actions": ["Buy milk"]}', None, "Buy milk"),
+        ('{"mood": 2, "actions": "Buy milk"}', 2, ""),
+        ('[{"mood": 2}]', None, ""),
+    ],
+)
+def test_analyse_thought_bad(completion, content, mood, actions):
+    """analyse_thought only keeps the parts of the response that are valid."""
+
+    # Given - A thought.
+    thought = ThoughtFactory(content="The weather is sunny.")
+
+    # And - The response from the model is not entirely valid.
+    completion(content)
+
+    # When - the analyse_thought task is called
+    analyse_thought(thought_id=thought.id)
+
+    # Then - the invalid parts are cleared
+    thought.refresh_from_db()
+    assert thought.mood == mood
+    assert thought.actions == actions
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("task", [extract_mood, extract_actions])
+def test_legacy_tasks_analyse_thought(completion, task):
+    """The old per-field tasks run the combined analysis."""
+
+    # Given - A thought.
+    thought = ThoughtFactory(content="Quick note to self, need to grab more butter.")
+    create = completion('{"mood": 3, "actions": ["Grab more butter"]}')
+
+    # When - an old task is called
+    task(thought_id=thought.id)
+
+    # Then - both fields are set from a single completion
+    thought.refresh_from_db()
+    assert (thought.mood, thought.actions) == (3, "Grab more butter")
+    assert create.call_count == 1
+
+
+@pytest.mark.django_db
+def test_analyse_unchanged_thought(completion):
+    """A thought whose content hasn't changed since it was analysed isn't analysed again."""
+
+    # Given - A thought that has been analysed
+    thought = ThoughtFactory(content="Tired.")
+    create = completion('{"mood": 2, "actions": []}')
+    analyse_thought(thought_id=thought.id)
+
+    # When - It is analysed again, and then again after an edit
+    analyse_thought(thought_id=thought.id)
+    thought.content = "Tired, but the run was good."
+    thought.save()
+    analyse_thought(thought_id=thought.id)
+
+    # Then - Only the edit required another completion
+    assert create.call_count == 2
+
+
+@pytest.mark.django_db
+def test_analyse_identical_content(completion):
+    """Thoughts with the same content, give or take case and whitespace, share one completion."""
+
+    # Given - Two thoughts that only differ in case and whitespace
+    first = ThoughtFactory(content="Good day")
+    second = ThoughtFactory(content="  good   DAY ")
+    create = completion('{"mood": 4, "actions": []}')
+
+    # When - Both are analysed
+    analyse_thought(thought_id=first.id)
+    analyse_thought(thought_id=second.id)
+
+    # Then - The second reuses the first's analysis
+    second.refresh_from_db()
+    assert second.mood == 4
+    assert create.call_count == 1
+    assert get_cache_stats("analysis") == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+@pytest.mark.django_db
+def test_analyse_invalid_response_is_not_cached(completion):
+    """An invalid response is not reused for identical content."""
+
+    # Given - A thought the model fails to analyse
+    first = ThoughtFactory(content="Good day")
+    create = completion("the user is happy")
+    analyse_thought(thought_id=first.id)
+
+    # When - A thought with the same content is analysed
+    second = ThoughtFactory(content="Good day")
+    analyse_thought(thought_id=second.id)
+
+    # Then - The model is asked again
+    assert create.call_count == 2
+
+
+@pytest.mark.django_db
+def test_analyse_thoughts_in_batches(batch_completion, settings):
+    """analyse_thoughts packs several thoughts into each completion and saves them all."""
+
+    # Given - Three thoughts, two of them identical, and room for two texts per completion
+    settings.ANALYSIS_BATCH_SIZE = 2
+    thoughts = [ThoughtFactory(content=content) for content in ("Tired.", "Good day", "Tired.")]
+    create = batch_completion({"Tired.": (2, []), "Good day": (4, ["Buy milk"])})
+
+    # When - They are analysed in bulk
+    analyse_thoughts([thought.id for thought in thoughts])
+
+    # Then - The two distinct texts went in a single completion and every thought was updated
+    assert create.call_count == 1
+    for thought in thoughts:
+        thought.refresh_from_db()
+    assert [(thought.mood, thought.actions) for thought in thoughts] == [(2, ""), (4, "Buy milk"), (2, "")]
+
+
+@pytest.mark.django_db
+def test_analyse_thoughts_missing_results(batch_completion):
+    """Thoughts missing from the batch response are analysed by the fallback and left to be analysed again."""
+
+    # Given - Two thoughts, the model only answers for the first
+    thoughts = [ThoughtFactory(content="Tired."), ThoughtFactory(content="Good day")]
+    batch_completion({"Tired.": (2, [])})
+
+    # When - They are analysed in bulk
+    analyse_thoughts([thought.id for thought in thoughts])
+
+    # Then - The second is analysed locally, and only the first is marked as analysed
+    for thought in thoughts:
+        thought.refresh_from_db()
+    assert [thought.mood for thought in thoughts] == [2, 4]
+    assert thoughts[0].analysis_hash
+    assert not thoughts[1].analysis_hash
+
+
+@pytest.mark.django_db
+def test_analyse_thoughts_missing_results_without_fallback(batch_completion, settings):
+    """Without a fallback, analysed thoughts missing from the batch response keep their earlier analysis."""
+
+    # Given - A thought analysed before its content was edited, and a model that only answers for another thought
+    settings.ANALYSIS_FALLBACK_BACKEND = ""
+    thought = ThoughtFactory(content="Edited.", mood=4, actions="Call mum", analysis_hash="old")
+    other = ThoughtFactory(content="Tired.")
+    updated_at = Thought.objects.get(id=thought.id).updated_at
+    batch_completion({"Tired.": (2, [])})
+
+    # When - They are analysed in bulk
+    analyse_thoughts([thought.id, other.id])
+
+    # Then - The thought left out of the response is left as it was
+    thought = Thought.objects.get(id=thought.id)
+    assert (thought.mood, thought.actions, thought.analysis_hash) == (4, "Call mum", "old")
+    assert thought.updated_at == updated_at
+    assert Thought.objects.get(id=other.id).mood == 2
+
+
+@pytest.mark.django_db
+def test_analyse_command(batch_completion):
+    """The analyse command backfills the thoughts without a mood, and those the fallback backend analysed."""
+
+    # Given - An analysed thought, two without a mood, and one with the fallback's mood
+    ThoughtFactory(content="Already analysed", mood=5, analysis_hash="analysed")
+    pending = [
+        ThoughtFactory(content="Tired."),
+        ThoughtFactory(content="Good day"),
+        ThoughtFactory(content="Fell back", mood=3, analysis_hash=""),
+    ]
+    create = batch_completion({"Tired.": (2, []), "Good day": (4, []), "Fell back": (1, [])})
+
+    # When - The command runs in process
+    call_command("analyse", "--concurrency", "1", stdout=StringIO())
+
+    # Then - Only the thoughts without a successful analysis were sent, in one completion
+    assert create.call_count == 1
+    assert "Already analysed" not in create.call_args.kwargs["messages"][1]["content"]
+    assert [Thought.objects.get(id=thought.id).mood for thought in pending] == [2, 4, 1]
+
+
+@pytest.mark.django_db
+def test_schedule_analysis_coalesces_saves(mocker, settings, django_capture_on_commit_callbacks):
+    """Analysis is scheduled once per window however many times a thought is saved."""
+
+    # Given - A thought, and a window of a minute
+    settings.ANALYSIS_DEBOUNCE = 60
+    thought = ThoughtFactory(content="Tired.")
+    apply_async = mocker.patch("thought.tasks.analyse_thought.apply_async")
+
+    # When - It is saved five times
+    with django_capture_on_commit_callbacks(execute=True):
+        for _ in range(5):
+            schedule_analysis(thought.id)
+
+    # Then - One analysis is scheduled for the end of the window
+    apply_async.assert_called_once_with((str(thought.id),), countdown=60)
+
+    # When - The analysis starts, and the thought is saved again
+    analyse_thought(thought.id)
+    with django_capture_on_commit_callbacks(execute=True):
+        schedule_analysis(thought.id)
+
+    # Then - Another analysis is scheduled
+    assert apply_async.call_count == 2
+
+
+@pytest.mark.django_db
+def test_schedule_analysis_outlives_countdown(mocker, settings, django_capture_on_commit_callbacks):
+    """The scheduled analysis is remembered past its countdown, so a backed up queue doesn't get duplicates."""
+
+    # Given - A thought, a window of a minute and ten minutes' grace for the queue
+    settings.ANALYSIS_DEBOUNCE = 60
+    settings.ANALYSIS_QUEUE_GRACE = 600
+    thought = ThoughtFactory(content="Tired.")
+    mocker.patch("thought.tasks.analyse_thought.apply_async")
+    add = mocker.spy(cache, "add")
+
+    # When - Its analysis is scheduled
+    with django_capture_on_commit_callbacks(execute=True):
+        schedule_analysis(thought.id)
+
+    # Then - It's remembered for the window and the grace together
+    assert add.call_args.kwargs["timeout"] == 660
+
+
+@pytest.mark.django_db
+def test_schedule_analysis_waits_for_commit(mocker, django_capture_on_commit_callbacks):
+    """Analysis is only scheduled if the transaction saving the thought commits."""
+
+    # Given - A thought
+    thought = ThoughtFactory(content="Tired.")
+    apply_async = mocker.patch("thought.tasks.analyse_thought.apply_async")
+
+    # When - Its analysis is scheduled, but the transaction is not committed
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        schedule_analysis(thought.id)
+
+    # Then - Nothing is scheduled yet
+    assert len(callbacks) == 1
+    apply_async.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_analyse_thought_drops_stale_analysis(mocker):
+    """An analysis of content that was edited while it ran is dropped, and other edits are kept."""
+
+    # Given - A thought that is edited while it's analysed
+    thought = ThoughtFactory(content="Tired.")
+
+    def analyse(content):
+        Thought.objects.filter(id=thought.id).update(content="Great day!", mood=None)
+        return (2, "")
+
+    mocker.patch("thought.backends.LocalBackend.analyse", side_effect=analyse)
+
+    # When - The analysis finishes
+    analyse_thought(thought.id)
+
+    # Then - The edit is kept and the analysis of the old content is not saved
+    thought.refresh_from_db()
+    assert thought.content == "Great day!"
+    assert thought.mood is None
+    assert not thought.analysis_hash
+
+
+@pytest.mark.django_db
+def test_analyse_thoughts_drops_stale_analyses(mocker):
+    """Analyses in bulk of content that was edited while they ran are dropped, and the edits are kept."""
+
+    # Given - Two thoughts, one of which is edited and analysed again while they're analysed in bulk
+    edited, other = ThoughtFactory(content="Tired."), ThoughtFactory(content="Sad.")
+
+    def analyse_many(contents):
+        Thought.objects.filter(id=edited.id).update(content="Great day!", mood=5, analysis_hash="new")
+        return [(2, "") for _ in contents]
+
+    mocker.patch("thought.backends.LocalBackend.analyse_many", side_effect=analyse_many)
+
+    # When - The bulk analysis finishes
+    analyse_thoughts([edited.id, other.id])
+
+    # Then - The edit and its analysis are kept, and the other thought is saved
+    edited.refresh_from_db()
+    assert (edited.content, edited.mood, edited.analysis_hash) == ("Great day!", 5, "new")
+    assert Thought.objects.get(id=other.id).mood == 2
+
+
+@pytest.mark.django_db
+def test_analyse_deleted_thought():
+    """Analysis scheduled for a thought that has since been deleted does nothing."""
+
+    # Given - A thought that is deleted
+    thought = ThoughtFactory(content="Tired.")
+    thought_id = thought.id
+    thought.delete()
+
+    # When - It is analysed
+    analyse_thought(thought_id)
+
+    # Then - Nothing is saved
+    assert not Thought.objects.filter(id=thought_id).exists()
+
+
+def rate_limit_error():
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+
+@pytest.mark.django_db
+def test_analyse_thought_retries_rate_limits(completion, settings):
+    """Completions that are rate limited are retried after a backoff."""
+
+    # Given - A thought, and a model that is rate limited on the first attempt
+    settings.LLM_BACKOFF_BASE = 0.01
+    thought = ThoughtFactory(content="Tired.")
+    create = completion('{"mood": 2, "actions": []}')
+    create.side_effect = [rate_limit_error(), create.return_value]
+
+    # When - the analyse_thought task is called
+    analyse_thought(thought_id=thought.id)
+
+    # Then - The second attempt succeeded
+    thought.refresh_from_db()
+    assert create.call_count == 2
+    assert thought.mood == 2
+
+
+@pytest.mark.django_db
+def test_analyse_thoughts_failed_batch(batch_completion, settings):
+    """A batch that keeps failing doesn't stop the others from being saved."""
+
+    # Given - Two thoughts in separate batches, and a model that is always rate limited on one of them
+    settings.ANALYSIS_BATCH_SIZE = 1
+    settings.LLM_MAX_RETRIES = 1
+    settings.LLM_BACKOFF_BASE = 0.01
+    thoughts = [ThoughtFactory(content="Tired."), ThoughtFactory(content="Good day")]
+    create = batch_completion({"Tired.": (2, [])})
+    answer = create.side_effect
+
+    def create_or_fail(messages, **kwargs):
+        if "Good day" in messages[1]["content"]:
+            raise rate_limit_error()
+        return answer(messages, **kwargs)
+
+    create.side_effect = create_or_fail
+
+    # When - They are analysed in bulk
+    analyse_thoughts([thought.id for thought in thoughts])
+
+    # Then - The failing batch was tried twice, then analysed locally and left to be analysed again
+    for thought in thoughts:
+        thought.refresh_from_db()
+    assert create.call_count == 3
+    assert [thought.mood for thought in thoughts] == [2, 4]
+    assert thoughts[0].analysis_hash
+    assert not thoughts[1].analysis_hash
+
+
+@pytest.mark.django_db
+def test_analyse_thoughts_failed_without_fallback(batch_completion, settings):
+    """Without a fallback, thoughts the backend fails on keep their earlier analysis."""
+
+    # Given - An analysed thought that has since been edited, and a model that is always rate limited
+    settings.LLM_MAX_RETRIES = 0
+    settings.ANALYSIS_FALLBACK_BACKEND = ""
+    thought = ThoughtFactory(content="Edited.", mood=4, actions="Buy milk", analysis_hash="old")
+    updated_at = Thought.objects.get(id=thought.id).updated_at
+    create = batch_completion({})
+    create.side_effect = rate_limit_error()
+
+    # When - It's analysed in bulk
+    analyse_thoughts([thought.id])
+
+    # Then - It's left as it was
+    thought = Thought.objects.get(id=thought.id)
+    assert (thought.mood, thought.actions, thought.analysis_hash) == (4, "Buy milk", "old")
+    assert thought.updated_at == updated_at
+
+
+@pytest.mark.django_db
+def test_analyse_thoughts_unchanged_analysis(batch_completion):
+    """Thoughts whose analysis comes out the same are marked as analysed without being touched."""
+
+    # Given - A thought that already has the analysis the model will give, but isn't marked as analysed
+    thought = ThoughtFactory(content="Tired.", mood=2, actions="")
+    updated_at = Thought.objects.get(id=thought.id).updated_at
+    batch_completion({"Tired.": (2, [])})
+
+    # When - It's analysed in bulk
+    analyse_thoughts([thought.id])
+
+    # Then - It's marked as analysed, but its modification time is unchanged
+    thought = Thought.objects.get(id=thought.id)
+    assert thought.analysis_hash
+    assert thought.updated_at == updated_at
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(("fallback", "mood"), [("thought.backends.LocalBackend", 1), ("", None)])
+def test_analyse_thought_fallback(completion, settings, fallback, mood):
+    """When OpenAI keeps failing the fallback backend's analysis is saved, but the thought isn't marked as analysed."""
+
+    # Given - A thought, and a model that is always rate limited
+    settings.LLM_MAX_RETRIES = 0
+    settings.ANALYSIS_FALLBACK_BACKEND = fallback
+    thought = ThoughtFactory(content="What an awful, terrible day. Need to call the bank.")
+    create = completion("")
+    create.side_effect = rate_limit_error()
+
+    # When - the analyse_thought task is called
+    if fallback:
+        analyse_thought(thought_id=thought.id)
+    else:
+        with pytest.raises(RateLimitError):
+            analyse_thought(thought_id=thought.id)
+
+    # Then - The local analysis is saved, to be replaced next time
+    thought.refresh_from_db()
+    assert thought.mood == mood
+    assert not thought.analysis_hash
+
+
+def test_token_bucket():
+    """The token bucket allows a burst of calls, then asks for a wait until it refills."""
+
+    # Given - A bucket of one call per second with bursts of two
+    bucket = TokenBucket("test", rate=1, capacity=2)
+
+    # When - Three calls are made at once
+    waits = [bucket.take() for _ in range(3)]
+
+    # Then - The third must wait for about a second
+    assert waits[:2] == [0, 0]
+    assert 0.9 < waits[2] <= 1
+
+
+def test_backoff_releases_concurrency(mocker, settings):
+    """A completion waiting to retry doesn't hold up the others while it backs off."""
+
+    # Given - One completion in flight at a time, and a model that rate limits the first call
+    settings.LLM_BACKOFF_BASE = 0.2
+    mocker.patch.object(llm, "_semaphore", asyncio.Semaphore(1))
+    mocker.patch("thought.llm.random.uniform", side_effect=lambda low, high: high)
+    calls = []
+
+    async def create(messages, **kwargs):
+        calls.append(messages[0]["content"])
+        if len(calls) == 1:
+            raise rate_limit_error()
+        return Mock(choices=[Mock(message=Mock(content=messages[0]["content"]))])
+
+    mocker.patch.object(LLMClient, "client", Mock(chat=Mock(completions=Mock(create=create))))
+
+    # When - Two completions are made together
+    results = llm.complete_many([[{"role": "user", "content": "first"}], [{"role": "user", "content": "second"}]])
+
+    # Then - The second was made while the first backed off, and both succeeded
+    assert calls == ["first", "second", "first"]
+    assert results == ["first", "second"]
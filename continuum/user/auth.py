@@ -1,13 +1,130 @@
-import requests
+from copy import copy
+from logging import getLogger
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError
+from jwt import PyJWKClient
 from rest_framework import authentication
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.state import token_backend
+
+from continuum.cache import LocalLRUCache
+
+from .tasks import fetch_user_info
 
 
+logger = getLogger(__name__)
+
 User = get_user_model()
 
+# Cache the signing keys by key id, and the key set itself for JWKS_CACHE_TTL, instead of PyJWT's default of
+# refetching the key set every five minutes.
+if jwk_url := settings.SIMPLE_JWT.get("JWK_URL"):
+    token_backend.jwks_client = PyJWKClient(
+        jwk_url, cache_keys=True, lifespan=settings.JWKS_CACHE_TTL, timeout=settings.AUTH0_TIMEOUT
+    )
+
+# Users are looked up on every request, so they're kept in process as well as in Redis.
+local_user_cache = LocalLRUCache(maxsize=1024, ttl=settings.AUTH_USER_CACHE_TTL)
+
+
+def user_cache_key(sub):
+    return f"auth:user:{sub}"
+
+
+def forget_user(sub):
+    """Drop a user from the caches, so the next request reads it from the database."""
+
+    key = user_cache_key(sub)
+    local_user_cache.delete(key)
+    cache.delete(key)
+
+
+def get_user_for_sub(sub):
+    """Return the user for an Auth0 `sub` and whether it was just created, using the caches where possible."""
+
+    key = user_cache_key(sub)
+    user = local_user_cache.get(key)
+    if user is None:
+        user = cache.get(key)
+        if user is not None:
+            local_user_cache.set(key, user)
+
+    if user is not None:
+        return copy(user), False
+
+    try:
+        # The username is unique, so use the sub until the user's email has been fetched.
+        user, created = User.objects.get_or_create(sub=sub, defaults={"username": sub})
+    except IntegrityError:
+        user, created = User.objects.get(sub=sub), False
+
+    cache.set(key, user, timeout=settings.AUTH_USER_CACHE_TTL)
+    local_user_cache.set(key, user)
+    return copy(user), created
+
+
+async def aget_user_for_sub(sub):
+    """`get_user_for_sub` for async views."""
+
+    key = user_cache_key(sub)
+    user = local_user_cache.get(key)
+    if user is None:
+        user = await cache.aget(key)
+        if user is not None:
+            local_user_cache.set(key, user)
+
+    if user is not None:
+        return copy(user), False
+
+    try:
+        user, created = await User.objects.aget_or_create(sub=sub, defaults={"username": sub})
+    except IntegrityError:
+        user, created = await User.objects.aget(sub=sub), False
+
+    await cache.aset(key, user, timeout=settings.AUTH_USER_CACHE_TTL)
+    local_user_cache.set(key, user)
+    return copy(user), created
+
+
+def user_info_key(sub):
+    return f"auth:userinfo:{sub}"
+
+
+def wants_user_info(user, created):
+    """Whether to queue fetching a user's details: when they're new, or while their email is still missing.
+
+    The fetch is queued again at most every USER_INFO_RETRY_SECONDS, and only by one of the user's concurrent requests.
+
+    """
+
+    if user.email and not created:
+        return False
+    # Claimed on creation too, so a failed first fetch isn't retried by the user's next request.
+    claimed = cache.add(user_info_key(user.sub), True, timeout=settings.USER_INFO_RETRY_SECONDS)
+    return created or claimed
+
+
+async def awants_user_info(user, created):
+    """`wants_user_info` for async views."""
+
+    if user.email and not created:
+        return False
+    claimed = await cache.aadd(user_info_key(user.sub), True, timeout=settings.USER_INFO_RETRY_SECONDS)
+    return created or claimed
+
+
+def update_user_info(user, user_info):
+    if email := user_info.get("email"):
+        user.username = email
+        user.email = email
+        user.save(update_fields=["username", "email"])
+        forget_user(user.sub)
+        user.onboard()
+
 
 class Auth0Authentication(authentication.BaseAuthentication):
     def authenticate(self, request):
@@ -21,16 +138,30 @@ class Auth0Authentication(authentication.BaseAuthentication):
         validated_token = jwt_authenticator.get_validated_token(raw_token)
         payload = validated_token.payload
 
-        user, created = User.objects.get_or_create(sub=payload.get("sub"))
+        user, created = get_user_for_sub(payload.get("sub"))
+
+        if wants_user_info(user, created):
+            fetch_user_info.delay(user.pk)
+
+        return (user, validated_token)
+
+    async def aauthenticate(self, request):
+        """`authenticate` for async views."""
+
+        jwt_authenticator = JWTAuthentication()
+        header = jwt_authenticator.get_header(request)
+
+        if header is None:
+            return None
+
+        raw_token = jwt_authenticator.get_raw_token(header)
+        # In a thread, as validating fetches the signing keys when they aren't cached.
+        validated_token = await sync_to_async(jwt_authenticator.get_validated_token, thread_sensitive=False)(raw_token)
+        payload = validated_token.payload
 
-        if created:
-            endpoint = settings.SIMPLE_JWT.get("USER_INFO_ENDPOINT", None)
-            user_info = requests.get(endpoint, headers={"Authorization": header}).json()
+        user, created = await aget_user_for_sub(payload.get("sub"))
 
-            if email := user_info.get("email"):
-                user.username = email
-                user.email = email
-                user.save()
-                user.onboard()
+        if await awants_user_info(user, created):
+            await sync_to_async(fetch_user_info.delay)(user.pk)
 
         return (user, validated_token)
@@ -0,0 +1,24 @@
+class OwnerPermissionBackend:
+    """Grant every object permission on an object to the user that owns it.
+
+    Owned objects no longer get per-object guardian rows, so this keeps `user.has_perm(perm, obj)` working for
+    owners. Guardian's `ObjectPermissionBackend` is still consulted for objects shared with other users.
+
+    """
+
+    def authenticate(self, request, **credentials):
+        return None
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if obj is None or not user_obj.is_active:
+            return False
+
+        owner_id = getattr(obj, "owner_id", None)
+        if owner_id is None or owner_id != user_obj.pk:
+            return False
+
+        app_label, _, codename = perm.rpartition(".")
+        if app_label and app_label != obj._meta.app_label:
+            return False
+
+        return codename in {f"{action}_{obj._meta.model_name}" for action in obj._meta.default_permissions}
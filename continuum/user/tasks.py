@@ -0,0 +1,66 @@
+import time
+from logging import getLogger
+from urllib.parse import quote
+
+import requests
+from celery import shared_task
+from django.conf import settings
+
+logger = getLogger(__name__)
+
+# The Management API token and when it expires, by `time.monotonic`. Kept in process rather than in Redis, as it
+# grants far more than any one user's token.
+management_token = {"token": None, "expires_at": 0.0}  # noqa: S105 - No token yet.
+
+
+def get_management_token():
+    """An Auth0 Management API token from the client credentials grant, fetched again shortly before it expires."""
+
+    if management_token["token"] is None or time.monotonic() >= management_token["expires_at"]:
+        response = requests.post(
+            settings.AUTH0_TOKEN_ENDPOINT,
+            json={
+                "grant_type": "client_credentials",
+                "client_id": settings.AUTH0_MANAGEMENT_CLIENT_ID,
+                "client_secret": settings.AUTH0_MANAGEMENT_CLIENT_SECRET,
+                "audience": settings.AUTH0_MANAGEMENT_API,
+            },
+            timeout=settings.AUTH0_TIMEOUT,
+        )
+        response.raise_for_status()
+        data = response.json()
+        management_token["token"] = data["access_token"]
+        management_token["expires_at"] = time.monotonic() + data.get("expires_in", 0) - 60
+    return management_token["token"]
+
+
+@shared_task(autoretry_for=(requests.ConnectionError, requests.Timeout), retry_backoff=True, max_retries=5)
+def fetch_user_info(user_id):
+    """Fill in a new user's details from the Auth0 Management API and onboard them.
+
+    The user is looked up by their sub with the server's own credentials, so no user's token goes through the broker.
+
+    """
+
+    from .auth import update_user_info  # Import here to avoid circular imports
+    from .models import User
+
+    if not settings.AUTH0_MANAGEMENT_CLIENT_ID:
+        logger.warning(f"Not fetching user info for user {user_id}, AUTH0_MANAGEMENT_CLIENT_ID isn't set")
+        return
+
+    user = User.objects.filter(id=user_id).first()
+    if user is None or user.email:
+        return
+
+    endpoint = f"{settings.AUTH0_MANAGEMENT_API}users/{quote(user.sub, safe='')}"
+    response = requests.get(
+        endpoint, headers={"Authorization": f"Bearer {get_management_token()}"}, timeout=settings.AUTH0_TIMEOUT
+    )
+    if response.status_code == 401:
+        # Revoked or rotated early, fetch another for the next attempt.
+        management_token["token"] = None
+    response.raise_for_status()
+    update_user_info(user, response.json())
+
+    logger.info(f"Fetched user info for user {user_id}")
@@ -0,0 +1,181 @@
+import pytest
+import requests
+from unittest.mock import Mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from urllib.parse import unquote
+from user.auth import get_user_for_sub, user_info_key
+from user.tasks import fetch_user_info, management_token
+
+User = get_user_model()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def token_for(mocker):
+    """Accept any bearer token as a valid token for the given sub."""
+
+    def token_for(sub):
+        mocker.patch.object(JWTAuthentication, "get_validated_token", return_value=Mock(payload={"sub": sub}))
+        return {"HTTP_AUTHORIZATION": "Bearer token"}
+
+    return token_for
+
+
+@pytest.mark.django_db
+def test_user_is_cached(django_assert_num_queries):
+    """Looking up a known user again does not hit the database."""
+
+    # Given - A user that has been looked up once
+    existing = User.objects.create_user(username="user", password="password", sub="auth0|user")
+    user, created = get_user_for_sub("auth0|user")
+    assert user == existing
+    assert not created
+
+    # When - The user is looked up again
+    with django_assert_num_queries(0):
+        user, created = get_user_for_sub("auth0|user")
+
+    # Then - The same user is returned
+    assert user == existing
+    assert not created
+
+
+@pytest.fixture
+def auth0(mocker, settings):
+    """Give the server Management API credentials, and answer its token and user lookups from a dict of users by sub."""
+
+    settings.AUTH0_MANAGEMENT_CLIENT_ID = "client"
+    settings.AUTH0_MANAGEMENT_CLIENT_SECRET = "secret"  # noqa: S105 - A test secret.
+    mocker.patch.dict(management_token, {"token": None, "expires_at": 0.0})  # noqa: S105 - No token yet.
+    token = mocker.patch("user.tasks.requests.post")
+    # A test token.
+    token.return_value.json.return_value = {"access_token": "management", "expires_in": 86400}  # noqa: S105
+
+    def auth0(users):
+        def get(url, headers, timeout):
+            response = Mock(status_code=200)
+            response.json.return_value = users[unquote(url.rsplit("/", 1)[1])]
+            return response
+
+        return mocker.patch("user.tasks.requests.get", side_effect=get)
+
+    return auth0
+
+
+@pytest.mark.django_db
+def test_new_user_is_filled_in_from_auth0(api_client, token_for, auth0, mocker):
+    """A user seen for the first time is created, and their email fetched by a task that isn't given their token."""
+
+    # Given - A token for a user that does not exist yet
+    headers = token_for("auth0|new")
+    lookup = auth0({"auth0|new": {"email": "new@example.com"}})
+    delay = mocker.spy(fetch_user_info, "delay")
+
+    # When - They make a request
+    response = api_client.get(reverse("tag-list"), **headers)
+
+    # Then - The request succeeds and the user is filled in with the email from Auth0
+    assert response.status_code == status.HTTP_200_OK
+    user = User.objects.get(sub="auth0|new")
+    assert user.email == "new@example.com"
+    assert user.username == "new@example.com"
+
+    # And - The task was only given the user's id, and looked them up with the server's own token
+    delay.assert_called_once_with(user.pk)
+    assert lookup.call_args.kwargs["headers"] == {"Authorization": "Bearer management"}
+    assert lookup.call_args.kwargs["timeout"]
+
+    # And - The next request uses the updated user without queueing the task again
+    response = api_client.get(reverse("tag-list"), **headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert delay.call_count == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("_async_views")
+def test_new_user_is_filled_in_from_auth0_async(api_client, token_for, auth0, mocker):
+    """With the async views, a new user's email is fetched by the same task."""
+
+    # Given - A token for a user that does not exist yet
+    headers = token_for("auth0|new")
+    auth0({"auth0|new": {"email": "new@example.com"}})
+    delay = mocker.spy(fetch_user_info, "delay")
+
+    # When - They make a request
+    response = api_client.get(reverse("tag-list"), **headers)
+
+    # Then - The request succeeds and the user is filled in with the email from Auth0
+    assert response.status_code == status.HTTP_200_OK
+    user = User.objects.get(sub="auth0|new")
+    assert user.email == "new@example.com"
+    delay.assert_called_once_with(user.pk)
+
+
+@pytest.mark.django_db
+def test_user_info_is_queued_again_while_missing(api_client, token_for, auth0, mocker):
+    """A fetch that fails doesn't fail the request, and is queued again by a later request."""
+
+    # Given - A token for a new user, and Auth0 unreachable
+    headers = token_for("auth0|new")
+    lookup = auth0({})
+    lookup.side_effect = requests.ConnectionError("Connection refused")
+    delay = mocker.patch.object(fetch_user_info, "delay")
+
+    # When - They make two requests
+    first = api_client.get(reverse("tag-list"), **headers)
+    second = api_client.get(reverse("tag-list"), **headers)
+
+    # Then - Both succeed, with the fetch queued once
+    assert (first.status_code, second.status_code) == (status.HTTP_200_OK, status.HTTP_200_OK)
+    assert delay.call_count == 1
+
+    # When - They make a request after the retry interval, and their email is still missing
+    cache.delete(user_info_key("auth0|new"))
+    api_client.get(reverse("tag-list"), **headers)
+
+    # Then - The fetch is queued again
+    assert delay.call_count == 2
+
+
+@pytest.mark.django_db
+def test_fetch_user_info_raises_when_auth0_is_down(auth0):
+    """Lookups that can't reach Auth0 raise, for Celery to retry them, and leave the user as they are."""
+
+    # Given - A new user, and Auth0 unreachable
+    user = User.objects.create_user(username="auth0|new", sub="auth0|new")
+    lookup = auth0({})
+    lookup.side_effect = requests.ConnectionError("Connection refused")
+
+    # When - The task runs
+    with pytest.raises(requests.ConnectionError):
+        fetch_user_info(user.pk)
+
+    # Then - The user is left to be filled in by the retry
+    assert fetch_user_info.autoretry_for == (requests.ConnectionError, requests.Timeout)
+    assert User.objects.get(id=user.pk).email == ""
+
+
+@pytest.mark.django_db
+def test_fetch_user_info_without_credentials(settings, mocker):
+    """Without Management API credentials, users aren't looked up."""
+
+    # Given - A new user, and no credentials
+    settings.AUTH0_MANAGEMENT_CLIENT_ID = ""
+    user = User.objects.create_user(username="auth0|new", sub="auth0|new")
+    get = mocker.patch("user.tasks.requests.get")
+
+    # When - The task runs
+    fetch_user_info(user.pk)
+
+    # Then - Auth0 isn't called
+    get.assert_not_called()